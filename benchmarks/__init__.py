@@ -0,0 +1,5 @@
+"""
+Offline performance benchmarks of the extraction, preprocessing and inference stages.
+
+Run `python -m benchmarks.run` from the repository root; see `benchmarks.run` for options.
+"""
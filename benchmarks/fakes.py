@@ -0,0 +1,169 @@
+import contextlib
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+
+class FakeEEException(Exception):
+    pass
+
+class FakeImage:
+    """Composite returned by `FakeImageCollection.median`, with an instant thumbnail URL."""
+
+    def __init__(self, ee, key):
+        self._ee = ee
+        self._key = key
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def clip(self, *args, **kwargs):
+        return self
+
+    def getThumbURL(self, params):
+        time.sleep(self._ee.latency)
+        return f"{self._ee.base_url}/thumb/{self._key}.png"
+
+class FakeNumber:
+    def __init__(self, ee, value):
+        self._ee = ee
+        self._value = value
+
+    def getInfo(self):
+        time.sleep(self._ee.latency)
+        return self._value
+
+class FakeImageCollection:
+    """Chainable stand-in for `ee.ImageCollection`; a fixed share of queries is empty."""
+
+    def __init__(self, ee, name, key=''):
+        self._ee = ee
+        self._name = name
+        self._key = key
+
+    def _with(self, *args):
+        return FakeImageCollection(self._ee, self._name, self._key + repr(args))
+
+    def filterBounds(self, geometry):
+        return self._with(geometry)
+
+    def filterDate(self, start, end):
+        return self._with(start, end)
+
+    def filterMetadata(self, *args):
+        return self
+
+    def map(self, fn):
+        return self
+
+    def size(self):
+        empty = zlib.crc32(self._key.encode()) % 100 < self._ee.empty_percent
+        return FakeNumber(self._ee, 0 if empty else 3)
+
+    def median(self):
+        return FakeImage(self._ee, zlib.crc32(self._key.encode()))
+
+class FakeGeometry:
+    @staticmethod
+    def Rectangle(coords):
+        return tuple(round(c, 6) for c in coords)
+
+class FakeEarthEngine:
+    """
+    Minimal stand-in for the `ee` module used by `lib.image_processor`.
+
+    Args:
+        base_url (str): Root of the thumbnail server returned in URLs.
+        latency (float): Seconds slept by each blocking Earth Engine call.
+        empty_percent (int): Percentage of queries answered with an empty collection.
+    """
+
+    EEException = FakeEEException
+    Geometry = FakeGeometry
+
+    def __init__(self, base_url, latency=0.02, empty_percent=10):
+        self.base_url = base_url
+        self.latency = latency
+        self.empty_percent = empty_percent
+
+    def ImageCollection(self, name):
+        return FakeImageCollection(self, name)
+
+def encode_png(image):
+    ok, buffer = cv2.imencode('.png', image)
+    return buffer.tobytes()
+
+@contextlib.contextmanager
+def serve_thumbnails(payload, latency=0.03):
+    """
+    Serve `payload` for every GET request from a local keep-alive HTTP server.
+
+    Args:
+        payload (bytes): Response body, e.g. a PNG thumbnail.
+        latency (float): Seconds slept before each response.
+
+    Yields:
+        str: Base URL of the server.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@contextlib.contextmanager
+def fake_earth_engine(payload, ee_latency=0.02, http_latency=0.03, empty_percent=10):
+    """
+    Replace Earth Engine and the thumbnail host with local fakes for `lib.image_processor`.
+
+    Args:
+        payload (bytes): Thumbnail returned for every download.
+        ee_latency (float): Seconds per blocking Earth Engine call.
+        http_latency (float): Seconds per thumbnail download.
+        empty_percent (int): Percentage of events without imagery.
+
+    Yields:
+        FakeEarthEngine: The installed fake.
+    """
+    import lib.image_processor as image_processor
+
+    with serve_thumbnails(payload, http_latency) as base_url:
+        fake = FakeEarthEngine(base_url, ee_latency, empty_percent)
+        original = image_processor.ee
+        image_processor.ee = fake
+        try:
+            yield fake
+        finally:
+            image_processor.ee = original
+
+def random_events(n, seed=0):
+    """FIRMS-like detections scattered over Azerbaijan during one summer."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'latitude': np.round(rng.uniform(38.4, 41.9, n), 5),
+        'longitude': np.round(rng.uniform(44.8, 50.4, n), 5),
+        'acq_date': pd.Timestamp('2023-06-01') + pd.to_timedelta(rng.integers(0, 92, n), unit='D'),
+    })
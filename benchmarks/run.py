@@ -0,0 +1,149 @@
+"""
+Run the offline benchmarks and save the results as JSON.
+
+Every (stage, parameters) combination runs in a fresh subprocess, so peak RSS is measured
+per stage and one stage's caches or thread pools do not affect the next. Earth Engine and
+the thumbnail host are replaced by local fakes (see `benchmarks.fakes`).
+
+Usage:
+    python -m benchmarks.run [--quick] [--stages apply_clahe_rgb predict_batch]
+                             [--output results.json] [--compare previous.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kibibytes, macOS bytes.
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+def summarize(stage, params, result, baseline_rss):
+    latencies = np.asarray(result.pop('latencies'), dtype=float) * 1000
+    items, seconds = result.pop('items'), result.pop('seconds')
+    result.setdefault('latency_unit', result['unit'])
+    return dict(
+        result,
+        stage=stage,
+        params=params,
+        items=items,
+        seconds=round(seconds, 4),
+        throughput=round(items / seconds, 3) if seconds > 0 else None,
+        p50_ms=round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+        p99_ms=round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+        peak_rss_mb=round(peak_rss_mb(), 1),
+        baseline_rss_mb=round(baseline_rss, 1),
+    )
+
+def run_child(stage, params, quick):
+    """Run one benchmark in this process and print its summary."""
+    from benchmarks.stages import stage_grid
+
+    fn, _ = stage_grid(quick)[stage]
+    baseline_rss = peak_rss_mb()
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(io.StringIO()):
+        result = fn(params, workdir)
+    print(RESULT_PREFIX + json.dumps(summarize(stage, params, result, baseline_rss)))
+
+def run_isolated(stage, params, quick, timeout):
+    """Run one benchmark in a subprocess and return its summary, or an error record."""
+    command = [sys.executable, '-m', 'benchmarks.run', '--child', stage, json.dumps(params)]
+    if quick:
+        command.append('--quick')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        proc = subprocess.run(command, cwd=root, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {'stage': stage, 'params': params, 'error': f'timeout after {timeout}s'}
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return {'stage': stage, 'params': params, 'error': proc.stderr.strip()[-2000:]}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def result_key(result):
+    return result['stage'], json.dumps(result['params'], sort_keys=True)
+
+def compare(results, previous_path):
+    """Print the throughput ratio of every benchmark against a previous results file."""
+    with open(previous_path) as f:
+        previous = {result_key(r): r for r in json.load(f)['results'] if 'error' not in r}
+    for result in results:
+        old = previous.get(result_key(result))
+        if 'error' in result or old is None or not old['throughput']:
+            continue
+        ratio = result['throughput'] / old['throughput']
+        print(f"{result['stage']:<22} {json.dumps(result['params'], sort_keys=True)}: "
+              f"{old['throughput']:.2f} -> {result['throughput']:.2f}/s ({ratio:.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the wildfire pipeline stages")
+    parser.add_argument('--stages', nargs='+', help="Stages to run. Defaults to all.")
+    parser.add_argument('--quick', action='store_true', help="Small sizes and counts.")
+    parser.add_argument('--output', help="Results file. Defaults to benchmarks/results/<time>.json.")
+    parser.add_argument('--compare', help="Previous results file to compare throughput against.")
+    parser.add_argument('--timeout', type=float, default=1800, help="Seconds per benchmark.")
+    parser.add_argument('--child', nargs=2, metavar=('STAGE', 'PARAMS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], json.loads(args.child[1]), args.quick)
+        return
+
+    from benchmarks.stages import stage_grid
+
+    grid = stage_grid(args.quick)
+    unknown = set(args.stages or ()) - set(grid)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    results = []
+    for stage in args.stages or grid:
+        for params in grid[stage][1]:
+            result = run_isolated(stage, params, args.quick, args.timeout)
+            results.append(result)
+            if 'error' in result:
+                print(f"{stage:<22} {json.dumps(params)}: FAILED\n{result['error']}")
+            else:
+                print(f"{stage:<22} {json.dumps(params)}: {result['throughput']:.2f} "
+                      f"{result['unit']}s/s, p50={result['p50_ms']} ms, p99={result['p99_ms']} ms, "
+                      f"peak RSS={result['peak_rss_mb']} MiB")
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                                         time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'quick': args.quick,
+            'results': results,
+        }, f, indent=2)
+    print(f"Results saved at: {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+import glob
+import importlib.util
+import os
+import time
+import cv2
+import numpy as np
+from benchmarks.fakes import encode_png, fake_earth_engine, random_events
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DIRS = ('data/processed', 'data/synthetic')
+
+def sample_images():
+    """Decode every sample image of the repository."""
+    paths = sorted(path for folder in SAMPLE_DIRS
+                   for pattern in ('*.png', '*.jpg', '*.jpeg')
+                   for path in glob.glob(os.path.join(REPO_ROOT, folder, '**', pattern),
+                                         recursive=True))
+    images = [cv2.imread(path) for path in paths]
+    return [image for image in images if image is not None]
+
+def make_tile(size, seed=0, cell=512):
+    """
+    Build a synthetic size x size scene as a mosaic of resized sample images.
+
+    Args:
+        size (int): Width and height in pixels.
+        seed (int): Selects which samples fill the mosaic.
+        cell (int): Size of each mosaic cell.
+
+    Returns:
+        numpy.ndarray: (size, size, 3) uint8 BGR image.
+    """
+    samples = sample_images()
+    rng = np.random.default_rng(seed)
+    cells = -(-size // cell)
+    tile = np.empty((cells * cell, cells * cell, 3), dtype=np.uint8)
+    for row in range(cells):
+        for col in range(cells):
+            sample = samples[rng.integers(len(samples))]
+            tile[row * cell:(row + 1) * cell, col * cell:(col + 1) * cell] = cv2.resize(
+                sample, (cell, cell), interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(tile[:size, :size])
+
+def write_image_folder(root, images, size):
+    """Write `images` synthetic tiles, split over 'fire' and 'no_fire', under `root`."""
+    for i in range(images):
+        category = 'fire' if i % 2 == 0 else 'no_fire'
+        os.makedirs(os.path.join(root, category), exist_ok=True)
+        cv2.imwrite(os.path.join(root, category, f"tile_{i:05d}.png"), make_tile(size, seed=i))
+    return root
+
+def timed(fn, latencies):
+    """Wrap `fn` so the duration of every call is appended to `latencies`."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+def bench_clahe(params, workdir):
+    from lib.image_preprocessor import apply_clahe_rgb
+
+    image = make_tile(params['size'])
+    latencies = []
+    run = timed(apply_clahe_rgb, latencies)
+    start = time.perf_counter()
+    for _ in range(params['repeats']):
+        run(image)
+    return {'items': params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image'}
+
+def bench_clahe_batch(params, workdir):
+    from lib.image_preprocessor import apply_clahe_batch
+
+    images = np.stack([make_tile(params['size'], seed=i) for i in range(params['images'])])
+    out = np.empty_like(images)
+    latencies = []
+    run = timed(apply_clahe_batch, latencies)
+    start = time.perf_counter()
+    for _ in range(params['repeats']):
+        run(images, out=out, num_workers=params['workers'])
+    return {'items': params['images'] * params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image', 'latency_unit': 'batch'}
+
+def bench_clahe_tiled(params, workdir):
+    from lib.image_preprocessor import apply_clahe_tiled
+
+    image = make_tile(params['size'])
+    latencies = []
+    run = timed(apply_clahe_tiled, latencies)
+    start = time.perf_counter()
+    for _ in range(params['repeats']):
+        run(image, block_size=params['block_size'])
+    return {'items': params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image'}
+
+def bench_split(params, workdir):
+    from lib.image_preprocessor import split_into_patches
+
+    image = make_tile(params['size'])
+    latencies = []
+    run = timed(lambda: np.ascontiguousarray(
+        split_into_patches(image, 256, stride=params['stride'], edge='shift')), latencies)
+    start = time.perf_counter()
+    patches = sum(len(run()) for _ in range(params['repeats']))
+    return {'items': params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image', 'patches': patches}
+
+def bench_preprocess(params, workdir):
+    from lib.image_preprocessor import preprocess_and_patch
+
+    input_dir = write_image_folder(os.path.join(workdir, 'input'), params['images'], params['size'])
+    latencies = []
+    run = timed(preprocess_and_patch, latencies)
+    start = time.perf_counter()
+    for i in range(params['repeats']):
+        run(input_dir, os.path.join(workdir, f"output_{i}"), incremental=False)
+    return {'items': params['images'] * params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image', 'latency_unit': 'run'}
+
+def bench_preprocess_store(params, workdir):
+    from lib.image_preprocessor import preprocess_to_store
+
+    input_dir = write_image_folder(os.path.join(workdir, 'input'), params['images'], params['size'])
+    latencies = []
+    run = timed(preprocess_to_store, latencies)
+    start = time.perf_counter()
+    for i in range(params['repeats']):
+        run(input_dir, os.path.join(workdir, f"store_{i}"), max_workers=params['workers'])
+    return {'items': params['images'] * params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image', 'latency_unit': 'run'}
+
+class TraceCollector:
+    """Instrumentation sink keeping every finished event trace."""
+
+    def __init__(self):
+        self.traces = []
+
+    def emit(self, trace):
+        self.traces.append(trace)
+
+    def flush(self, metrics):
+        pass
+
+    def close(self, metrics):
+        pass
+
+def _percentiles_ms(values):
+    values = np.asarray(values, dtype=float) * 1000
+    return {'p50': round(float(np.percentile(values, 50)), 3),
+            'p99': round(float(np.percentile(values, 99)), 3)}
+
+def bench_extract(params, workdir):
+    import lib.image_processor as image_processor
+    from lib.instrumentation import Instrumentation
+
+    events = random_events(params['events'])
+    payload = encode_png(make_tile(512))
+    # Both engines trace every event, so latencies are comparable between them.
+    collector = TraceCollector()
+    instrumentation = Instrumentation([collector], progress=False)
+    with fake_earth_engine(payload, params['ee_latency'], params['http_latency']):
+        start = time.perf_counter()
+        image_processor.process_event_batch(
+            events, os.path.join(workdir, 'images'), max_workers=params['workers'],
+            use_async=params.get('use_async', False), instrumentation=instrumentation)
+        seconds = time.perf_counter() - start
+    instrumentation.close()
+
+    stages = {}
+    for trace in collector.traces:
+        for name, value in trace.stages.items():
+            stages.setdefault(name, []).append(value)
+    return {'items': len(events), 'seconds': seconds,
+            'latencies': [trace.seconds for trace in collector.traces], 'unit': 'event',
+            'stage_ms': {name: _percentiles_ms(values) for name, values in sorted(stages.items())}}
+
+def _model(params):
+    """
+    Return (preprocess_image, predict_fn) for the benchmarked model.
+
+    'stub' averages the pixels, so decoding and batching dominate; 'mobilenet_v2' is an
+    untrained torchvision MobileNetV2 on CPU, for a realistic inference cost.
+    """
+    if params['model'] == 'stub':
+        def preprocess_image(path):
+            image = cv2.resize(cv2.imread(path), (224, 224), interpolation=cv2.INTER_AREA)
+            return image.astype(np.float32) / 255.0
+
+        def predict_fn(batch):
+            return batch.mean(axis=(1, 2, 3))[:, None]
+        return preprocess_image, predict_fn
+
+    import torchvision
+    from lib.model_export import torch_predict_fn, torch_preprocess
+
+    model = torchvision.models.mobilenet_v2(num_classes=2)
+    return torch_preprocess(224), torch_predict_fn(model)
+
+def _has_torch():
+    # Looked up without importing: torch would inflate the RSS of every stage measured.
+    return importlib.util.find_spec('torchvision') is not None
+
+def bench_predict(params, workdir):
+    from lib.predictor import predict_batch
+
+    input_dir = write_image_folder(os.path.join(workdir, 'input'), params['images'], params['size'])
+    paths = sorted(glob.glob(os.path.join(input_dir, '*', '*.png')))
+    preprocess_image, predict_fn = _model(params)
+
+    latencies, preprocess_latencies = [], []
+    start = time.perf_counter()
+    predict_batch(None, paths, timed(preprocess_image, preprocess_latencies),
+                  batch_size=params['batch_size'], num_workers=params['workers'],
+                  predict_fn=timed(predict_fn, latencies))
+    return {'items': len(paths), 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image', 'latency_unit': 'batch',
+            'preprocess_ms': _percentiles_ms(preprocess_latencies)}
+
+def bench_predict_fire(params, workdir):
+    from lib.predictor import predict_fire
+
+    input_dir = write_image_folder(os.path.join(workdir, 'input'), params['images'], params['size'])
+    folder = os.path.join(input_dir, 'fire')
+    names = sorted(os.listdir(folder))
+    preprocess_image, predict_fn = _model(params)
+
+    class Model:
+        predict = staticmethod(predict_fn)
+
+    latencies = []
+    run = timed(predict_fire, latencies)
+    start = time.perf_counter()
+    for _ in range(params['repeats']):
+        run(Model(), names, folder, preprocess_image, batch_size=params['batch_size'])
+    return {'items': len(names) * params['repeats'], 'seconds': time.perf_counter() - start,
+            'latencies': latencies, 'unit': 'image', 'latency_unit': 'run'}
+
+def _grid(base, **axes):
+    grid = [dict(base)]
+    for name, values in axes.items():
+        grid = [dict(params, **{name: value}) for params in grid for value in values]
+    return grid
+
+def stage_grid(quick=False):
+    """
+    Benchmark functions and their parameter grids.
+
+    Args:
+        quick (bool): Smaller sizes and counts for a fast smoke run.
+
+    Returns:
+        dict: Stage name to (function, list of parameter dicts).
+    """
+    sizes = (512, 2048) if quick else (512, 2048, 8192)
+    repeats = 3 if quick else 10
+    images = 8 if quick else 64
+    workers = (1, 4) if quick else (1, 2, 4, 8)
+    models = ('stub', 'mobilenet_v2') if _has_torch() else ('stub',)
+    return {
+        'apply_clahe_rgb': (bench_clahe, _grid({'repeats': repeats}, size=sizes)),
+        'apply_clahe_batch': (bench_clahe_batch, _grid({'repeats': repeats, 'images': images, 'size': 512},
+                                                       workers=workers)),
+        'apply_clahe_tiled': (bench_clahe_tiled, _grid({'repeats': repeats}, size=sizes[1:],
+                                                       block_size=(2048, 4096))),
+        'split_into_patches': (bench_split, _grid({'repeats': repeats}, size=sizes, stride=(256, 128))),
+        'preprocess_and_patch': (bench_preprocess, _grid({'images': images, 'repeats': 2}, size=(512, 2048))),
+        'preprocess_to_store': (bench_preprocess_store, _grid({'images': images, 'size': 2048, 'repeats': 2},
+                                                              workers=workers)),
+        'process_event_batch': (bench_extract, _grid({'events': 40 if quick else 400, 'ee_latency': 0.02,
+                                                      'http_latency': 0.03},
+                                                     workers=workers + (16,), use_async=(False, True))),
+        'predict_batch': (bench_predict, _grid({'images': images * 2, 'size': 512, 'batch_size': 32},
+                                               workers=workers, model=models)),
+        'predict_fire': (bench_predict_fire, _grid({'images': images * 2, 'size': 512, 'repeats': 2},
+                                                   batch_size=(1, 32), model=models)),
+    }
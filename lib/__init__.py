@@ -1,8 +1,49 @@
-from .utils import generate_download_url, save_image, download_image, plot_training_history, plot_fine_tuning_history
-from .image_processor import get_satellite_collection, process_single_event, process_event_batch
-from .training import train_model
-from .predictor import predict_fire
-from .image_preprocessor import apply_clahe_rgb, split_into_patches, preprocess_and_patch
+import importlib
 
+# Public names and the submodule defining them. Submodules are imported on first attribute
+# access (PEP 562), so `import lib` stays cheap and e.g. a patching worker never loads
+# Earth Engine, TensorFlow or PyTorch.
+_EXPORTS = {
+    'utils': ['generate_download_url', 'generate_array_download_url', 'save_image',
+              'download_image', 'get_http_session', 'plot_training_history',
+              'plot_fine_tuning_history'],
+    'image_processor': ['get_satellite_collection', 'get_multiband_composite', 'extract_event',
+                        'extract_event_array', 'process_single_event', 'process_event_batch'],
+    'training': ['train_model', 'train_head_on_features'],
+    'predictor': ['predict_fire', 'predict_batch'],
+    'image_preprocessor': ['apply_clahe_rgb', 'apply_clahe_batch', 'apply_clahe_tiled',
+                           'patch_grid', 'split_into_patches', 'preprocess_and_patch',
+                           'preprocess_to_store'],
+    'event_planner': ['plan_extraction_jobs', 'write_detection_image_map'],
+    'job_store': ['ExtractionJobStore', 'event_key'],
+    'collection_cache': ['CollectionCache'],
+    'patch_store': ['PatchStore', 'PatchStoreWriter'],
+    'async_extraction': ['AdaptiveConcurrencyLimiter', 'extract_events_async'],
+    'scene_scanner': ['scan_scene', 'find_hotspots'],
+    'firms_store': ['build_firms_store', 'read_firms', 'read_firms_csv'],
+    'band_arrays': ['load_band_array', 'save_band_array'],
+    'dataset': ['build_image_cache', 'CachedImageDataset', 'normalize_tensor'],
+    'feature_cache': ['split_torchvision_model', 'torch_forward', 'cache_features',
+                      'load_features', 'train_head', 'sweep_heads'],
+    'instrumentation': ['Instrumentation', 'JsonlSink', 'PrometheusTextSink', 'ProgressView'],
+    'model_export': ['torch_preprocess', 'torch_predict_fn', 'export_model',
+                     'load_exported_model', 'compare_models'],
+    'nrt_feed': ['new_detections', 'ingest_once', 'watch'],
+    'dataset_index': ['build_dataset_index', 'balance_report', 'remove_near_duplicates',
+                      'spatial_block_folds', 'sample_index', 'perceptual_hash'],
+}
 
+_MODULE_OF = {name: module for module, names in _EXPORTS.items() for name in names}
 
+__all__ = sorted(_MODULE_OF)
+
+def __getattr__(name):
+    module = _MODULE_OF.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
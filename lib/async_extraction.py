@@ -0,0 +1,282 @@
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from lib.utils import save_image, RETRY_STATUS_CODES
+from lib.job_store import STATUS_PENDING, STATUS_DONE, STATUS_FAILED
+from lib.instrumentation import log
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Concurrency limit that adapts to the observed error rate (additive increase,
+    multiplicative decrease).
+
+    Every finished request reports whether it succeeded. Once at least `limit` requests
+    have finished since the last change, the limit grows by one if the error rate over
+    the last `window` requests is at most `error_threshold`, and is halved if a request
+    failed while the error rate is above it.
+
+    Args:
+        initial (int, optional): Starting limit. Defaults to 8.
+        minimum (int, optional): Lowest allowed limit. Defaults to 1.
+        maximum (int, optional): Highest allowed limit. Defaults to 32.
+        window (int, optional): Number of recent outcomes used for the error rate. Defaults to 20.
+        error_threshold (float, optional): Error rate above which the limit shrinks.
+                                           Defaults to 0.1.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=32, window=20, error_threshold=0.1):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.error_threshold = error_threshold
+        self._outcomes = deque(maxlen=window)
+        self._active = 0
+        self._since_change = 0
+        self._condition = None
+
+    def _get_condition(self):
+        # Created lazily so the limiter binds to the loop it is used in.
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @property
+    def error_rate(self):
+        """float: Fraction of failed requests among the recent outcomes."""
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    async def acquire(self):
+        """Waits until fewer than `limit` requests are in flight and claims a slot."""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def release(self, ok):
+        """
+        Frees a slot and updates the limit.
+
+        Args:
+            ok (bool): Whether the request succeeded (False for throttling, 5xx and timeouts).
+        """
+        condition = self._get_condition()
+        async with condition:
+            self._active -= 1
+            self._outcomes.append(bool(ok))
+            self._since_change += 1
+            if self._since_change >= self.limit:
+                if not ok and self.error_rate > self.error_threshold:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self._since_change = 0
+                elif ok and self.error_rate <= self.error_threshold:
+                    self.limit = min(self.maximum, self.limit + 1)
+                    self._since_change = 0
+            condition.notify_all()
+
+def backoff_delay(attempt, backoff=0.5, retry_after=None, max_delay=30.0):
+    """
+    Computes the wait before a retry: exponential backoff with full jitter, or the
+    server's `Retry-After` value when it sends one.
+
+    Args:
+        attempt (int): Zero-based number of the attempt that just failed.
+        backoff (float, optional): Base delay in seconds. Defaults to 0.5.
+        retry_after (str, optional): Value of the `Retry-After` response header.
+        max_delay (float, optional): Upper bound of the delay in seconds. Defaults to 30.
+
+    Returns:
+        float: Delay in seconds.
+    """
+    if retry_after is not None:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, backoff * 2 ** attempt))
+
+async def fetch_bytes(session, url, limiter, timeout=60, retries=4, backoff=0.5, trace=None):
+    """
+    Downloads a URL through a pooled `aiohttp` session with timeouts and retries.
+
+    429 and 5xx responses, connection errors and timeouts are retried with
+    `backoff_delay`; other HTTP errors are returned immediately.
+
+    Args:
+        session (aiohttp.ClientSession): Shared keep-alive session.
+        url (str): URL to download.
+        limiter (AdaptiveConcurrencyLimiter): Limiter gating the request.
+        timeout (float, optional): Total timeout of one request in seconds. Defaults to 60.
+        retries (int, optional): Number of retries after the first attempt. Defaults to 4.
+        backoff (float, optional): Base delay of the backoff in seconds. Defaults to 0.5.
+        trace (EventTrace, optional): Receives the download time, bytes, retries and the
+                                      failure reason.
+
+    Returns:
+        tuple:
+            - bytes or None: The response body if the download succeeded.
+            - str or None: The last error message otherwise.
+    """
+    error = reason = None
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    start = time.perf_counter()
+
+    def traced(content, error, attempts):
+        if trace is not None:
+            trace.add_stage('download', time.perf_counter() - start)
+            trace.retries += attempts - 1
+            if content is not None:
+                trace.bytes += len(content)
+            else:
+                trace.reason = reason
+        return content, error
+
+    for attempt in range(retries + 1):
+        retry_after = None
+        await limiter.acquire()
+        try:
+            async with session.get(url, timeout=client_timeout) as response:
+                if response.status in RETRY_STATUS_CODES:
+                    retry_after = response.headers.get('Retry-After')
+                    error, reason = f"HTTP {response.status}", f"http_{response.status}"
+                elif response.status >= 400:
+                    await limiter.release(True)
+                    reason = f"http_{response.status}"
+                    return traced(None, f"HTTP {response.status}", attempt + 1)
+                else:
+                    content = await response.read()
+                    await limiter.release(True)
+                    return traced(content, None, attempt + 1)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error, reason = str(e) or type(e).__name__, 'network'
+        await limiter.release(False)
+
+        if attempt < retries:
+            await asyncio.sleep(backoff_delay(attempt, backoff, retry_after))
+
+    log(f"Failed to download image: {error}", warning=True, trace=trace)
+    return traced(None, error, retries + 1)
+
+async def extract_events_async(events, prepare, output_dir, on_result, url_workers=5,
+                               max_concurrency=32, initial_concurrency=8, timeout=60,
+                               retries=4, backoff=0.5, instrumentation=None):
+    """
+    Extracts events with URL generation and downloading running as pipelined stages.
+
+    Workflow:
+        1. **URL Stage**:
+           - `prepare` runs on a pool of `url_workers` threads, since Earth Engine calls block.
+           - Events without imagery or with errors are reported right away; ready URLs are
+             pushed onto a bounded queue.
+
+        2. **Download Stage**:
+           - `max_concurrency` consumers download queued URLs over one keep-alive `aiohttp`
+             session, gated by an `AdaptiveConcurrencyLimiter`.
+
+        3. **Saving**:
+           - Downloaded content is written with `save_image` off the event loop, and the
+             outcome is passed to `on_result`.
+
+    Args:
+        events (list): (event_key, row) tuples. The image of each event is saved as
+                       '<event_key>.png'.
+        prepare (callable): Function mapping a row to a (status, url, error) tuple, like
+                            `lib.image_processor.prepare_event_download`.
+        output_dir (str): Directory where downloaded images will be saved.
+        on_result (callable): Called as on_result(event_key, status, path, error) for every event.
+        url_workers (int, optional): Threads generating URLs. Defaults to 5.
+        max_concurrency (int, optional): Maximum number of concurrent downloads. Defaults to 32.
+        initial_concurrency (int, optional): Starting number of concurrent downloads. Defaults to 8.
+        timeout (float, optional): Timeout of one download in seconds. Defaults to 60.
+        retries (int, optional): Retries per download. Defaults to 4.
+        backoff (float, optional): Base delay of the retry backoff in seconds. Defaults to 0.5.
+        instrumentation (Instrumentation, optional): Traces every event across both stages.
+
+    Returns:
+        AdaptiveConcurrencyLimiter: The limiter, reflecting the final concurrency and error rate.
+    """
+    loop = asyncio.get_running_loop()
+    limiter = AdaptiveConcurrencyLimiter(initial_concurrency, 1, max_concurrency)
+    queue = asyncio.Queue(maxsize=2 * max_concurrency)
+
+    def traced(trace, fn, *args):
+        # Binds the event trace to the executor thread running `fn`.
+        if trace is None:
+            return fn(*args)
+        with instrumentation.bind(trace):
+            return fn(*args)
+
+    def report(key, trace, status, path, error):
+        if trace is not None:
+            instrumentation.finish(trace, status, error)
+        on_result(key, status, path, error)
+
+    async def produce(executor, key, row):
+        trace = instrumentation.start(key) if instrumentation is not None else None
+        try:
+            status, url, error = await loop.run_in_executor(executor, traced, trace, prepare, row)
+        except Exception as e:
+            status, url, error = STATUS_FAILED, None, str(e)
+        if status == STATUS_PENDING:
+            await queue.put((key, url, trace))
+        else:
+            report(key, trace, status, None, error)
+
+    async def run_url_stage(executor):
+        try:
+            await asyncio.gather(*(produce(executor, key, row) for key, row in events))
+        finally:
+            # Always release the consumers, or they would wait forever on the queue.
+            for _ in range(max_concurrency):
+                await queue.put(None)
+
+    async def consume(session):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            key, url, trace = item
+            content, error = await fetch_bytes(session, url, limiter, timeout, retries, backoff,
+                                               trace)
+            if content is None:
+                report(key, trace, STATUS_FAILED, None, error)
+                continue
+            path = await loop.run_in_executor(None, traced, trace, save_image, content, output_dir,
+                                              f"{key}.png")
+            if path is None:
+                report(key, trace, STATUS_FAILED, None, 'save failed')
+            else:
+                report(key, trace, STATUS_DONE, path, None)
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    with ThreadPoolExecutor(max_workers=url_workers) as executor:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(run_url_stage(executor),
+                                 *(consume(session) for _ in range(max_concurrency)))
+    return limiter
+
+def run_async_extraction(*args, **kwargs):
+    """
+    Runs `extract_events_async` to completion from synchronous code.
+
+    When called from a thread that already runs an event loop (e.g. a Jupyter notebook),
+    the extraction runs on a fresh loop in a helper thread.
+
+    Args:
+        *args: Positional arguments of `extract_events_async`.
+        **kwargs: Keyword arguments of `extract_events_async`.
+
+    Returns:
+        AdaptiveConcurrencyLimiter: The limiter used by the run.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(extract_events_async(*args, **kwargs))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, extract_events_async(*args, **kwargs)).result()
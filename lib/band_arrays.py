@@ -0,0 +1,91 @@
+import io
+import json
+import os
+import numpy as np
+from lib.instrumentation import stage, log
+
+CLOUD_MASK_BAND = 'CLOUD_MASK'
+
+def parse_npy_download(content, bands):
+    """
+    Convert an Earth Engine NPY download into a band-last array and a cloud mask.
+
+    Earth Engine returns a structured array with one named field per band. The fields
+    listed in `bands` are stacked into a contiguous (H, W, B) float32 array; the
+    `CLOUD_MASK` field, when present, becomes a separate uint8 mask.
+
+    Args:
+        content (bytes): Body of the `getDownloadURL(format='NPY')` response.
+        bands (list): Band names to stack, in order.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: (H, W, B) float32 array.
+            - numpy.ndarray or None: (H, W) uint8 mask, 1 where no cloud-free observation exists.
+    """
+    raw = np.load(io.BytesIO(content), allow_pickle=False)
+    array = np.empty(raw.shape + (len(bands),), dtype=np.float32)
+    for i, band in enumerate(bands):
+        array[..., i] = raw[band]
+    mask = None
+    if raw.dtype.names and CLOUD_MASK_BAND in raw.dtype.names:
+        mask = (raw[CLOUD_MASK_BAND] > 0).astype(np.uint8)
+    return array, mask
+
+def save_band_array(array, mask, output_dir, name, meta=None):
+    """
+    Save a multi-band array, its cloud mask and metadata as `.npy`/`.json` files.
+
+    Files written: '<name>.npy' (H, W, B) data, '<name>_mask.npy' (H, W) mask if given,
+    and '<name>.json' with `meta` plus the array shape and dtype.
+
+    Args:
+        array (numpy.ndarray): (H, W, B) band array.
+        mask (numpy.ndarray or None): (H, W) cloud mask.
+        output_dir (str): Directory to save into. Created if missing.
+        name (str): Base filename without extension.
+        meta (dict, optional): Extra metadata such as band names, bounds and scale.
+
+    Returns:
+        str: Path of the saved data array.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{name}.npy")
+    meta = dict(meta or {}, shape=list(array.shape), dtype=str(array.dtype),
+                has_mask=mask is not None)
+    with stage('save'):
+        np.save(path, np.ascontiguousarray(array))
+        if mask is not None:
+            np.save(os.path.join(output_dir, f"{name}_mask.npy"), mask)
+        with open(os.path.join(output_dir, f"{name}.json"), 'w') as f:
+            json.dump(meta, f, indent=2)
+    log(f"Saved: {path}")
+    return path
+
+def load_band_array(path, mmap=True):
+    """
+    Load a band array saved by `save_band_array`, memory-mapped by default.
+
+    Memory mapping lets training and inference slice windows out of large scenes without
+    reading or decoding the whole file.
+
+    Args:
+        path (str): Path of the '<name>.npy' data file.
+        mmap (bool, optional): Memory-map the arrays read-only. Defaults to True.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: (H, W, B) band array.
+            - numpy.ndarray or None: (H, W) cloud mask.
+            - dict: Metadata.
+    """
+    mode = 'r' if mmap else None
+    base = os.path.splitext(path)[0]
+    array = np.load(path, mmap_mode=mode)
+    mask_path = f"{base}_mask.npy"
+    mask = np.load(mask_path, mmap_mode=mode) if os.path.exists(mask_path) else None
+    meta = {}
+    if os.path.exists(f"{base}.json"):
+        with open(f"{base}.json") as f:
+            meta = json.load(f)
+    return array, mask, meta
@@ -0,0 +1,207 @@
+"""
+Command line entry points: `wildfire-extract`, `wildfire-preprocess`, `wildfire-predict` and
+`wildfire-watch`.
+
+Each command imports only the stack it needs, after its arguments are parsed, so `--help`
+and argument errors return immediately and e.g. preprocessing never loads Earth Engine,
+PyTorch or TensorFlow.
+"""
+import argparse
+import os
+import sys
+
+def extract_main(argv=None):
+    """Download the satellite images of the detections in FIRMS CSV files."""
+    parser = argparse.ArgumentParser(prog='wildfire-extract', description=extract_main.__doc__)
+    parser.add_argument('csv', nargs='+', help="FIRMS CSV files with latitude, longitude and acq_date.")
+    parser.add_argument('output_dir', help="Directory of the downloaded images.")
+    parser.add_argument('--project', help="Google Cloud project passed to ee.Initialize.")
+    parser.add_argument('--workers', type=int, default=5, help="Concurrent extraction threads.")
+    parser.add_argument('--buffer', type=float, default=0.02, help="Buffer around events in degrees.")
+    parser.add_argument('--deduplicate', action='store_true',
+                        help="Extract each (tile, date) scene once.")
+    parser.add_argument('--job-store', help="SQLite ledger used to resume interrupted runs.")
+    parser.add_argument('--collection-cache', help="SQLite cache of collection sizes.")
+    parser.add_argument('--no-size-check', action='store_true',
+                        help="Skip the separate collection size request.")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Download on the pipelined asyncio engine.")
+    parser.add_argument('--max-concurrency', type=int, default=32,
+                        help="Upper bound of concurrent downloads in async mode.")
+    parser.add_argument('--arrays', action='store_true',
+                        help="Save raw multi-band arrays instead of PNG thumbnails.")
+    parser.add_argument('--metrics-jsonl', help="Append one JSON line per event to this file.")
+    parser.add_argument('--metrics-prom', help="Write Prometheus text metrics to this file.")
+    parser.add_argument('--no-progress', action='store_true', help="Hide the progress line.")
+    args = parser.parse_args(argv)
+
+    import ee
+    import pandas as pd
+    from lib.image_processor import process_event_batch
+    from lib.instrumentation import Instrumentation, JsonlSink, PrometheusTextSink
+
+    ee.Initialize(project=args.project)
+    fire_df = pd.concat([pd.read_csv(path) for path in args.csv], ignore_index=True)
+
+    sinks = []
+    if args.metrics_jsonl:
+        sinks.append(JsonlSink(args.metrics_jsonl))
+    if args.metrics_prom:
+        sinks.append(PrometheusTextSink(args.metrics_prom))
+    instrumentation = Instrumentation(sinks, progress=not args.no_progress)
+
+    try:
+        results = process_event_batch(
+            fire_df, args.output_dir, max_workers=args.workers, deduplicate=args.deduplicate,
+            buffer=args.buffer, job_store=args.job_store, return_status=True,
+            collection_cache=args.collection_cache, check_size=not args.no_size_check,
+            use_async=args.use_async, max_concurrency=args.max_concurrency,
+            array_options={} if args.arrays else None, instrumentation=instrumentation)
+    finally:
+        instrumentation.close()
+
+    statuses = pd.Series([status for _, status in results]).value_counts()
+    print(', '.join(f"{status}: {count}" for status, count in statuses.items()))
+    return 1 if statuses.get('failed', 0) else 0
+
+def preprocess_main(argv=None):
+    """Apply CLAHE to class-folder images and split them into patches."""
+    parser = argparse.ArgumentParser(prog='wildfire-preprocess', description=preprocess_main.__doc__)
+    parser.add_argument('input_dir', help="Directory with one subfolder per category.")
+    parser.add_argument('output_dir', help="Directory of the patches or patch store.")
+    parser.add_argument('--categories', nargs='+', default=['fire', 'no_fire'],
+                        help="Category subfolders.")
+    parser.add_argument('--patch-size', type=int, default=256, help="Patch size in pixels.")
+    parser.add_argument('--clip-limit', type=float, default=2.0, help="CLAHE clip limit.")
+    parser.add_argument('--full', action='store_true',
+                        help="Rebuild everything instead of only new or changed images.")
+    parser.add_argument('--store', action='store_true',
+                        help="Write a packed patch store instead of one PNG per patch.")
+    parser.add_argument('--stride', type=int, help="Step between patches (store mode).")
+    parser.add_argument('--edge', choices=['drop', 'pad', 'shift'], default='drop',
+                        help="Edge policy (store mode).")
+    parser.add_argument('--workers', type=int, help="Worker processes (store mode).")
+    args = parser.parse_args(argv)
+
+    from lib.image_preprocessor import preprocess_and_patch, preprocess_to_store
+
+    if args.store:
+        preprocess_to_store(args.input_dir, args.output_dir, tuple(args.categories),
+                            args.patch_size, stride=args.stride, edge=args.edge,
+                            max_workers=args.workers)
+    else:
+        preprocess_and_patch(args.input_dir, args.output_dir, tuple(args.categories),
+                             args.patch_size, clip_limit=args.clip_limit,
+                             incremental=not args.full)
+    return 0
+
+def _image_paths(inputs):
+    from lib.image_preprocessor import IMAGE_EXTENSIONS
+
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += sorted(os.path.join(root, name)
+                            for root, _, names in os.walk(item)
+                            for name in names if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.append(item)
+    return paths
+
+def _keras_predictor(model_path, size):
+    import cv2
+    import numpy as np
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+
+    def preprocess_image(path):
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError("unreadable image")
+        image = cv2.cvtColor(cv2.resize(image, (size, size)), cv2.COLOR_BGR2RGB)
+        return image.astype(np.float32) / 255.0
+    return model, preprocess_image, None
+
+def predict_main(argv=None):
+    """Score images with an exported (.pt/.onnx) or Keras (.keras/.h5) model."""
+    parser = argparse.ArgumentParser(prog='wildfire-predict', description=predict_main.__doc__)
+    parser.add_argument('model', help="Model file from export_model, or a saved Keras model.")
+    parser.add_argument('images', nargs='+', help="Image files or directories.")
+    parser.add_argument('--output', help="CSV file for the predictions. Defaults to stdout.")
+    parser.add_argument('--size', type=int, default=224, help="Model input size.")
+    parser.add_argument('--batch-size', type=int, default=32, help="Images per model call.")
+    parser.add_argument('--workers', type=int, default=4, help="Image decoding threads.")
+    parser.add_argument('--threads', type=int, help="Inference threads.")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Fire probability threshold.")
+    args = parser.parse_args(argv)
+
+    from lib.predictor import predict_batch
+
+    if args.model.lower().endswith(('.keras', '.h5')):
+        model, preprocess_image, predict_fn = _keras_predictor(args.model, args.size)
+    else:
+        from lib.model_export import load_exported_model, torch_preprocess
+
+        model, preprocess_image = None, torch_preprocess(args.size)
+        predict_fn = load_exported_model(args.model, num_threads=args.threads)
+
+    results = predict_batch(model, _image_paths(args.images), preprocess_image,
+                            batch_size=args.batch_size, num_workers=args.workers,
+                            predict_fn=predict_fn, threshold=args.threshold)
+    results.to_csv(args.output or sys.stdout, index=False)
+    return 0
+
+def watch_main(argv=None):
+    """Extract, patch and score new FIRMS NRT detections as the NRT files grow."""
+    parser = argparse.ArgumentParser(prog='wildfire-watch', description=watch_main.__doc__)
+    parser.add_argument('raw_dir', help="Folder with the FIRMS CSV files, e.g. data/raw.")
+    parser.add_argument('output_dir', help="Directory of the images, predictions and feed state.")
+    parser.add_argument('--project', help="Google Cloud project passed to ee.Initialize.")
+    parser.add_argument('--once', action='store_true', help="Run a single cycle, e.g. from cron.")
+    parser.add_argument('--interval', type=float, default=900, help="Seconds between cycles.")
+    parser.add_argument('--lookback', type=int, default=180,
+                        help="Minutes of overlap with the previous cycle.")
+    parser.add_argument('--workers', type=int, default=5, help="Concurrent extraction threads.")
+    parser.add_argument('--deduplicate', action='store_true',
+                        help="Extract each (tile, date) scene once.")
+    parser.add_argument('--collection-cache', help="SQLite cache of collection sizes.")
+    parser.add_argument('--retry-no-imagery-days', type=float, default=5,
+                        help="Retry detections without imagery until this many days after "
+                             "their search window, while their scene may still be ingested.")
+    parser.add_argument('--patch-dir', help="Save CLAHE patches of the new images here.")
+    parser.add_argument('--model', help="Exported .pt/.onnx model used to score the new images.")
+    parser.add_argument('--size', type=int, default=224, help="Model input size.")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Fire probability threshold.")
+    args = parser.parse_args(argv)
+
+    import ee
+    from lib.nrt_feed import watch
+
+    ee.Initialize(project=args.project)
+    options = {'lookback_minutes': args.lookback, 'max_workers': args.workers,
+               'deduplicate': args.deduplicate, 'collection_cache': args.collection_cache,
+               'retry_no_imagery_days': args.retry_no_imagery_days,
+               'patch_dir': args.patch_dir, 'threshold': args.threshold}
+    if args.model:
+        from lib.model_export import load_exported_model, torch_preprocess
+
+        options.update(predict_fn=load_exported_model(args.model),
+                       preprocess_image=torch_preprocess(args.size))
+
+    summaries = watch(args.raw_dir, args.output_dir, interval=args.interval,
+                      max_cycles=1 if args.once else None, **options)
+    return 1 if summaries and summaries[-1] is None else 0
+
+def main(argv=None):
+    """Dispatch `python -m lib.cli {extract,preprocess,predict,watch} ...`."""
+    commands = {'extract': extract_main, 'preprocess': preprocess_main, 'predict': predict_main,
+                'watch': watch_main}
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in commands:
+        print(f"usage: python -m lib.cli {{{','.join(commands)}}} ...", file=sys.stderr)
+        return 2
+    return commands[argv[0]](argv[1:])
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from lib.job_store import DEFAULT_RETRY_NO_IMAGERY_DAYS
+
+def collection_cache_key(collection, bbox, start_date, end_date, max_cloud):
+    """
+    Builds the cache key of a filtered collection query.
+
+    Args:
+        collection (str): Earth Engine image collection ID.
+        bbox (list): [west, south, east, north] bounds in degrees.
+        start_date (str): Start date in 'YYYY-MM-DD' format.
+        end_date (str): End date in 'YYYY-MM-DD' format.
+        max_cloud (float): Maximum CLOUDY_PIXEL_PERCENTAGE of the filter.
+
+    Returns:
+        str: Key identifying the query.
+    """
+    bounds = ','.join(f"{value:.6f}" for value in bbox)
+    return f"{collection}|{bounds}|{start_date}|{end_date}|{max_cloud}"
+
+class CollectionCache:
+    """
+    On-disk cache of filtered collection sizes, including empty (negative) results.
+
+    The size of a filtered collection depends only on the collection, bounding box,
+    date window and cloud threshold, so it can be remembered between runs instead of
+    asking Earth Engine with a blocking `size().getInfo()` call every time.
+
+    Entries expire after `ttl` seconds. An empty result for a date window that ended less
+    than `recent_days` before the query is only provisional, since Sentinel-2 scenes reach
+    Earth Engine some time after acquisition, and expires after `negative_ttl` seconds
+    instead. When the cache is opened, or `evict` is called, expired entries are dropped
+    and the least recently used ones are evicted beyond `max_entries`. The cache is safe
+    to share between the worker threads of `process_event_batch`.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Created if missing.
+        ttl (float, optional): Lifetime of an entry in seconds. Defaults to 30 days.
+        max_entries (int, optional): Maximum number of entries kept. Defaults to 200000.
+        negative_ttl (float, optional): Lifetime of a provisional empty result in seconds;
+                                        0 disables caching them. Defaults to 1 hour.
+        recent_days (float, optional): Days after the end of its window during which an
+                                       empty result is provisional. Defaults to 5.
+    """
+
+    def __init__(self, db_path, ttl=30 * 24 * 3600, max_entries=200000, negative_ttl=3600,
+                 recent_days=DEFAULT_RETRY_NO_IMAGERY_DAYS):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.recent_days = recent_days
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS collection_sizes (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                provisional INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(collection_sizes)')}
+        if 'provisional' not in columns:
+            self.conn.execute(
+                'ALTER TABLE collection_sizes ADD COLUMN provisional INTEGER NOT NULL DEFAULT 0')
+        self.conn.commit()
+        self.evict()
+
+    def get(self, key):
+        """
+        Looks up the cached size of a query.
+
+        Args:
+            key (str): Key built by `collection_cache_key`.
+
+        Returns:
+            int or None: The cached collection size, or None if unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT size, created_at, provisional FROM collection_sizes WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            size, created_at, provisional = row
+            if now - created_at > (self.negative_ttl if provisional else self.ttl):
+                self.conn.execute('DELETE FROM collection_sizes WHERE key = ?', (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute(
+                'UPDATE collection_sizes SET accessed_at = ? WHERE key = ?', (now, key))
+            self.conn.commit()
+            return size
+
+    def set(self, key, size, end_date=None):
+        """
+        Stores the size of a query.
+
+        Args:
+            key (str): Key built by `collection_cache_key`.
+            size (int): Number of images in the filtered collection (0 if empty).
+            end_date (str, optional): End of the query's date window ('YYYY-MM-DD'). An empty
+                                      result for a window that ended less than `recent_days`
+                                      ago is provisional. Without it the result is final.
+        """
+        now = time.time()
+        provisional = (int(size) == 0 and end_date is not None
+                       and pd.Timestamp(now, unit='s')
+                       < pd.Timestamp(end_date) + pd.Timedelta(days=self.recent_days))
+        if provisional and self.negative_ttl <= 0:
+            return
+        with self._lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO collection_sizes (key, size, created_at, accessed_at,
+                                                         provisional)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, int(size), now, now, int(provisional)))
+            self.conn.commit()
+
+    def evict(self):
+        """
+        Removes expired entries and trims the cache to `max_entries`.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        now = time.time()
+        with self._lock:
+            removed = self.conn.execute(
+                'DELETE FROM collection_sizes WHERE created_at < ? '
+                'OR (provisional AND created_at < ?)',
+                (now - self.ttl, now - self.negative_ttl)).rowcount
+            removed += self.conn.execute("""
+                DELETE FROM collection_sizes WHERE key IN (
+                    SELECT key FROM collection_sizes ORDER BY accessed_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+            self.conn.commit()
+        return removed
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,136 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+from lib.image_preprocessor import IMAGENET_MEAN, IMAGENET_STD
+
+def _file_signature(path):
+    """[size, mtime_ns] of a file, or None if it cannot be read."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def build_image_cache(image_paths, cache_dir, size=(224, 224), num_workers=4):
+    """
+    Decode and resize images once into a memory-mapped uint8 array.
+
+    Every image is read with OpenCV, converted to RGB and resized to `size`, and written
+    into slot i of a single (N, H, W, 3) `.npy` file. The cache is reused as long as the
+    list of paths, the size and every file's size and modification time are unchanged,
+    so PNG decoding happens once per dataset instead of once per item, epoch and fold.
+
+    Args:
+        image_paths (list): Paths of the images, in dataset order.
+        cache_dir (str): Directory of the cache. Created if missing.
+        size (tuple, optional): (width, height) of the cached images. Defaults to (224, 224).
+        num_workers (int, optional): Threads decoding images. Defaults to 4.
+
+    Returns:
+        str: Path of the cached `.npy` array.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, 'images.npy')
+    meta_path = os.path.join(cache_dir, 'images.json')
+    meta = {'paths': list(image_paths), 'size': list(size)}
+    meta['files'] = [_file_signature(path) for path in meta['paths']]
+
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                return cache_path
+
+    # The old meta goes first, so an interrupted rebuild can never be mistaken for a valid
+    # cache; the new files are written aside and moved into place once complete.
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    width, height = size
+    tmp_path = cache_path + '.tmp'
+    images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                       shape=(len(meta['paths']), height, width, 3))
+
+    def load(i):
+        image = cv2.imread(meta['paths'][i])
+        if image is None:
+            print(f"Skipping unreadable image: {meta['paths'][i]}")
+            images[i] = 0
+            return
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=images[i])
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(load, range(len(meta['paths']))))
+    images.flush()
+    del images
+    os.replace(tmp_path, cache_path)
+
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    print(f"Cached {len(meta['paths'])} images at: {cache_path}")
+    return cache_path
+
+def normalize_tensor(image, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+    """
+    Convert a uint8 CHW tensor to a normalized float tensor.
+
+    Args:
+        image (torch.Tensor): (3, H, W) uint8 image.
+        mean (tuple, optional): Per-channel mean. Defaults to the ImageNet mean.
+        std (tuple, optional): Per-channel standard deviation. Defaults to the ImageNet std.
+
+    Returns:
+        torch.Tensor: (3, H, W) float32 image.
+    """
+    mean = torch.tensor(mean).view(3, 1, 1)
+    std = torch.tensor(std).view(3, 1, 1)
+    return (image.float() / 255.0 - mean) / std
+
+class CachedImageDataset(Dataset):
+    """
+    PyTorch dataset reading pre-decoded images from a `build_image_cache` array.
+
+    The cache is memory-mapped copy-on-write in each worker process, so items are views
+    of the shared page cache rather than freshly decoded images; only `transform` (e.g.
+    random flips and rotations) runs per item. Replaces the notebook's `FireDataset`
+    when combined with `Subset`-style `indices` for the k-fold splits.
+
+    Args:
+        cache_path (str): Path returned by `build_image_cache`.
+        labels (list): Label of every cached image, in cache order.
+        indices (list, optional): Cache positions in this dataset, e.g. one fold.
+                                  Defaults to all images.
+        transform (callable, optional): Applied to the (3, H, W) uint8 tensor, e.g. tensor
+                                        transforms from `torchvision.transforms.v2`.
+                                        Defaults to `normalize_tensor`.
+    """
+
+    def __init__(self, cache_path, labels, indices=None, transform=None):
+        self.cache_path = cache_path
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.indices = np.arange(len(self.labels)) if indices is None else np.asarray(indices)
+        self.transform = transform or normalize_tensor
+        self._images = None
+
+    def __getstate__(self):
+        # Each DataLoader worker maps the cache itself instead of receiving a pickled copy.
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def _get_images(self):
+        if self._images is None:
+            self._images = np.load(self.cache_path, mmap_mode='c')
+        return self._images
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        i = self.indices[idx]
+        image = torch.from_numpy(self._get_images()[i]).permute(2, 0, 1)
+        return self.transform(image), torch.tensor(self.labels[i], dtype=torch.long)
@@ -0,0 +1,421 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+import pandas as pd
+from lib.image_preprocessor import IMAGE_EXTENSIONS
+
+# '<latitude>_<longitude>[_<YYYY-MM-DD> | _<suffix>][_patch_<i>]', as written by the
+# extraction (see `lib.job_store.event_key`) and by `preprocess_and_patch`.
+IMAGE_NAME = re.compile(r'^(?P<source>(?P<latitude>-?\d+(?:\.\d+)?)_(?P<longitude>-?\d+(?:\.\d+)?)'
+                        r'(?:_(?P<acq_date>\d{4}-\d{2}-\d{2})|_[^_]+)?)(?:_patch_(?P<patch>\d+))?$')
+
+PATCH_SUFFIX = re.compile(r'_patch_\d+$')
+
+SEASONS = {12: 'DJF', 1: 'DJF', 2: 'DJF', 3: 'MAM', 4: 'MAM', 5: 'MAM',
+           6: 'JJA', 7: 'JJA', 8: 'JJA', 9: 'SON', 10: 'SON', 11: 'SON'}
+
+FIRMS_ATTRIBUTES = ['sensor', 'confidence_level', 'daynight', 'frp', 'acq_datetime']
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def parse_image_name(filename):
+    """
+    Recover the detection of an extracted image or patch from its filename.
+
+    Args:
+        filename (str): e.g. '40.21391_46.64083_2024-01-20.png' or
+                        '40.21391_46.64083_n_patch_3.png'.
+
+    Returns:
+        dict or None: 'source' (stem of the extracted image), 'latitude', 'longitude',
+                      'acq_date' (or None) and 'patch' (or None); None for other names.
+    """
+    match = IMAGE_NAME.match(os.path.splitext(os.path.basename(filename))[0])
+    if match is None:
+        return None
+    parsed = match.groupdict()
+    parsed['latitude'] = float(parsed['latitude'])
+    parsed['longitude'] = float(parsed['longitude'])
+    parsed['patch'] = int(parsed['patch']) if parsed['patch'] else None
+    return parsed
+
+def perceptual_hash(image, hash_size=8):
+    """
+    Compute the DCT perceptual hash (pHash) of an image.
+
+    The image is reduced to a (4 * hash_size)² grayscale thumbnail, and each bit of the
+    hash tells whether one of the lowest-frequency DCT coefficients is above their median.
+    Near-duplicates (re-encoded, slightly shifted or re-enhanced crops of the same scene)
+    differ in only a few bits.
+
+    Args:
+        image (numpy.ndarray): BGR or grayscale image.
+        hash_size (int, optional): Side of the coefficient block; 8 gives 64-bit hashes.
+
+    Returns:
+        int: The hash as an unsigned 64-bit integer.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    side = 4 * hash_size
+    small = cv2.resize(image, (side, side), interpolation=cv2.INTER_AREA).astype(np.float32)
+    block = cv2.dct(small)[:hash_size, :hash_size].ravel()
+    # The DC term only reflects mean brightness and would dominate the median.
+    bits = block > np.median(block[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+def _hash_file(path):
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    return None if image is None else perceptual_hash(image)
+
+def hamming_distance(a, b):
+    """
+    Number of differing bits between 64-bit hashes, element-wise.
+
+    Args:
+        a (numpy.ndarray): uint64 hashes.
+        b (numpy.ndarray): uint64 hashes, broadcastable against `a`.
+
+    Returns:
+        numpy.ndarray: Distances as integers.
+    """
+    xor = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+        return np.bitwise_count(xor)
+    return _POPCOUNT[xor[..., None].view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+def _roots(parent, nodes):
+    """Vectorized union-find lookup, compressing the paths of `nodes`."""
+    roots = parent[nodes]
+    while True:
+        up = parent[roots]
+        if (up == roots).all():
+            break
+        roots = up
+    parent[nodes] = roots
+    return roots
+
+def _union_pairs(parent, a, b):
+    # Hook the larger root of every unjoined pair onto the smallest root paired with it,
+    # all pairs at once, until every pair shares a root. Roots only ever point to smaller
+    # indices, so no cycles form.
+    while len(a):
+        root_a, root_b = _roots(parent, a), _roots(parent, b)
+        todo = root_a != root_b
+        a, b = a[todo], b[todo]
+        low, high = np.minimum(root_a[todo], root_b[todo]), np.maximum(root_a[todo], root_b[todo])
+        np.minimum.at(parent, high, low)
+
+def near_duplicate_groups(hashes, max_distance=6, block=1 << 22):
+    """
+    Group hashes that are within `max_distance` bits of each other, transitively.
+
+    Identical hashes are merged first. Instead of comparing all remaining pairs, the 64
+    bits are split into `max_distance + 1` bands: two hashes within the distance agree
+    exactly on at least one band, so only hashes sharing a band value are compared, in
+    slices of at most `block` pairs.
+
+    Args:
+        hashes (numpy.ndarray): uint64 hashes.
+        max_distance (int, optional): Largest Hamming distance of near-duplicates.
+                                      Defaults to 6.
+        block (int, optional): Maximum number of pairs compared at once. Defaults to 4M.
+
+    Returns:
+        numpy.ndarray: Group id of every hash, the smallest index of its group.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    unique, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    parent = np.arange(len(unique))
+    bands = max_distance + 1
+    widths = [64 // bands + (i < 64 % bands) for i in range(bands)]
+
+    shift = 0
+    for width in widths:
+        values = (unique >> np.uint64(shift)) & np.uint64((1 << width) - 1)
+        shift += width
+        order = np.argsort(values, kind='stable')
+        bounds = np.flatnonzero(np.diff(values[order])) + 1
+        for members in np.split(order, bounds):
+            rows = max(1, block // len(members))
+            for start in range(0, len(members) - 1, rows):
+                block_rows = members[start:start + rows]
+                distance = hamming_distance(unique[block_rows, None], unique[None, members])
+                close = distance <= max_distance
+                # Every row matches itself; skip the block when nothing else is close.
+                if np.count_nonzero(close) == len(block_rows):
+                    continue
+                i, j = np.nonzero(close)
+                later = j > i + start
+                _union_pairs(parent, members[i[later] + start], members[j[later]])
+
+    roots = _roots(parent, np.arange(len(unique)))
+    # Name every group after the smallest original index among its members.
+    group_first = np.full(len(unique), len(hashes), dtype=np.int64)
+    np.minimum.at(group_first, roots, first)
+    return group_first[roots][inverse]
+
+def _join_firms(index, firms):
+    """Attach the attributes of the most confident matching FIRMS detection to every row."""
+    firms = firms.assign(_lat=firms['latitude'].round(5), _lon=firms['longitude'].round(5),
+                         _date=pd.to_datetime(firms['acq_date']).dt.strftime('%Y-%m-%d'))
+    firms = firms.sort_values(['confidence_level', 'frp'], ascending=False)
+    columns = [c for c in FIRMS_ATTRIBUTES if c in firms]
+    index = index.assign(_lat=index['latitude'].round(5), _lon=index['longitude'].round(5))
+
+    # Dated names match on the full event key, undated ones on the location alone.
+    dated = firms.drop_duplicates(['_lat', '_lon', '_date'])[['_lat', '_lon', '_date'] + columns]
+    located = firms.drop_duplicates(['_lat', '_lon'])[['_lat', '_lon'] + columns]
+    by_key = index.merge(dated, how='left', left_on=['_lat', '_lon', 'acq_date'],
+                         right_on=['_lat', '_lon', '_date'])
+    by_location = index.merge(located, how='left', on=['_lat', '_lon'])
+    for column in columns:
+        index[column] = np.where(index['acq_date'].notna(), by_key[column], by_location[column])
+    if 'acq_datetime' in columns:
+        matched = pd.to_datetime(index['acq_datetime']).dt.strftime('%Y-%m-%d')
+        index['acq_date'] = index['acq_date'].where(index['acq_date'].notna(), matched)
+    return index.drop(columns=['_lat', '_lon'])
+
+def build_dataset_index(image_dir, categories=("no_fire", "fire"), firms=None,
+                        detection_map=None, block_size=0.5, index_path=None, num_workers=8):
+    """
+    Index the images of a class-folder dataset with their detection, FIRMS attributes and pHash.
+
+    Workflow:
+        1. **Scanning**:
+           - Every image under `image_dir/<category>` becomes a row with its label (the
+             position of the category, so Fire = 1 by default), and the coordinates, date,
+             source image and patch number parsed from its name (`parse_image_name`).
+           - With `detection_map` (written by `process_event_batch(deduplicate=True)`),
+             tile images are mapped back to their detections.
+
+        2. **FIRMS Attributes**:
+           - With `firms` (e.g. `read_firms(store_dir)`), each row gets the sensor,
+             confidence level, day/night flag, FRP and acquisition time of its detection.
+             Names without a date are matched on location alone and take its date.
+
+        3. **Strata**:
+           - 'region' is a `block_size`-degree grid block and 'season' the meteorological
+             season of the acquisition date, for balance reports and blocked splits.
+
+        4. **Perceptual Hashes**:
+           - 'phash' holds the DCT hash of every image (`perceptual_hash`), computed on
+             `num_workers` threads. With `index_path`, hashes of files whose size and mtime
+             are unchanged since the previous index are reused, so a refresh only reads new
+             images; the new index is then written back to `index_path`.
+
+    Args:
+        image_dir (str): Dataset root with one subfolder per category.
+        categories (tuple, optional): Subfolders in label order. Defaults to ('no_fire', 'fire').
+        firms (pd.DataFrame, optional): Normalized FIRMS detections. Defaults to None.
+        detection_map (str | pd.DataFrame, optional): 'detection_image_map.csv' of a planned
+                                                      extraction. Defaults to None.
+        block_size (float, optional): Side of the region blocks in degrees. Defaults to 0.5.
+        index_path (str, optional): CSV file of the index, reused and rewritten. Defaults to None.
+        num_workers (int, optional): Hashing threads. Defaults to 8.
+
+    Returns:
+        pd.DataFrame: One row per image with 'path', 'category', 'label', 'source', 'patch',
+                      'latitude', 'longitude', 'acq_date', 'region', 'season', 'phash'
+                      (hexadecimal), 'size', 'mtime_ns' and, with `firms`, the FIRMS attributes.
+    """
+    rows = []
+    for label, category in enumerate(categories):
+        folder = os.path.join(image_dir, category)
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            row = {'path': entry.path, 'category': category, 'label': label,
+                   'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            stem = os.path.splitext(entry.name)[0]
+            row.update(parse_image_name(entry.name) or {
+                'source': PATCH_SUFFIX.sub('', stem), 'latitude': np.nan, 'longitude': np.nan,
+                'acq_date': None, 'patch': None})
+            rows.append(row)
+    index = pd.DataFrame(rows, columns=['path', 'category', 'label', 'source', 'patch',
+                                        'latitude', 'longitude', 'acq_date', 'size', 'mtime_ns'])
+
+    if detection_map is not None:
+        mapping = pd.read_csv(detection_map) if isinstance(detection_map, str) else detection_map
+        mapping = mapping.dropna(subset=['image_path'])
+        mapping = mapping.assign(source=mapping['image_path'].map(
+            lambda p: os.path.splitext(os.path.basename(p))[0])).drop_duplicates('source')
+        mapped = index[['source']].merge(mapping, how='left', on='source')
+        for column in ('latitude', 'longitude', 'acq_date'):
+            values = mapped[column] if column != 'acq_date' else (
+                pd.to_datetime(mapped[column]).dt.strftime('%Y-%m-%d'))
+            index[column] = values.where(mapped['image_path'].notna(), index[column])
+
+    unlocated = index['latitude'].isna().sum()
+    if unlocated:
+        print(f"{unlocated} images could not be linked to a detection")
+
+    if firms is not None:
+        index = _join_firms(index, firms)
+
+    index['region'] = [f"{np.floor(lat / block_size):.0f}_{np.floor(lon / block_size):.0f}"
+                       if not np.isnan(lat) else None
+                       for lat, lon in zip(index['latitude'], index['longitude'])]
+    index['season'] = pd.to_datetime(index['acq_date']).dt.month.map(SEASONS)
+
+    previous = {}
+    if index_path is not None and os.path.exists(index_path):
+        old = pd.read_csv(index_path, usecols=['path', 'size', 'mtime_ns', 'phash'], dtype={'phash': str})
+        previous = {(p, s, m): h for p, s, m, h in old.itertuples(index=False) if isinstance(h, str)}
+    hashes = [previous.get(key) for key in zip(index['path'], index['size'], index['mtime_ns'])]
+    missing = [i for i, h in enumerate(hashes) if h is None]
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        for i, value in zip(missing, executor.map(_hash_file, index['path'].iloc[missing])):
+            hashes[i] = None if value is None else f"{value:016x}"
+    index['phash'] = hashes
+    print(f"Indexed {len(index)} images, hashed {len(missing)} new or changed")
+
+    if index_path is not None:
+        directory = os.path.dirname(index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        index.to_csv(index_path, index=False)
+    return index
+
+def balance_report(index, by=('region', 'season', 'sensor', 'confidence_level')):
+    """
+    Count images per class for every value of each attribute.
+
+    Args:
+        index (pd.DataFrame): Index from `build_dataset_index`.
+        by (tuple, optional): Attributes to report. Missing columns are skipped.
+
+    Returns:
+        pd.DataFrame: Rows ('attribute', 'value') with one count column per category,
+                      'total' and 'fire_share' (share of label 1).
+    """
+    reports = []
+    for attribute in by:
+        if attribute not in index:
+            continue
+        counts = pd.crosstab(index[attribute].astype(str), index['category'])
+        counts['total'] = counts.sum(axis=1)
+        fire = index[index['label'] == 1].groupby(index[attribute].astype(str)).size()
+        counts['fire_share'] = fire.reindex(counts.index, fill_value=0) / counts['total']
+        counts.index = pd.MultiIndex.from_product([[attribute], counts.index],
+                                                  names=['attribute', 'value'])
+        reports.append(counts)
+    return pd.concat(reports).fillna(0) if reports else pd.DataFrame()
+
+def remove_near_duplicates(index, max_distance=6, prefer=('confidence_level', 'frp')):
+    """
+    Drop images whose pHash is within `max_distance` bits of another image's.
+
+    One image is kept per group of near-duplicates (see `near_duplicate_groups`): the one
+    ranking highest on `prefer`, then the first by path. Groups mixing fire and no_fire
+    images are reported, as they usually point to label noise.
+
+    Args:
+        index (pd.DataFrame): Index from `build_dataset_index`.
+        max_distance (int, optional): Largest Hamming distance of near-duplicates.
+                                      Defaults to 6.
+        prefer (tuple, optional): Columns ranking the kept image, highest first. Missing
+                                  columns are ignored.
+
+    Returns:
+        pd.DataFrame: The deduplicated index, with a 'duplicates' column counting the
+                      images each kept row stands for.
+    """
+    hashed = index.dropna(subset=['phash'])
+    prefer = [column for column in prefer if column in hashed]
+    hashed = hashed.sort_values(prefer + ['path'], ascending=[False] * len(prefer) + [True])
+    hashes = np.array([int(h, 16) for h in hashed['phash']], dtype=np.uint64)
+    groups = near_duplicate_groups(hashes, max_distance)
+
+    hashed = hashed.assign(_group=groups)
+    mixed = (hashed.groupby('_group')['label'].nunique() > 1).sum()
+    kept = hashed.drop_duplicates('_group').copy()
+    kept['duplicates'] = kept['_group'].map(hashed['_group'].value_counts()) - 1
+    print(f"Removed {len(hashed) - len(kept)} near-duplicates of {len(hashed)} images "
+          f"({mixed} groups mix both classes)")
+    return kept.drop(columns='_group').sort_index()
+
+def spatial_block_folds(index, n_splits=5, group='region', seed=0):
+    """
+    Assign whole spatial blocks to cross-validation folds.
+
+    All images of a block (by default a `block_size` grid cell, so also every patch of
+    a scene) land in the same fold, so neighbouring patches never appear on both sides
+    of a split. Blocks are assigned largest first, each to the fold whose class counts
+    are furthest below an even share, which keeps fold sizes and class ratios close.
+
+    Args:
+        index (pd.DataFrame): Index from `build_dataset_index`.
+        n_splits (int, optional): Number of folds. Defaults to 5.
+        group (str, optional): Column defining the blocks. Defaults to 'region'; use
+                               'source' to only keep each scene together.
+        seed (int, optional): Seed breaking ties between blocks of equal size. Defaults to 0.
+
+    Returns:
+        pd.Series: Fold number of every row of `index`.
+    """
+    blocks = index[group].fillna(index['path']).astype(str)
+    counts = pd.crosstab(blocks, index['label'])
+    if len(counts) < n_splits:
+        raise ValueError(f"Only {len(counts)} blocks for {n_splits} folds; reduce block_size")
+
+    rng = np.random.default_rng(seed)
+    tie_break = rng.permutation(len(counts))
+    order = np.lexsort((tie_break, -counts.sum(axis=1).to_numpy()))
+
+    target = counts.sum(axis=0).to_numpy() / n_splits
+    totals = np.zeros((n_splits, counts.shape[1]))
+    assignment = {}
+    for i in order:
+        block_counts = counts.iloc[i].to_numpy()
+        # Fill the fold with the largest remaining deficit in the classes this block holds.
+        deficit = ((target - totals) * (block_counts > 0)).sum(axis=1)
+        fold = int(np.argmax(deficit))
+        totals[fold] += block_counts
+        assignment[counts.index[i]] = fold
+    return blocks.map(assignment).rename('fold')
+
+def sample_index(index, by=('label',), n=None, strategy='balanced', weights=None, seed=0):
+    """
+    Draw a balanced or stratified subset of the index.
+
+    Args:
+        index (pd.DataFrame): Index from `build_dataset_index`.
+        by (tuple, optional): Columns defining the strata. Defaults to ('label',).
+        n (int, optional): Target number of images. Defaults to the largest balanced
+                           sample for 'balanced' and to all images for 'stratified'.
+        strategy (str, optional): 'balanced' draws the same number from every stratum;
+                                  'stratified' keeps the strata proportions.
+                                  Defaults to 'balanced'.
+        weights (str, optional): Column of sampling weights within strata, e.g. the fire
+                                 probability a model assigns to no_fire images to favour
+                                 hard negatives. Defaults to uniform.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: The sampled rows.
+    """
+    if strategy not in ('balanced', 'stratified'):
+        raise ValueError(f"Unknown strategy: {strategy}")
+    strata = index.groupby(list(by), dropna=False, observed=True)
+    sizes = strata.size()
+    if strategy == 'balanced':
+        per_stratum = sizes.min() if n is None else n // len(sizes)
+        quota = sizes.clip(upper=per_stratum)
+    else:
+        fraction = 1.0 if n is None else min(1.0, n / len(index))
+        quota = (sizes * fraction).round().astype(int)
+
+    rng = np.random.default_rng(seed)
+    samples = []
+    for (_, members), take in zip(strata, quota):
+        if take:
+            p = None
+            if weights is not None:
+                p = members[weights].fillna(0).clip(lower=0).to_numpy(dtype=float) + 1e-9
+                p /= p.sum()
+            samples.append(members.iloc[rng.choice(len(members), int(take), replace=False, p=p)])
+    return pd.concat(samples).sort_index() if samples else index.iloc[:0]
@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pandas as pd
+
+def assign_grid_tiles(fire_df, buffer=0.02):
+    """
+    Snap fire detections onto a regular lat/lon grid.
+
+    The grid cell side is ``2 * buffer`` degrees, so the rectangle that
+    `get_satellite_collection` builds around a cell centre covers the whole cell
+    and therefore every detection that falls inside it.
+
+    Args:
+        fire_df (pd.DataFrame): Fire event data with 'longitude' and 'latitude' columns.
+        buffer (float, optional): Buffer in degrees used for extraction. Defaults to 0.02.
+
+    Returns:
+        tuple: Two integer arrays (tile_row, tile_col) with one entry per row of `fire_df`.
+    """
+    cell = 2 * buffer
+    tile_row = np.floor(fire_df['latitude'].to_numpy(dtype=float) / cell).astype(np.int64)
+    tile_col = np.floor(fire_df['longitude'].to_numpy(dtype=float) / cell).astype(np.int64)
+    return tile_row, tile_col
+
+def plan_extraction_jobs(fire_df, buffer=0.02, window_days=1):
+    """
+    Group fire detections into unique (tile, date-window) extraction jobs.
+
+    Detections that land in the same grid tile on the same `acq_date` would each
+    trigger an identical Earth Engine query and download. This function collapses
+    them into a single job centred on the tile, so every scene is extracted once.
+
+    Workflow:
+        1. **Spatial Indexing**:
+           - Assigns every detection to a grid tile using `assign_grid_tiles`.
+
+        2. **Temporal Keying**:
+           - Normalizes `acq_date` to a calendar day; the extraction window is
+             `acq_date` ± `window_days`, stored as 'start_date' and 'end_date' and
+             searched by the extraction workers (see `event_date_window`).
+
+        3. **Grouping**:
+           - Groups detections by (tile_row, tile_col, acq_date) and emits one job per group.
+
+    Args:
+        fire_df (pd.DataFrame): Fire event data with 'longitude', 'latitude' and 'acq_date' columns.
+        buffer (float, optional): Buffer in degrees around the tile centre. Defaults to 0.02.
+        window_days (int, optional): Days before and after `acq_date` to search. Defaults to 1.
+
+    Returns:
+        tuple:
+            - pd.DataFrame: One row per job with 'job_id', 'latitude', 'longitude' (tile centre),
+              'acq_date', 'start_date', 'end_date' and 'n_detections'.
+            - pd.DataFrame: One row per detection with its original index, coordinates,
+              'acq_date' and the 'job_id' it was assigned to.
+    """
+    cell = 2 * buffer
+    tile_row, tile_col = assign_grid_tiles(fire_df, buffer)
+    acq_date = pd.to_datetime(fire_df['acq_date']).dt.normalize()
+
+    detections = pd.DataFrame({
+        'detection_index': fire_df.index,
+        'latitude': fire_df['latitude'].to_numpy(),
+        'longitude': fire_df['longitude'].to_numpy(),
+        'acq_date': acq_date.to_numpy(),
+        'tile_row': tile_row,
+        'tile_col': tile_col,
+    })
+
+    keys = ['tile_row', 'tile_col', 'acq_date']
+    detections['job_id'] = detections.groupby(keys, sort=True).ngroup()
+
+    jobs = (detections.groupby('job_id')
+            .agg(tile_row=('tile_row', 'first'),
+                 tile_col=('tile_col', 'first'),
+                 acq_date=('acq_date', 'first'),
+                 n_detections=('detection_index', 'size'))
+            .reset_index())
+
+    jobs['latitude'] = ((jobs['tile_row'] + 0.5) * cell).round(5)
+    jobs['longitude'] = ((jobs['tile_col'] + 0.5) * cell).round(5)
+    offset = pd.DateOffset(days=window_days)
+    jobs['start_date'] = (jobs['acq_date'] - offset).dt.strftime('%Y-%m-%d')
+    jobs['end_date'] = (jobs['acq_date'] + offset).dt.strftime('%Y-%m-%d')
+    jobs['acq_date'] = jobs['acq_date'].dt.strftime('%Y-%m-%d')
+
+    jobs = jobs[['job_id', 'latitude', 'longitude', 'acq_date',
+                 'start_date', 'end_date', 'n_detections']]
+    detections['acq_date'] = detections['acq_date'].dt.strftime('%Y-%m-%d')
+    detections = detections.drop(columns=['tile_row', 'tile_col'])
+    return jobs, detections
+
+def write_detection_image_map(detections, job_paths, output_path):
+    """
+    Write the detection → image mapping produced by a planned extraction run.
+
+    Args:
+        detections (pd.DataFrame): Detection table returned by `plan_extraction_jobs`.
+        job_paths (dict): Mapping of job_id to the saved image path (or None if the
+                          job produced no image).
+        output_path (str): Path of the CSV file to write.
+
+    Returns:
+        pd.DataFrame: The detection table with an added 'image_path' column.
+    """
+    mapping = detections.copy()
+    mapping['image_path'] = mapping['job_id'].map(job_paths)
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    mapping.to_csv(output_path, index=False)
+    print(f"Detection map saved at: {output_path}")
+    return mapping
@@ -0,0 +1,306 @@
+import itertools
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+def split_torchvision_model(model, trainable_from):
+    """
+    Split a torchvision classifier into its frozen backbone and a trainable head.
+
+    Works for models with a sequential `features` block followed by global average pooling
+    and a `classifier` (MobileNetV2, EfficientNet). With `trainable_from=18`, MobileNetV2 is
+    split exactly where `make_mobilenetv2_model` in the training notebook stops freezing.
+
+    Args:
+        model (torch.nn.Module): Model with `features` and `classifier` attributes.
+        trainable_from (int): Index of the first trainable block in `model.features`.
+
+    Returns:
+        tuple:
+            - torch.nn.Module: Frozen backbone, `features[:trainable_from]`, in eval mode.
+            - torch.nn.Module: Head: the remaining blocks, pooling, flattening and classifier.
+    """
+    backbone = model.features[:trainable_from].eval()
+    for param in backbone.parameters():
+        param.requires_grad = False
+    head = nn.Sequential(*model.features[trainable_from:], nn.AdaptiveAvgPool2d(1),
+                         nn.Flatten(1), model.classifier)
+    return backbone, head
+
+def torch_forward(module, device=None):
+    """
+    Wrap a PyTorch module as a batch function for `cache_features`.
+
+    Args:
+        module (torch.nn.Module): Frozen module, run in eval mode without autograd.
+        device (str, optional): Device to run on. Defaults to CUDA when available.
+
+    Returns:
+        callable: Maps a batch (tensor or array) to a numpy array of outputs.
+    """
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    module = module.to(device).eval()
+
+    def forward(inputs):
+        with torch.inference_mode():
+            return module(torch.as_tensor(inputs).to(device)).float().cpu().numpy()
+    return forward
+
+def _num_samples(batches):
+    """Number of samples drawn by a DataLoader or a Keras directory iterator, if known."""
+    if hasattr(batches, 'dataset'):
+        # The sampler, not the dataset, decides which samples a DataLoader yields.
+        sampler = getattr(batches, 'batch_sampler', None)
+        sampler = getattr(sampler, 'sampler', None) or getattr(batches, 'sampler', None)
+        return len(sampler) if sampler is not None else len(batches.dataset)
+    return getattr(batches, 'n', None)
+
+def _save(path, array):
+    """Save an array to `path` exactly, without `np.save` appending '.npy'."""
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+def _label_array(labels):
+    """Convert integer, binary float or one-hot labels to an int64 class vector."""
+    labels = np.asarray(labels.cpu() if torch.is_tensor(labels) else labels)
+    if labels.ndim > 1 and labels.shape[1] > 1:
+        return labels.argmax(axis=1).astype(np.int64)
+    return labels.reshape(-1).astype(np.int64)
+
+def cache_features(forward_fn, batches, cache_dir, key=None, dtype=np.float16):
+    """
+    Run the frozen part of a model once over a dataset and store its outputs on disk.
+
+    Workflow:
+        1. **Reuse**:
+           - If `cache_dir` already holds features written with the same `key`, nothing is
+             recomputed.
+
+        2. **Extraction**:
+           - Iterates over `batches` once, in order, and writes `forward_fn(inputs)` to a
+             memory-mapped 'features.npy' and the labels to 'labels.npy'.
+           - Files are written aside and moved into place when complete, and an existing
+             'meta.json' is removed first, so an interrupted run is never reused.
+
+        3. **Metadata**:
+           - Saves the key, sample count, feature shape and extraction time to 'meta.json'.
+
+    Batches must use a deterministic transform (no random augmentation, no shuffling):
+    cached features stand in for every later epoch and fold.
+
+    Args:
+        forward_fn (callable): Maps an input batch to features, e.g. `torch_forward(backbone)`
+                               or a frozen Keras base model's `predict_on_batch`.
+        batches (iterable): Yields (inputs, labels) batches, e.g. a PyTorch `DataLoader` or a
+                            Keras `flow_from_directory` iterator with `shuffle=False`.
+                            Iteration stops after `len(batches)` batches, so endless Keras
+                            iterators are supported.
+        cache_dir (str): Directory of the cache. Created if missing.
+        key (str, optional): Identifies the backbone and transform, e.g.
+                             'mobilenetv2-features17-224'. Caches are reused only when set.
+        dtype (numpy.dtype, optional): Storage type of the features. Defaults to float16.
+
+    Returns:
+        str: `cache_dir`, to be read with `load_features`.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    if key is not None and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get('key') == key:
+                return cache_dir
+
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    features_path = os.path.join(cache_dir, 'features.npy')
+    labels_path = os.path.join(cache_dir, 'labels.npy')
+    num_samples = _num_samples(batches)
+    features, chunks, labels = None, [], []
+    offset = 0
+    start = time.perf_counter()
+
+    for inputs, batch_labels in itertools.islice(iter(batches), len(batches)):
+        output = np.asarray(forward_fn(inputs)).astype(dtype)
+        if num_samples is None:
+            chunks.append(output)
+        else:
+            if features is None:
+                features = np.lib.format.open_memmap(features_path + '.tmp', mode='w+',
+                                                     dtype=dtype,
+                                                     shape=(num_samples,) + output.shape[1:])
+            features[offset:offset + len(output)] = output
+        offset += len(output)
+        labels.append(_label_array(batch_labels))
+
+    if features is not None:
+        shape = features.shape[1:]
+        features.flush()
+        if offset < len(features):
+            # drop_last or a batch sampler yielded fewer samples than preallocated.
+            written = np.array(features[:offset])
+            del features
+            _save(features_path + '.tmp', written)
+        else:
+            del features
+    elif chunks:
+        _save(features_path + '.tmp', np.concatenate(chunks))
+        shape = chunks[0].shape[1:]
+    else:
+        print("No batches to extract features from")
+        return cache_dir
+    _save(labels_path + '.tmp', np.concatenate(labels))
+    os.replace(features_path + '.tmp', features_path)
+    os.replace(labels_path + '.tmp', labels_path)
+
+    elapsed = time.perf_counter() - start
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump({'key': key, 'num_samples': offset, 'feature_shape': list(shape),
+                   'dtype': np.dtype(dtype).name, 'seconds': round(elapsed, 2)}, f, indent=2)
+    os.replace(meta_path + '.tmp', meta_path)
+    print(f"Cached features of {offset} images in {elapsed:.1f}s at: {cache_dir}")
+    return cache_dir
+
+def load_features(cache_dir, mmap=True):
+    """
+    Load features and labels written by `cache_features`.
+
+    Args:
+        cache_dir (str): Cache directory.
+        mmap (bool, optional): Memory-map the features read-only. Defaults to True.
+
+    Returns:
+        tuple:
+            - numpy.ndarray: (N, ...) features.
+            - numpy.ndarray: (N,) int64 labels.
+    """
+    features = np.load(os.path.join(cache_dir, 'features.npy'), mmap_mode='r' if mmap else None)
+    labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+    # Caches written before the features were truncated hold trailing unwritten rows.
+    return features[:len(labels)], labels
+
+def train_head(head, features, labels, train_idx, val_idx, epochs=25, lr=1e-3,
+               weight_decay=0.0, batch_size=64, patience=5, device=None):
+    """
+    Train a classification head on cached backbone features.
+
+    The selected features are moved to the device once; each epoch only runs the head, so
+    an epoch costs a fraction of a full forward pass through the backbone. Uses Adam and
+    cross-entropy like the notebook, with early stopping on validation loss.
+
+    Args:
+        head (torch.nn.Module): Head producing class logits, e.g. from `split_torchvision_model`.
+        features (numpy.ndarray): (N, ...) features from `load_features`.
+        labels (numpy.ndarray): (N,) integer labels.
+        train_idx (array-like): Indices of the training samples.
+        val_idx (array-like): Indices of the validation samples.
+        epochs (int, optional): Maximum number of epochs. Defaults to 25.
+        lr (float, optional): Learning rate. Defaults to 1e-3.
+        weight_decay (float, optional): Adam weight decay. Defaults to 0.0.
+        batch_size (int, optional): Batch size. Defaults to 64.
+        patience (int, optional): Epochs without validation loss improvement before stopping.
+                                  Defaults to 5.
+        device (str, optional): Device to train on. Defaults to CUDA when available.
+
+    Returns:
+        tuple:
+            - torch.nn.Module: Head with the weights of the best validation loss.
+            - dict: Per-epoch 'train_loss', 'val_loss', 'train_acc' and 'val_acc' lists.
+    """
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    head = head.to(device)
+    train_idx, val_idx = np.sort(train_idx), np.sort(val_idx)
+
+    def to_device(idx):
+        x = torch.from_numpy(np.ascontiguousarray(features[idx])).to(device)
+        y = torch.from_numpy(np.asarray(labels)[idx]).to(device)
+        return x, y
+
+    x_train, y_train = to_device(train_idx)
+    x_val, y_val = to_device(val_idx)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = torch.optim.Adam(head.parameters(), lr=lr, weight_decay=weight_decay)
+    metrics = {'train_loss': [], 'val_loss': [], 'train_acc': [], 'val_acc': []}
+    best_loss, best_state, stale = float('inf'), None, 0
+
+    for epoch in range(epochs):
+        head.train()
+        order = torch.randperm(len(x_train), device=device)
+        total_loss, correct = 0.0, 0
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs, targets = x_train[idx].float(), y_train[idx]
+            optimizer.zero_grad()
+            outputs = head(inputs)
+            loss = criterion(outputs, targets)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(idx)
+            correct += (outputs.argmax(1) == targets).sum().item()
+        metrics['train_loss'].append(total_loss / len(x_train))
+        metrics['train_acc'].append(correct / len(x_train))
+
+        head.eval()
+        with torch.inference_mode():
+            outputs = torch.cat([head(x_val[start:start + batch_size].float())
+                                 for start in range(0, len(x_val), batch_size)])
+            val_loss = criterion(outputs, y_val).item()
+            val_acc = (outputs.argmax(1) == y_val).float().mean().item()
+        metrics['val_loss'].append(val_loss)
+        metrics['val_acc'].append(val_acc)
+
+        if val_loss < best_loss:
+            best_loss, stale = val_loss, 0
+            best_state = {k: v.detach().clone() for k, v in head.state_dict().items()}
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+
+    if best_state is not None:
+        head.load_state_dict(best_state)
+    return head, metrics
+
+def sweep_heads(make_head, features, labels, folds, param_grid, **train_kwargs):
+    """
+    Train one head per fold and hyperparameter combination on cached features.
+
+    Args:
+        make_head (callable): Called with one combination's parameters as keyword arguments
+                              (e.g. `dropout`) and returns a fresh head. 'lr' and
+                              'weight_decay' entries are passed to `train_head` instead.
+        features (numpy.ndarray): (N, ...) features from `load_features`.
+        labels (numpy.ndarray): (N,) integer labels.
+        folds (list): (train_idx, val_idx) pairs, e.g. from `StratifiedKFold.split`.
+        param_grid (dict): Parameter name to list of values, e.g.
+                           {'dropout': [0.2, 0.3, 0.5], 'lr': [1e-3, 3e-4]}.
+        **train_kwargs: Further arguments of `train_head`.
+
+    Returns:
+        pd.DataFrame: One row per (fold, combination) with the parameters, 'best_val_loss',
+                      'best_val_acc', 'epochs' and 'seconds'.
+    """
+    names = list(param_grid)
+    rows = []
+    for values in itertools.product(*(param_grid[name] for name in names)):
+        params = dict(zip(names, values))
+        head_params = {k: v for k, v in params.items() if k not in ('lr', 'weight_decay')}
+        fit_params = dict(train_kwargs, **{k: v for k, v in params.items()
+                                           if k in ('lr', 'weight_decay')})
+        for fold_idx, (train_idx, val_idx) in enumerate(folds):
+            start = time.perf_counter()
+            _, metrics = train_head(make_head(**head_params), features, labels,
+                                    train_idx, val_idx, **fit_params)
+            best = int(np.argmin(metrics['val_loss']))
+            rows.append(dict(params, fold=fold_idx,
+                             best_val_loss=metrics['val_loss'][best],
+                             best_val_acc=metrics['val_acc'][best],
+                             epochs=len(metrics['val_loss']),
+                             seconds=time.perf_counter() - start))
+            print(f"Fold {fold_idx} {params}: val_loss={rows[-1]['best_val_loss']:.4f}, "
+                  f"val_acc={rows[-1]['best_val_acc']:.4f} ({rows[-1]['seconds']:.1f}s)")
+    return pd.DataFrame(rows)
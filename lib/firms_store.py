@@ -0,0 +1,187 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Confidence levels shared by MODIS and VIIRS: VIIRS reports them as letters, MODIS as a
+# 0-100 percentage that FIRMS maps to low (< 30), nominal (30-79) and high (>= 80).
+CONFIDENCE_LEVELS = {'l': 0, 'n': 1, 'h': 2}
+
+# Satellite codes of VIIRS detections and the sensor (raw data folder) they belong to.
+VIIRS_SENSORS = {'N': 'suomi_viirs', 'N20': 'j1_viirs', 'N21': 'j2_viirs'}
+
+FIRMS_DTYPES = {
+    'latitude': 'float64',
+    'longitude': 'float64',
+    'brightness': 'float32',
+    'scan': 'float32',
+    'track': 'float32',
+    'acq_time': 'int16',
+    'satellite': 'category',
+    'instrument': 'category',
+    'confidence_pct': 'float32',
+    'confidence_level': 'int8',
+    'version': 'category',
+    'bright_t31': 'float32',
+    'frp': 'float32',
+    'daynight': 'category',
+    'type': 'int8',
+    'source': 'category',
+}
+
+def normalize_firms(df, source=None):
+    """
+    Normalize a raw MODIS or VIIRS FIRMS table to the common typed schema.
+
+    Workflow:
+        1. **Confidence**:
+           - MODIS percentages are kept in 'confidence_pct' and mapped to a level;
+             VIIRS letters (l/n/h) are mapped to the same 'confidence_level' (0/1/2).
+
+        2. **Time**:
+           - 'acq_date' becomes a date, 'acq_time' an integer HHMM, and 'acq_datetime'
+             the combined UTC timestamp.
+
+        3. **Sensor**:
+           - 'sensor' is derived from instrument and satellite ('modis', 'suomi_viirs',
+             'j1_viirs', 'j2_viirs'), and 'year' from the acquisition date.
+
+        4. **Compact Types**:
+           - Measurements become float32, codes int8/int16 and repeated strings categories.
+
+    Args:
+        df (pd.DataFrame): Table read from a FIRMS CSV file.
+        source (str, optional): 'archive' or 'nrt'. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Normalized table.
+    """
+    out = df.copy()
+
+    confidence = out['confidence']
+    if pd.api.types.is_numeric_dtype(confidence):
+        out['confidence_pct'] = confidence.astype('float32')
+        out['confidence_level'] = np.select([confidence < 30, confidence < 80], [0, 1], 2)
+    else:
+        out['confidence_pct'] = np.nan
+        out['confidence_level'] = (confidence.astype(str).str.lower().str[0]
+                                   .map(CONFIDENCE_LEVELS).fillna(1))
+    out = out.drop(columns=['confidence'])
+
+    acq_date = pd.to_datetime(out['acq_date'])
+    out['acq_time'] = pd.to_numeric(out['acq_time'])
+    out['acq_datetime'] = (acq_date
+                           + pd.to_timedelta(out['acq_time'] // 100, unit='h')
+                           + pd.to_timedelta(out['acq_time'] % 100, unit='m'))
+    out['acq_date'] = acq_date.dt.date
+    out['year'] = acq_date.dt.year.astype('int16')
+
+    is_modis = out['instrument'].astype(str).str.upper() == 'MODIS'
+    viirs_sensor = out['satellite'].astype(str).map(VIIRS_SENSORS).fillna('viirs')
+    out['sensor'] = np.where(is_modis, 'modis', viirs_sensor)
+
+    if 'type' not in out:
+        out['type'] = -1
+    out['type'] = out['type'].fillna(-1)
+    out['source'] = source
+    out['version'] = out['version'].astype(str)
+
+    return out.astype(FIRMS_DTYPES)
+
+def read_firms_csv(path):
+    """
+    Read and normalize a single FIRMS CSV file.
+
+    Args:
+        path (str): Path of the CSV file. Files named '*_archive_*' or '*_nrt_*' are tagged
+                    with that source.
+
+    Returns:
+        pd.DataFrame: Normalized table, see `normalize_firms`.
+    """
+    name = os.path.basename(path)
+    source = 'archive' if '_archive_' in name else 'nrt' if '_nrt_' in name else None
+    return normalize_firms(pd.read_csv(path), source=source)
+
+def build_firms_store(raw_dir, store_dir):
+    """
+    Convert every FIRMS CSV under a folder into a Parquet dataset partitioned by sensor and year.
+
+    Each CSV is parsed once, normalized with `read_firms_csv`, and all tables are
+    concatenated in a single step. Partitions present in the new data replace the
+    existing ones, so the store can be rebuilt in place.
+
+    Args:
+        raw_dir (str): Folder searched recursively for CSV files, e.g. 'data/raw'.
+        store_dir (str): Output directory of the Parquet dataset.
+
+    Returns:
+        int: Number of detections written.
+    """
+    paths = sorted(os.path.join(root, name)
+                   for root, _, names in os.walk(raw_dir)
+                   for name in names if name.endswith('.csv'))
+    tables = [read_firms_csv(path) for path in paths]
+    if not tables:
+        print(f"No CSV files found in {raw_dir}")
+        return 0
+    combined = pd.concat(tables, ignore_index=True)
+
+    ds.write_dataset(
+        pa.Table.from_pandas(combined, preserve_index=False),
+        store_dir,
+        format='parquet',
+        partitioning=ds.partitioning(
+            pa.schema([('sensor', pa.string()), ('year', pa.int16())]), flavor='hive'),
+        existing_data_behavior='delete_matching',
+    )
+    print(f"FIRMS store saved at: {store_dir} ({len(combined)} detections from {len(paths)} files)")
+    return len(combined)
+
+def read_firms(store_dir, start_date=None, end_date=None, bbox=None, min_confidence=None,
+               daynight=None, sensors=None, columns=None):
+    """
+    Load the detections matching the given predicates from a FIRMS Parquet store.
+
+    Filters are pushed down to the Parquet reader: partitions of other sensors or years
+    are never opened, and row groups are pruned by their column statistics.
+
+    Args:
+        store_dir (str): Directory written by `build_firms_store`.
+        start_date (str, optional): First acquisition date to include, 'YYYY-MM-DD'.
+        end_date (str, optional): Last acquisition date to include, 'YYYY-MM-DD'.
+        bbox (tuple, optional): (west, south, east, north) bounds in degrees.
+        min_confidence (str, optional): Lowest confidence level kept: 'l', 'n' or 'h'.
+        daynight (str, optional): 'D' or 'N'.
+        sensors (list, optional): Sensors to include, e.g. ['suomi_viirs', 'j1_viirs'].
+        columns (list, optional): Columns to load. Defaults to all.
+
+    Returns:
+        pd.DataFrame: Matching detections.
+    """
+    dataset = ds.dataset(store_dir, format='parquet', partitioning='hive')
+    conditions = []
+
+    if start_date is not None:
+        start = pd.Timestamp(start_date)
+        conditions += [ds.field('year') >= start.year, ds.field('acq_date') >= start.date()]
+    if end_date is not None:
+        end = pd.Timestamp(end_date)
+        conditions += [ds.field('year') <= end.year, ds.field('acq_date') <= end.date()]
+    if bbox is not None:
+        west, south, east, north = bbox
+        conditions += [ds.field('longitude') >= west, ds.field('longitude') <= east,
+                       ds.field('latitude') >= south, ds.field('latitude') <= north]
+    if min_confidence is not None:
+        conditions.append(ds.field('confidence_level') >= CONFIDENCE_LEVELS[min_confidence])
+    if daynight is not None:
+        conditions.append(ds.field('daynight') == daynight)
+    if sensors is not None:
+        conditions.append(ds.field('sensor').isin(list(sensors)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
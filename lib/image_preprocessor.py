@@ -1,80 +1,557 @@
+import hashlib
+import json
 import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import cv2
 import numpy as np
 
-def apply_clahe_rgb(image, clip_limit=2.0, tile_grid=(8, 8)):
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+MANIFEST_FILE = "manifest.json"
+
+# Normalization of the ImageNet-pretrained torchvision backbones.
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+_clahe_local = threading.local()
+
+def _usable_cpus():
+    """CPUs this process may run on, which can be fewer than the machine has."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def get_clahe(clip_limit=2.0, tile_grid=(8, 8)):
+    """
+    Return the calling thread's CLAHE object for the given parameters.
+
+    `cv2.CLAHE` objects are not thread-safe, so each thread keeps its own, created once
+    per (clip_limit, tile_grid) instead of on every call.
+
+    Args:
+        clip_limit (float): Threshold for contrast limiting.
+        tile_grid (tuple): Size of grid for histogram equalization.
+
+    Returns:
+        cv2.CLAHE: The cached CLAHE object.
+    """
+    objects = _clahe_local.__dict__.setdefault('objects', {})
+    key = (float(clip_limit), tuple(tile_grid))
+    clahe = objects.get(key)
+    if clahe is None:
+        clahe = objects[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid))
+    return clahe
+
+def _equalize_into(image, clahe, out, buffers=None):
+    """
+    Equalize one image into `out`, touching only the L channel of color images.
+
+    `buffers` is a dict reused between calls of the same thread for the LAB and L planes;
+    without it they are allocated for this call only.
+    """
+    if image.ndim == 2:
+        return clahe.apply(image, dst=out)
+    if image.shape[2] == 1:
+        clahe.apply(image[:, :, 0], dst=out[:, :, 0])
+        return out
+
+    h, w = image.shape[:2]
+    if buffers is None:
+        buffers = {}
+    if buffers.get('shape') != (h, w):
+        buffers.update(shape=(h, w), lab=np.empty((h, w, 3), np.uint8),
+                       l=np.empty((h, w), np.uint8), l_eq=np.empty((h, w), np.uint8))
+    lab, l, l_eq = buffers['lab'], buffers['l'], buffers['l_eq']
+    cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=lab)
+    cv2.extractChannel(lab, 0, dst=l)
+    clahe.apply(l, dst=l_eq)
+    cv2.insertChannel(l_eq, lab, 0)
+    return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=out)
+
+def apply_clahe_rgb(image, clip_limit=2.0, tile_grid=(8, 8), out=None):
     """
     Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) 
     to the L-channel of the LAB color space of an RGB image.
 
+    Only the L plane is extracted and written back; grayscale images (2D or single
+    channel) are equalized directly, without a color conversion.
+
     Args:
-        image (numpy.ndarray): Input image in BGR format.
+        image (numpy.ndarray): Input image in BGR format, or a grayscale image.
         clip_limit (float): Threshold for contrast limiting.
         tile_grid (tuple): Size of grid for histogram equalization.
+        out (numpy.ndarray, optional): Preallocated output of the same shape and dtype.
 
     Returns:
         numpy.ndarray: Image with enhanced contrast in BGR format.
     """
-    clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid)
-    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
-    l_eq = clahe.apply(l)
-    lab_eq = cv2.merge((l_eq, a, b))
-    return cv2.cvtColor(lab_eq, cv2.COLOR_LAB2BGR)
+    out = np.empty_like(image) if out is None else out
+    return _equalize_into(image, get_clahe(clip_limit, tile_grid), out)
+
+def apply_clahe_batch(images, clip_limit=2.0, tile_grid=(8, 8), tile_size=None, out=None,
+                      num_workers=None):
+    """
+    Apply `apply_clahe_rgb` to a stack of images or to every cell of a tiled mosaic.
+
+    Images are processed on a thread pool (OpenCV releases the GIL). Each thread reuses
+    its CLAHE object and its LAB/L buffers across images, and results are written into a
+    single preallocated output array. Threads are capped at the usable CPUs and the number
+    of images; with one thread left the images are processed in the calling thread.
+
+    Args:
+        images (numpy.ndarray): (N, H, W, C) or (N, H, W) stack, or with `tile_size`, one
+                                (H, W, C) mosaic of tile_size x tile_size cells.
+        clip_limit (float): Threshold for contrast limiting.
+        tile_grid (tuple): Size of grid for histogram equalization, per image or cell.
+        tile_size (int, optional): Cell size of a mosaic; each cell is equalized on its own.
+        out (numpy.ndarray, optional): Preallocated output of the same shape as `images`.
+        num_workers (int, optional): Maximum number of threads. Defaults to the usable
+                                     CPU count.
+
+    Returns:
+        numpy.ndarray: Enhanced images, same shape as `images`.
+    """
+    images = np.asarray(images)
+    out = np.empty_like(images) if out is None else out
+    if tile_size is None:
+        items = [(images[i], out[i]) for i in range(len(images))]
+    else:
+        h, w = images.shape[:2]
+        items = [(images[y:y + tile_size, x:x + tile_size], out[y:y + tile_size, x:x + tile_size])
+                 for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+
+    cpus = _usable_cpus()
+    num_workers = min(num_workers or cpus, cpus, len(items))
+    if num_workers <= 1:
+        buffers = {}
+        for image, target in items:
+            _equalize_into(image, get_clahe(clip_limit, tile_grid), target, buffers)
+        return out
+
+    local = threading.local()
+
+    def equalize(item):
+        if not hasattr(local, 'buffers'):
+            local.buffers = {}
+        _equalize_into(item[0], get_clahe(clip_limit, tile_grid), item[1], local.buffers)
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(equalize, items))
+    return out
+
+def apply_clahe_tiled(image, clip_limit=2.0, tile_grid=(8, 8), block_size=4096, out=None,
+                      num_workers=None):
+    """
+    Apply `apply_clahe_rgb` to a large scene block by block, with bounded memory.
+
+    The scene is cut into blocks aligned with the CLAHE tiles that the whole-image call
+    would use, each extended by one tile of overlap on every side. Every block is
+    equalized with the tile grid it spans and only its core is written to `out`. Since
+    CLAHE only interpolates between neighbouring tiles, the result matches the whole-image
+    call (up to interpolation rounding of a few intensity levels) while only a few blocks
+    of LAB buffers are held at a time. `out` may be a
+    `numpy.memmap` for scenes that do not fit in memory. The overlap costs extra work,
+    about ((k + 2) / k)^2 for blocks of k tiles, so keep `block_size` several CLAHE tiles
+    wide.
+
+    Args:
+        image (numpy.ndarray): Scene in BGR format or grayscale, e.g. a memory-mapped array.
+        clip_limit (float): Threshold for contrast limiting.
+        tile_grid (tuple): (columns, rows) of CLAHE tiles over the whole scene, as in
+                           `apply_clahe_rgb`.
+        block_size (int): Approximate block size in pixels, excluding the overlap.
+                          Defaults to 4096.
+        out (numpy.ndarray, optional): Preallocated output of the same shape as `image`.
+        num_workers (int, optional): Threads. Defaults to the CPU count.
+
+    Returns:
+        numpy.ndarray: Enhanced scene.
+    """
+    h, w = image.shape[:2]
+    out = np.empty_like(image) if out is None else out
+    tiles_x, tiles_y = tile_grid
+    # OpenCV reflect-pads scenes not divisible by the grid by (tiles - size % tiles) along
+    # both axes; trailing tiles may then lie in the padding and only serve as neighbours.
+    if h % tiles_y or w % tiles_x:
+        tile_w, tile_h = w // tiles_x + 1, h // tiles_y + 1
+    else:
+        tile_w, tile_h = w // tiles_x, h // tiles_y
+    step_x, step_y = max(1, block_size // tile_w), max(1, block_size // tile_h)
+
+    blocks = [(r, c) for r in range(0, tiles_y, step_y) if r * tile_h < h
+              for c in range(0, tiles_x, step_x) if c * tile_w < w]
+    local = threading.local()
+
+    def equalize(block):
+        r, c = block
+        r0, r1 = max(0, r - 1), min(tiles_y, r + step_y + 1)
+        c0, c1 = max(0, c - 1), min(tiles_x, c + step_x + 1)
+        y0, x0 = r0 * tile_h, c0 * tile_w
+        y1, x1 = min(h, r1 * tile_h), min(w, c1 * tile_w)
+
+        sub = image[y0:y1, x0:x1]
+        pad_y, pad_x = r1 * tile_h - y1, c1 * tile_w - x1
+        if pad_y or pad_x:
+            sub = cv2.copyMakeBorder(sub, 0, pad_y, 0, pad_x, cv2.BORDER_REFLECT_101)
+        else:
+            sub = np.ascontiguousarray(sub)
+
+        if not hasattr(local, 'buffers'):
+            local.buffers, local.result = {}, None
+        if local.result is None or local.result.shape != sub.shape:
+            local.result = np.empty_like(sub)
+        enhanced = _equalize_into(sub, get_clahe(clip_limit, (c1 - c0, r1 - r0)),
+                                  local.result, local.buffers)
+
+        cy0, cy1 = r * tile_h, min(h, (r + step_y) * tile_h)
+        cx0, cx1 = c * tile_w, min(w, (c + step_x) * tile_w)
+        out[cy0:cy1, cx0:cx1] = enhanced[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count() or 1) as executor:
+        list(executor.map(equalize, blocks))
+    return out
+
+def patch_origins(length, patch_size, stride, edge='drop'):
+    """
+    Compute the start offsets of patches along one image axis.
+
+    Args:
+        length (int): Size of the axis in pixels.
+        patch_size (int): Size of each patch along the axis.
+        stride (int): Step between consecutive patches.
+        edge (str): 'drop' ignores the remainder, 'pad' adds a patch covering it (the image
+                    is padded), 'shift' adds a last patch moved inward to end at the border.
+
+    Returns:
+        numpy.ndarray: Start offsets of the patches.
+    """
+    if length < patch_size:
+        return np.zeros(1, dtype=np.int64) if edge in ('pad', 'shift') else np.zeros(0, dtype=np.int64)
+    origins = np.arange(0, length - patch_size + 1, stride)
+    if origins[-1] + patch_size < length and edge in ('pad', 'shift'):
+        last = origins[-1] + stride if edge == 'pad' else length - patch_size
+        origins = np.append(origins, last)
+    return origins
+
+def patch_grid(image, patch_size=256, stride=None):
+    """
+    Return a zero-copy strided view of all patches of an image laid out on a grid.
+
+    Args:
+        image (numpy.ndarray): Input image of shape (H, W, C).
+        patch_size (int): Width and height of each patch.
+        stride (int, optional): Step between patches. Defaults to `patch_size` (no overlap).
+
+    Returns:
+        numpy.ndarray: Read-only view of shape (rows, cols, patch_size, patch_size, C).
+    """
+    stride = stride or patch_size
+    h, w, c = image.shape
+    rows = max(0, (h - patch_size) // stride + 1)
+    cols = max(0, (w - patch_size) // stride + 1)
+    sy, sx, sc = image.strides
+    return np.lib.stride_tricks.as_strided(
+        image,
+        shape=(rows, cols, patch_size, patch_size, c),
+        strides=(stride * sy, stride * sx, sy, sx, sc),
+        writeable=False)
 
-def split_into_patches(image, patch_size=256):
+def split_into_patches(image, patch_size=256, stride=None, edge='drop', return_origins=False):
     """
-    Split an image into non-overlapping square patches.
+    Split an image into square patches.
+
+    Patches are taken from a strided view of the image (see `patch_grid`) instead of being
+    sliced one by one. By default patches do not overlap and incomplete edge patches are
+    skipped; a smaller `stride` gives overlapping patches and `edge` controls how the
+    border remainder is handled.
 
     Args:
-        image (numpy.ndarray): Input image.
+        image (numpy.ndarray): Input image of shape (H, W, C) or (H, W).
         patch_size (int): Width and height of each patch.
+        stride (int, optional): Step between patches. Defaults to `patch_size`.
+        edge (str): Edge policy: 'drop' skips incomplete patches, 'pad' zero-pads the image
+                    so they become complete, 'shift' moves the last row/column of patches
+                    inward so it ends at the border (padding images smaller than a patch).
+        return_origins (bool): Also return the (y, x) pixel origin of every patch.
 
     Returns:
-        list: List of image patches (numpy.ndarray).
-    """
-    patches = []
-    h, w, _ = image.shape
-    for y in range(0, h, patch_size):
-        for x in range(0, w, patch_size):
-            patch = image[y:y + patch_size, x:x + patch_size]
-            if patch.shape[:2] == (patch_size, patch_size):  # Skip incomplete patches
-                patches.append(patch)
+        numpy.ndarray: Array of shape (N, patch_size, patch_size, C). When the patches line up
+                       with the image memory (e.g. a single row) this is a read-only view,
+                       otherwise a single contiguous copy.
+        numpy.ndarray: (N, 2) array of (y, x) origins, only if `return_origins` is True.
+    """
+    if edge not in ('drop', 'pad', 'shift'):
+        raise ValueError(f"Unknown edge policy: {edge}")
+    stride = stride or patch_size
+    squeeze = image.ndim == 2
+    if squeeze:
+        image = image[:, :, np.newaxis]
+
+    h, w, c = image.shape
+    ys = patch_origins(h, patch_size, stride, edge)
+    xs = patch_origins(w, patch_size, stride, edge)
+
+    if edge in ('pad', 'shift'):
+        # 'shift' only needs padding when the image is smaller than a patch.
+        pad_h = max(0, ys[-1] + patch_size - h) if len(ys) else 0
+        pad_w = max(0, xs[-1] + patch_size - w) if len(xs) else 0
+        if pad_h or pad_w:
+            image = np.pad(image, ((0, pad_h), (0, pad_w), (0, 0)))
+
+    if len(ys) == 0 or len(xs) == 0:
+        patches = np.empty((0, patch_size, patch_size, c), dtype=image.dtype)
+    elif edge == 'shift' and ((ys[-1] % stride) or (xs[-1] % stride)):
+        # Shifted edge patches fall off the regular grid: gather them from a window view.
+        windows = np.lib.stride_tricks.sliding_window_view(image, (patch_size, patch_size), axis=(0, 1))
+        patches = windows[ys[:, None], xs[None, :]].reshape(-1, c, patch_size, patch_size)
+        patches = patches.transpose(0, 2, 3, 1)
+    else:
+        grid = patch_grid(image, patch_size, stride)[:len(ys), :len(xs)]
+        patches = grid.reshape(-1, patch_size, patch_size, c)
+
+    if squeeze:
+        patches = patches[..., 0]
+
+    if return_origins:
+        origins = np.stack(np.meshgrid(ys, xs, indexing='ij'), axis=-1).reshape(-1, 2)
+        return patches, origins
     return patches
 
-def preprocess_and_patch(input_dir, output_dir, categories=("fire", "no_fire"), patch_size=256):
+def file_sha1(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-1 digest of a file's content.
+
+    Args:
+        path (str): Path of the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(output_dir, params):
+    """
+    Load the preprocessing manifest of an output directory.
+
+    Args:
+        output_dir (str): Directory holding processed patches.
+        params (dict): Preprocessing parameters of the current run.
+
+    Returns:
+        tuple:
+            - dict: Source entries keyed by '<category>/<filename>'. Empty if there is no
+              manifest yet.
+            - bool: True if the manifest was written with the same `params`.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}, True
+    with open(path) as f:
+        manifest = json.load(f)
+    return manifest.get('sources', {}), manifest.get('params') == params
+
+def save_manifest(output_dir, params, sources):
+    """
+    Atomically write the preprocessing manifest of an output directory.
+
+    Args:
+        output_dir (str): Directory holding processed patches.
+        params (dict): Preprocessing parameters used to produce the patches.
+        sources (dict): Source entries keyed by '<category>/<filename>'.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'params': params, 'sources': sources}, f, indent=1)
+    os.replace(tmp_path, path)
+
+def _remove_patches(output_dir, entry):
+    for name in entry.get('patches', []):
+        try:
+            os.remove(os.path.join(output_dir, name))
+        except FileNotFoundError:
+            pass
+
+def preprocess_and_patch(input_dir, output_dir, categories=("fire", "no_fire"), patch_size=256,
+                         clip_limit=2.0, tile_grid=(8, 8), incremental=True):
     """
     Preprocess images in folders by applying CLAHE and splitting into patches.
 
+    With `incremental=True`, a `manifest.json` in `output_dir` records the content hash of
+    every source image, the patches written for it, and the preprocessing parameters
+    (clip_limit, tile_grid, patch_size). Re-runs then only process new or changed images
+    and remove the patches of sources that were deleted. Changing any parameter rebuilds
+    everything. Unchanged size and modification time are trusted without re-hashing.
+
     Args:
         input_dir (str): Path to the root directory containing category subfolders.
         output_dir (str): Directory to save processed patches.
         categories (tuple): Folder names representing class labels.
         patch_size (int): Size of each image patch.
+        clip_limit (float): Threshold for contrast limiting.
+        tile_grid (tuple): Size of grid for histogram equalization.
+        incremental (bool): Skip images already processed with the same parameters.
 
     Returns:
         None
     """
+    params = {'clip_limit': clip_limit, 'tile_grid': list(tile_grid), 'patch_size': patch_size}
+    previous, same_params = load_manifest(output_dir, params) if incremental else ({}, False)
+    if not same_params:
+        for entry in previous.values():
+            _remove_patches(output_dir, entry)
+        previous = {}
+
+    sources = {}
+    processed = skipped = 0
     for category in categories:
         src = os.path.join(input_dir, category)
         dst = os.path.join(output_dir, category)
         os.makedirs(dst, exist_ok=True)
 
         for filename in os.listdir(src):
-            if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
                 continue
 
             img_path = os.path.join(src, filename)
+            rel_path = f"{category}/{filename}"
+            stat = os.stat(img_path)
+            entry = previous.pop(rel_path, None)
+            if entry is not None:
+                if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    sources[rel_path] = entry
+                    skipped += 1
+                    continue
+                content_hash = file_sha1(img_path)
+                if entry['sha1'] == content_hash:
+                    sources[rel_path] = dict(entry, size=stat.st_size, mtime=stat.st_mtime)
+                    skipped += 1
+                    continue
+                _remove_patches(output_dir, entry)
+            else:
+                content_hash = file_sha1(img_path) if incremental else None
+
             image = cv2.imread(img_path)
             if image is None:
                 print(f"Skipping unreadable image: {img_path}")
                 continue
 
-            image_eq = apply_clahe_rgb(image)
+            image_eq = apply_clahe_rgb(image, clip_limit, tile_grid)
             patches = split_into_patches(image_eq, patch_size)
 
+            names = []
             for i, patch in enumerate(patches, 1):
                 out_name = f"{os.path.splitext(filename)[0]}_patch_{i}.png"
                 cv2.imwrite(os.path.join(dst, out_name), patch)
+                names.append(f"{category}/{out_name}")
+
+            sources[rel_path] = {'sha1': content_hash, 'size': stat.st_size,
+                                 'mtime': stat.st_mtime, 'patches': names}
+            processed += 1
+
+    # Whatever is left in the previous manifest no longer exists in input_dir.
+    for entry in previous.values():
+        _remove_patches(output_dir, entry)
+
+    if incremental:
+        save_manifest(output_dir, params, sources)
+        print(f"Processed {processed} images, skipped {skipped} unchanged, "
+              f"removed patches of {len(previous)} deleted sources")
+    elif os.path.exists(os.path.join(output_dir, MANIFEST_FILE)):
+        # A full rebuild invalidates any manifest left by earlier incremental runs.
+        os.remove(os.path.join(output_dir, MANIFEST_FILE))
 
     print("Done")
+
+def _load_and_patch(img_path, patch_size, stride, edge):
+    """
+    Worker for `preprocess_to_store`: read, enhance and patch a single image.
+
+    Returns:
+        tuple or None: (patches, origins), or None if the image could not be read.
+    """
+    image = cv2.imread(img_path)
+    if image is None:
+        return None
+    patches, origins = split_into_patches(apply_clahe_rgb(image), patch_size, stride=stride,
+                                          edge=edge, return_origins=True)
+    return np.ascontiguousarray(patches), origins
+
+def preprocess_to_store(input_dir, output_dir, categories=("fire", "no_fire"), patch_size=256,
+                        stride=None, edge='drop', max_workers=None, shard_size=4096):
+    """
+    Preprocess images in folders in parallel and stream the patches into a packed store.
+
+    Same preprocessing as `preprocess_and_patch` (CLAHE, then patching), but images are
+    decoded and enhanced on a process pool and the patches are written into a few
+    `.npy` shards with an index (see `lib.patch_store`) instead of one PNG per patch.
+    At most `2 * max_workers` images are in flight, so memory use stays bounded.
+    Read the result back with `PatchStore(output_dir)`.
+
+    Workers beyond the usable CPUs or the number of images cannot run at the same time,
+    so `max_workers` is capped at both. With a single worker left, images are processed
+    in this process: the pool would only add process startup and the pickling of every
+    image's patches.
+
+    Args:
+        input_dir (str): Path to the root directory containing category subfolders.
+        output_dir (str): Directory of the patch store.
+        categories (tuple): Folder names representing class labels.
+        patch_size (int): Size of each image patch.
+        stride (int, optional): Step between patches. Defaults to `patch_size`.
+        edge (str): Edge policy passed to `split_into_patches`. Defaults to 'drop'.
+        max_workers (int, optional): Maximum number of worker processes. Defaults to the
+                                     usable CPU count.
+        shard_size (int): Maximum number of patches per shard file.
+
+    Returns:
+        int: Number of patches written.
+    """
+    from lib.patch_store import PatchStoreWriter
+
+    jobs = []
+    for category in categories:
+        src = os.path.join(input_dir, category)
+        for filename in sorted(os.listdir(src)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                jobs.append((os.path.join(src, filename), category))
+
+    writer = PatchStoreWriter(output_dir, patch_size, shard_size=shard_size)
+    cpus = _usable_cpus()
+    max_workers = min(max_workers or cpus, cpus, len(jobs))
+    if max_workers <= 1:
+        for img_path, category in jobs:
+            _write_result(writer, img_path, category,
+                          _load_and_patch(img_path, patch_size, stride, edge))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = deque()
+            for img_path, category in jobs:
+                in_flight.append((img_path, category, executor.submit(
+                    _load_and_patch, img_path, patch_size, stride, edge)))
+                if len(in_flight) < 2 * max_workers:
+                    continue
+                _write_next(writer, in_flight)
+            while in_flight:
+                _write_next(writer, in_flight)
+
+    total = writer.close()
+    print(f"Done: {total} patches from {len(jobs)} images")
+    return total
+
+def _write_next(writer, in_flight):
+    img_path, category, future = in_flight.popleft()
+    _write_result(writer, img_path, category, future.result())
+
+def _write_result(writer, img_path, category, result):
+    if result is None:
+        print(f"Skipping unreadable image: {img_path}")
+        return
+    patches, origins = result
+    writer.add(patches, img_path, category, origins)
@@ -2,11 +2,46 @@ import os
 import ee
 import pandas as pd
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from lib.utils import download_image, save_image, generate_download_url
+from functools import partial
+from lib.utils import download_image, save_image, generate_download_url, generate_array_download_url
+from lib.band_arrays import CLOUD_MASK_BAND, parse_npy_download, save_band_array
+from lib.event_planner import plan_extraction_jobs, write_detection_image_map
+from lib.job_store import (ExtractionJobStore, event_key, expire_no_imagery, STATUS_PENDING,
+                           STATUS_DONE, STATUS_FAILED, STATUS_NO_IMAGERY,
+                           DEFAULT_RETRY_NO_IMAGERY_DAYS)
+from lib.collection_cache import CollectionCache, collection_cache_key
+from lib.async_extraction import run_async_extraction
+from lib.instrumentation import Instrumentation, stage, set_reason, log
+
+DEFAULT_COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+DEFAULT_MAX_CLOUD = 10
+
+# Visible, near-infrared and SWIR bands; B11/B12 separate active fire from smoke best.
+DEFAULT_ARRAY_BANDS = ['B2', 'B3', 'B4', 'B8', 'B11', 'B12']
+
+# Sentinel-2 scene classification (SCL) values treated as cloudy:
+# cloud shadow, medium and high probability cloud, thin cirrus.
+CLOUDY_SCL_CLASSES = [3, 8, 9, 10]
+
+def _bounding_box(longitude, latitude, buffer):
+    return [longitude - buffer, latitude - buffer, longitude + buffer, latitude + buffer]
+
+def _is_known_empty(filtered_collection, key, cache, check_size, end_date):
+    """
+    Tells whether a filtered collection is empty, using the cache before asking Earth Engine.
+    """
+    size = cache.get(key) if cache is not None else None
+    if size is None and check_size:
+        with stage('size_check'):
+            size = filtered_collection.size().getInfo()
+        if cache is not None:
+            cache.set(key, size, end_date)
+    return size == 0
 
 def get_satellite_collection(longitude, latitude, start_date, end_date,
-                             collection = 'COPERNICUS/S2_SR_HARMONIZED',
-                             buffer=0.02, bands=['B4', 'B3', 'B2']):
+                             collection = DEFAULT_COLLECTION,
+                             buffer=0.02, bands=['B4', 'B3', 'B2'], max_cloud=DEFAULT_MAX_CLOUD,
+                             cache=None, check_size=True):
     """
     Retrieves a median composite satellite image for a given location and time range.
 
@@ -14,6 +49,12 @@ def get_satellite_collection(longitude, latitude, start_date, end_date,
     date range, and cloud coverage. It normalizes pixel values and clips the images to a
     rectangular region around the specified coordinates.
 
+    Checking whether the filtered collection is empty costs a blocking `size().getInfo()`
+    round trip. A `CollectionCache` remembers these sizes between runs, including empty
+    results. With `check_size=False` the round trip is skipped altogether (unless the cache
+    already knows the query is empty) and emptiness surfaces later, when the thumbnail of
+    the band-less composite is requested; see `is_empty_image_error`.
+
     Args:
         longitude (float): Longitude of the fire event.
         latitude (float): Latitude of the fire event.
@@ -25,6 +66,11 @@ def get_satellite_collection(longitude, latitude, start_date, end_date,
                                   Defaults to 0.02.
         bands (list, optional): List of bands to select for visualization. Defaults to
                                 ['B4', 'B3', 'B2'].
+        max_cloud (float, optional): Maximum CLOUDY_PIXEL_PERCENTAGE of the scenes kept.
+                                     Defaults to 10.
+        cache (CollectionCache, optional): Cache of collection sizes. Defaults to None.
+        check_size (bool, optional): Ask Earth Engine whether the collection is empty before
+                                     building the composite. Defaults to True.
 
     Returns:
         ee.Image or None: The median composite satellite image clipped to the geometry
@@ -32,110 +78,381 @@ def get_satellite_collection(longitude, latitude, start_date, end_date,
         ee.Geometry: The rectangular bounding box used for clipping.
 
     """
-    geometry = ee.Geometry.Rectangle([
-        longitude - buffer,
-        latitude - buffer,
-        longitude + buffer,
-        latitude + buffer
-    ])
+    bbox = _bounding_box(longitude, latitude, buffer)
+    geometry = ee.Geometry.Rectangle(bbox)
 
     filtered_collection = (ee.ImageCollection(collection)
                            .filterBounds(geometry)
                            .filterDate(start_date, end_date)
-                           .filterMetadata('CLOUDY_PIXEL_PERCENTAGE', 'less_than', 10)
+                           .filterMetadata('CLOUDY_PIXEL_PERCENTAGE', 'less_than', max_cloud)
                            .map(lambda img: img.divide(10000)))  # Normalize
-    if filtered_collection.size().getInfo() == 0:
+
+    key = collection_cache_key(collection, bbox, start_date, end_date, max_cloud)
+    if _is_known_empty(filtered_collection, key, cache, check_size, end_date):
         return None, None
 
     return filtered_collection.median().select(bands).clip(geometry), geometry
 
-def process_single_event(row, output_dir):
+def get_multiband_composite(longitude, latitude, start_date, end_date,
+                            collection=DEFAULT_COLLECTION, buffer=0.02,
+                            bands=DEFAULT_ARRAY_BANDS, max_cloud=DEFAULT_MAX_CLOUD,
+                            cache=None, check_size=True):
     """
-    Processes a single fire event by retrieving satellite imagery and saving it.
+    Retrieves a cloud-masked, multi-band median composite with a per-pixel cloud mask.
 
-    Workflow:
-        1. **Extracting Event Details**:
-           - Extracts longitude, latitude, and acquisition date (`acq_date`) from the fire data row.
-           - These parameters define the geographical area and time window.
+    Same filtering as `get_satellite_collection`, but every scene is masked with its
+    Sentinel-2 scene classification (SCL) band before the median is taken, and a
+    `CLOUD_MASK` band marks pixels without any cloud-free observation. All bands are kept
+    as float reflectance, for export with `generate_array_download_url`.
 
-        2. **Defining the Time Window**:
-           - A temporal window is set from one day before to one day after `acq_date` to ensure a sufficient observation period.
+    Args:
+        longitude (float): Longitude of the fire event.
+        latitude (float): Latitude of the fire event.
+        start_date (str): Start date in 'YYYY-MM-DD' format.
+        end_date (str): End date in 'YYYY-MM-DD' format.
+        collection (str, optional): Earth Engine image collection to use. Must provide an
+                                    'SCL' band. Defaults to 'COPERNICUS/S2_SR_HARMONIZED'.
+        buffer (float, optional): Buffer in degrees to define the rectangular bounding box.
+                                  Defaults to 0.02.
+        bands (list, optional): Bands to keep. Defaults to B2, B3, B4, B8, B11 and B12.
+        max_cloud (float, optional): Maximum CLOUDY_PIXEL_PERCENTAGE of the scenes kept.
+                                     Defaults to 10.
+        cache (CollectionCache, optional): Cache of collection sizes. Defaults to None.
+        check_size (bool, optional): Ask Earth Engine whether the collection is empty before
+                                     building the composite. Defaults to True.
 
-        3. **Satellite Collection Retrieval**:
-           - Calls `get_satellite_collection` with extracted parameters to retrieve the relevant satellite images.
+    Returns:
+        ee.Image or None: The composite with `bands` plus `CLOUD_MASK`, clipped to the
+                          geometry, if available, otherwise None.
+        ee.Geometry: The rectangular bounding box used for clipping.
+    """
+    bbox = _bounding_box(longitude, latitude, buffer)
+    geometry = ee.Geometry.Rectangle(bbox)
 
-        4. **Generating the Image URL**:
-           - Uses `generate_download_url` to obtain a downloadable image URL.
+    def mask_clouds(img):
+        scl = img.select('SCL')
+        clear = scl.neq(CLOUDY_SCL_CLASSES[0])
+        for value in CLOUDY_SCL_CLASSES[1:]:
+            clear = clear.And(scl.neq(value))
+        return img.select(bands).divide(10000).updateMask(clear)
 
-        5. **Downloading the Image**:
-           - Calls `download_image` to fetch the image as bytes.
+    filtered_collection = (ee.ImageCollection(collection)
+                           .filterBounds(geometry)
+                           .filterDate(start_date, end_date)
+                           .filterMetadata('CLOUDY_PIXEL_PERCENTAGE', 'less_than', max_cloud))
 
-        6. **Saving the Image**:
-           - Saves the image locally with a filename based on event coordinates and date using `save_image`.
+    key = collection_cache_key(collection, bbox, start_date, end_date, max_cloud)
+    if _is_known_empty(filtered_collection, key, cache, check_size, end_date):
+        return None, None
+
+    masked = filtered_collection.map(mask_clouds)
+    cloud_mask = masked.select(bands[0]).count().unmask(0).eq(0).rename('CLOUD_MASK')
+    composite = masked.median().unmask(0).addBands(cloud_mask).toFloat()
+    return composite.clip(geometry), geometry
+
+def _record_empty(cache, longitude, latitude, buffer, start_date, end_date):
+    """
+    Stores a negative cache entry for a query found empty at download-URL time.
+    """
+    if cache is not None:
+        cache.set(collection_cache_key(DEFAULT_COLLECTION, _bounding_box(longitude, latitude, buffer),
+                                       start_date, end_date, DEFAULT_MAX_CLOUD), 0, end_date)
+
+def is_empty_image_error(error):
+    """
+    Tells whether an Earth Engine error was caused by a composite without bands.
+
+    The median of an empty collection has no bands, so selecting the visualization bands
+    fails when the thumbnail is requested. Used to detect empty collections when
+    `get_satellite_collection` runs with `check_size=False`.
+
+    Args:
+        error (Exception): Error raised while generating the download URL.
+
+    Returns:
+        bool: True if the error means the filtered collection was empty.
+    """
+    message = str(error)
+    return isinstance(error, ee.EEException) and (
+        'did not match any bands' in message or 'no bands' in message)
+
+def event_date_window(row, window_days=1):
+    """
+    Returns the imagery search window of an event.
+
+    Jobs from `plan_extraction_jobs` carry their window as 'start_date' and 'end_date';
+    other rows search `acq_date` ± `window_days`.
+
+    Args:
+        row (pd.Series): Event or job row with an 'acq_date' field.
+        window_days (int, optional): Days before and after `acq_date` for rows without a
+                                     window. Defaults to 1.
+
+    Returns:
+        tuple: (start_date, end_date) as 'YYYY-MM-DD' strings.
+    """
+    start_date, end_date = row.get('start_date'), row.get('end_date')
+    if pd.notna(start_date) and pd.notna(end_date):
+        return str(start_date), str(end_date)
+    acq_date = pd.to_datetime(row['acq_date'])
+    offset = pd.DateOffset(days=window_days)
+    return (acq_date - offset).strftime('%Y-%m-%d'), (acq_date + offset).strftime('%Y-%m-%d')
+
+def prepare_event_download(row, buffer=0.02, collection_cache=None, check_size=True):
+    """
+    Runs the Earth Engine half of an event extraction and returns the thumbnail URL.
+
+    Split out of `extract_event` so that URL generation (blocking Earth Engine calls) and
+    downloading can run as separate pipelined stages, as in `lib.async_extraction`.
+
+    Args:
+        row (pd.Series): A pandas Series containing fire event data with at least
+                         'longitude', 'latitude', and 'acq_date' fields. Optional
+                         'start_date' and 'end_date' fields set the search window,
+                         see `event_date_window`.
+        buffer (float, optional): Buffer in degrees around the event location.
+                                  Defaults to 0.02.
+        collection_cache (CollectionCache, optional): Cache of collection sizes. Defaults to None.
+        check_size (bool, optional): Run the separate collection size check. Defaults to True.
+
+    Returns:
+        tuple:
+            - str: `STATUS_PENDING` if the URL is ready to download, otherwise
+              `STATUS_NO_IMAGERY` or `STATUS_FAILED`.
+            - str or None: The thumbnail URL.
+            - str or None: The error message for failed events.
+    """
+    try:
+        longitude, latitude = row['longitude'], row['latitude']
+        start_date, end_date = event_date_window(row)
+
+        image, geometry = get_satellite_collection(
+            longitude=longitude,
+            latitude=latitude,
+            start_date=start_date,
+            end_date=end_date,
+            buffer=buffer,
+            cache=collection_cache,
+            check_size=check_size,
+        )
+
+        if not image:
+            return STATUS_NO_IMAGERY, None, None
+
+        try:
+            with stage('download_url'):
+                url = generate_download_url(image, geometry)
+        except ee.EEException as e:
+            if not is_empty_image_error(e):
+                raise
+            _record_empty(collection_cache, longitude, latitude, buffer, start_date, end_date)
+            return STATUS_NO_IMAGERY, None, None
 
+        return STATUS_PENDING, url, None
+
+    except Exception as e:
+        set_reason('earth_engine' if isinstance(e, ee.EEException) else 'error')
+        log(f"Error processing event: {str(e)}", warning=True)
+        return STATUS_FAILED, None, str(e)
+
+def extract_event(row, output_dir, buffer=0.02, collection_cache=None, check_size=True):
+    """
+    Retrieves and saves the satellite image of a single fire event, reporting why it failed.
+
+    This is the worker behind `process_single_event` and `process_event_batch`. Instead of
+    collapsing every outcome to a path or None, it returns a status code so callers can tell
+    events without imagery apart from events that failed and should be retried.
 
     Args:
         row (pd.Series): A pandas Series containing fire event data with at least
-                         'longitude', 'latitude', and 'acq_date' fields.
+                         'longitude', 'latitude', and 'acq_date' fields. Optional
+                         'start_date' and 'end_date' fields set the search window,
+                         see `event_date_window`.
         output_dir (str): The directory where the downloaded image should be saved.
+        buffer (float, optional): Buffer in degrees around the event location.
+                                  Defaults to 0.02.
+        collection_cache (CollectionCache, optional): Cache of collection sizes. Defaults to None.
+        check_size (bool, optional): Run the separate collection size check. Defaults to True.
 
     Returns:
-        str or None: The file path of the saved image if successful, otherwise None.
+        tuple:
+            - str: `STATUS_DONE`, `STATUS_NO_IMAGERY` or `STATUS_FAILED`.
+            - str or None: The file path of the saved image if successful.
+            - str or None: The error message for failed events.
+    """
+    status, url, error = prepare_event_download(row, buffer, collection_cache, check_size)
+    if status != STATUS_PENDING:
+        return status, None, error
+
+    image_content = download_image(url) # bytes
+    if not image_content:
+        return STATUS_FAILED, None, 'download failed'
+
+    output_path = save_image(image_content, output_dir, f"{event_key(row)}.png")
+    if output_path is None:
+        return STATUS_FAILED, None, 'save failed'
+
+    return STATUS_DONE, output_path, None
+
+def extract_event_array(row, output_dir, buffer=0.02, collection_cache=None, check_size=True,
+                        bands=DEFAULT_ARRAY_BANDS, scale=None, dimensions=512):
+    """
+    Retrieves and saves the raw multi-band array and cloud mask of a single fire event.
 
-    Raises:
-        Exception: Logs an error message if any issue occurs during processing.
+    The array counterpart of `extract_event`: instead of an 8-bit RGB thumbnail, the
+    cloud-masked composite of `get_multiband_composite` is downloaded as NPY and saved
+    with `save_band_array`, ready to be memory-mapped with `load_band_array`.
+
+    Args:
+        row (pd.Series): A pandas Series containing fire event data with at least
+                         'longitude', 'latitude', and 'acq_date' fields. Optional
+                         'start_date' and 'end_date' fields set the search window,
+                         see `event_date_window`.
+        output_dir (str): The directory where the arrays should be saved.
+        buffer (float, optional): Buffer in degrees around the event location.
+                                  Defaults to 0.02.
+        collection_cache (CollectionCache, optional): Cache of collection sizes. Defaults to None.
+        check_size (bool, optional): Run the separate collection size check. Defaults to True.
+        bands (list, optional): Bands to export. Defaults to B2, B3, B4, B8, B11 and B12.
+        scale (float, optional): Pixel size in meters, used when `dimensions` is None.
+        dimensions (int | str, optional): Output size in pixels. Defaults to 512.
+
+    Returns:
+        tuple:
+            - str: `STATUS_DONE`, `STATUS_NO_IMAGERY` or `STATUS_FAILED`.
+            - str or None: The path of the saved '.npy' array if successful.
+            - str or None: The error message for failed events.
     """
     try:
         longitude, latitude = row['longitude'], row['latitude']
         acq_date = pd.to_datetime(row['acq_date'])
+        start_date, end_date = event_date_window(row)
 
-        start_date = (acq_date - pd.DateOffset(days=1)).strftime('%Y-%m-%d')
-        end_date = (acq_date + pd.DateOffset(days=1)).strftime('%Y-%m-%d')
-
-        image, geometry = get_satellite_collection(
+        image, geometry = get_multiband_composite(
             longitude=longitude,
             latitude=latitude,
             start_date=start_date,
             end_date=end_date,
+            buffer=buffer,
+            bands=bands,
+            cache=collection_cache,
+            check_size=check_size,
         )
 
         if not image:
-            return None
+            return STATUS_NO_IMAGERY, None, None
+
+        try:
+            with stage('download_url'):
+                url = generate_array_download_url(image, geometry, list(bands) + [CLOUD_MASK_BAND],
+                                                  scale=scale, dimensions=dimensions)
+        except ee.EEException as e:
+            if not is_empty_image_error(e):
+                raise
+            _record_empty(collection_cache, longitude, latitude, buffer, start_date, end_date)
+            return STATUS_NO_IMAGERY, None, None
+
+        content = download_image(url)
+        if not content:
+            return STATUS_FAILED, None, 'download failed'
+
+        array, mask = parse_npy_download(content, bands)
+        meta = {'bands': list(bands), 'bounds': _bounding_box(longitude, latitude, buffer),
+                'acq_date': str(acq_date.date()), 'scale': scale, 'dimensions': dimensions}
+        return STATUS_DONE, save_band_array(array, mask, output_dir, event_key(row), meta), None
 
-        filename = f"{row['latitude']}_{row['longitude']}_{acq_date.date()}.png"
-        output_path = os.path.join(output_dir, filename)
+    except Exception as e:
+        set_reason('earth_engine' if isinstance(e, ee.EEException) else 'error')
+        log(f"Error processing event: {str(e)}", warning=True)
+        return STATUS_FAILED, None, str(e)
 
-        url = generate_download_url(image, geometry)
-        image_content = download_image(url) # bytes
+def process_single_event(row, output_dir, buffer=0.02):
+    """
+    Processes a single fire event by retrieving satellite imagery and saving it.
 
-        if image_content:
-            save_image(image_content, output_dir, filename)
-            return output_path
+    Workflow:
+        1. **Extracting Event Details**:
+           - Extracts longitude, latitude, and acquisition date (`acq_date`) from the fire data row.
+           - These parameters define the geographical area and time window.
 
-        return None
+        2. **Defining the Time Window**:
+           - A temporal window is set from one day before to one day after `acq_date` (or to the row's 'start_date' and 'end_date') to ensure a sufficient observation period.
 
-    except Exception as e:
-        print(f"Error processing event: {str(e)}")
-        return None
+        3. **Satellite Collection Retrieval**:
+           - Calls `get_satellite_collection` with extracted parameters to retrieve the relevant satellite images.
+
+        4. **Generating the Image URL**:
+           - Uses `generate_download_url` to obtain a downloadable image URL.
+
+        5. **Downloading the Image**:
+           - Calls `download_image` to fetch the image as bytes.
+
+        6. **Saving the Image**:
+           - Saves the image locally with a filename based on event coordinates and date using `save_image`.
+
+
+    Args:
+        row (pd.Series): A pandas Series containing fire event data with at least
+                         'longitude', 'latitude', and 'acq_date' fields. Optional
+                         'start_date' and 'end_date' fields set the search window,
+                         see `event_date_window`.
+        output_dir (str): The directory where the downloaded image should be saved.
+        buffer (float, optional): Buffer in degrees around the event location.
+                                  Defaults to 0.02.
 
-def process_event_batch(fire_df, output_dir, max_workers=5):
+    Returns:
+        str or None: The file path of the saved image if successful. None both when no
+                     imagery covers the event and when the extraction failed; use
+                     `extract_event` to get the status and error message.
+
+    Errors are not raised: Earth Engine, download and save failures are logged as warnings
+    by `extract_event` and end in a None return.
+    """
+    _, output_path, _ = extract_event(row, output_dir, buffer)
+    return output_path
+
+def process_event_batch(fire_df, output_dir, max_workers=5, deduplicate=False, buffer=0.02,
+                        job_store=None, return_status=False, collection_cache=None,
+                        check_size=True, use_async=False, max_concurrency=32,
+                        array_options=None, instrumentation=None,
+                        retry_no_imagery_days=DEFAULT_RETRY_NO_IMAGERY_DAYS):
     """
     Processes a batch of fire events concurrently. Uses a thread pool to process multiple fire events simultaneously.
 
     Workflow:
-        1. **Thread Pool Execution**:
+        1. **Planning (optional)**:
+           - With `deduplicate=True`, detections are grouped by `plan_extraction_jobs` into unique
+             (grid tile, acq_date) jobs so that each scene is queried and downloaded only once.
+
+        2. **Resuming (optional)**:
+           - With a `job_store`, events already completed or known to have no imagery are skipped,
+             and every attempt is recorded in the ledger as it finishes.
+           - A 'no_imagery' entry is only final once it was checked `retry_no_imagery_days` after
+             the end of the event's search window (see `lib.job_store.expire_no_imagery`), so
+             recent events whose scene was not ingested yet are retried.
+
+        3. **Thread Pool Execution**:
            - Uses `ThreadPoolExecutor` from `concurrent.futures` to process multiple fire events in parallel.
            - The `max_workers` parameter controls the number of concurrent threads.
-
-        2. **Submitting Tasks**:
-           - Iterates over the fire event dataset (`fire_df`) and submits each row to `process_single_event` for processing.
-
-        3. **Collecting Results**:
-           - Uses `as_completed` to retrieve results as soon as they are available.
-           - Each task processes a single event, and `result()` is used to collect the output.
-
-        4. **Returning Processed Results**:
-           - Returns a list containing file paths of successfully processed images or `None` for failed events.
+           - Rows sharing the same event key are extracted once.
+           - With `use_async=True`, URL generation runs on `max_workers` threads while downloads run
+             on an asyncio pipeline over pooled keep-alive connections, with up to `max_concurrency`
+             requests in flight (see `lib.async_extraction`).
+           - With `array_options`, raw multi-band arrays with a cloud mask are extracted with
+             `extract_event_array` instead of PNG thumbnails.
+
+        4. **Collecting Results**:
+           - Uses `as_completed` to record results as soon as they are available, and places each
+             result at the position of its input row.
+           - With `deduplicate=True`, a `detection_image_map.csv` linking every detection to the image
+             of its job is written to `output_dir`.
+           - With `instrumentation`, every event is traced: per-stage timings (size check, download
+             URL, download, save), bytes, retries and outcome feed the live progress view and the
+             configured sinks (see `lib.instrumentation`).
+
+        5. **Returning Processed Results**:
+           - Returns a list, in input order, containing file paths of successfully processed images
+             or `None` for failed events.
 
     Args:
         fire_df (pd.DataFrame): DataFrame containing fire event data with columns
@@ -143,13 +460,154 @@ def process_event_batch(fire_df, output_dir, max_workers=5):
         output_dir (str): Directory where downloaded images will be saved.
         max_workers (int, optional): The maximum number of concurrent threads.
                                      Defaults to 5.
+        deduplicate (bool, optional): Extract each (tile, date-window) scene only once.
+                                      Defaults to False.
+        buffer (float, optional): Buffer in degrees around each event or tile centre.
+                                  Defaults to 0.02.
+        job_store (str | ExtractionJobStore, optional): Ledger, or path to its SQLite file,
+                                                        used to resume interrupted runs.
+        return_status (bool, optional): Return (path, status) tuples instead of bare paths.
+                                        Defaults to False.
+        collection_cache (str | CollectionCache, optional): Cache, or path to its SQLite file,
+                                                            of collection sizes shared by all events.
+        check_size (bool, optional): Run the separate collection size check for each event.
+                                     Defaults to True.
+        use_async (bool, optional): Use the pipelined asyncio download engine. Defaults to False.
+        max_concurrency (int, optional): Upper bound of the adaptive download concurrency in
+                                         async mode. Defaults to 32.
+        array_options (dict, optional): Extract raw arrays; keyword arguments of
+                                        `extract_event_array` such as 'bands', 'scale' and
+                                        'dimensions' ({} for the defaults). Not supported
+                                        together with `use_async`.
+        instrumentation (bool | Instrumentation, optional): Per-event tracing and progress.
+                                                            True creates one with a progress
+                                                            view and closes it at the end;
+                                                            an instance is left open for the
+                                                            caller to read and close.
+        retry_no_imagery_days (float, optional): Ingestion latency horizon after which a
+                                                 'no_imagery' result is final. None never
+                                                 retries. Defaults to 5.
 
     Returns:
-        list: A list of file paths of successfully saved images, or None for failed events.
-    """
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [
-            executor.submit(process_single_event, row, output_dir)
-            for _, row in fire_df.iterrows()
-        ]
-        return [f.result() for f in as_completed(futures)]
\ No newline at end of file
+        list: File paths of successfully saved images, or None for failed events, in input order.
+              With `return_status=True`, (path, status) tuples where status is one of
+              'done', 'no_imagery' or 'failed'.
+              With `deduplicate=True` the list holds one entry per detection.
+    """
+    if use_async and array_options is not None:
+        raise ValueError("use_async only supports thumbnail extraction, not array_options")
+
+    cache = (CollectionCache(collection_cache) if isinstance(collection_cache, str)
+             else collection_cache)
+    extract_kwargs = {'buffer': buffer, 'collection_cache': cache, 'check_size': check_size}
+    async_options = {'max_concurrency': max_concurrency} if use_async else None
+    instr = Instrumentation() if instrumentation is True else instrumentation or None
+    worker = extract_event if array_options is None else partial(extract_event_array, **array_options)
+    extension = '.png' if array_options is None else '.npy'
+
+    try:
+        if deduplicate:
+            results = _process_planned_batch(fire_df, output_dir, max_workers, job_store,
+                                             worker, extract_kwargs, async_options, instr,
+                                             retry_no_imagery_days, extension)
+        else:
+            results = _run_events(fire_df, output_dir, max_workers, job_store, worker,
+                                  extract_kwargs, async_options, instr, retry_no_imagery_days,
+                                  extension)
+    finally:
+        if isinstance(collection_cache, str):
+            cache.close()
+        if instrumentation is True:
+            instr.close()
+
+    if return_status:
+        return results
+    return [path for path, _ in results]
+
+def _run_events(events_df, output_dir, max_workers, job_store, worker, extract_kwargs,
+                async_options=None, instrumentation=None,
+                retry_no_imagery_days=DEFAULT_RETRY_NO_IMAGERY_DAYS, extension='.png'):
+    """
+    Extracts every row of `events_df`, honouring the ledger, and returns ordered (path, status) tuples.
+    """
+    rows = [row for _, row in events_df.iterrows()]
+    keys = [event_key(row) for row in rows]
+    results = [None] * len(rows)
+
+    store = ExtractionJobStore(job_store) if isinstance(job_store, str) else job_store
+    known = {}
+    if store is not None:
+        windows = {key: event_date_window(row)[1] for key, row in zip(keys, rows)}
+        known = expire_no_imagery(store, store.get_many(set(keys)), windows,
+                                  retry_no_imagery_days)
+
+    # One submission per distinct event key; duplicates share its result.
+    pending = {}
+    for i, key in enumerate(keys):
+        status, path = known.get(key, (None, None))
+        if status == STATUS_DONE and path and os.path.exists(path):
+            results[i] = (path, status)
+        elif status == STATUS_NO_IMAGERY:
+            results[i] = (None, status)
+        else:
+            pending.setdefault(key, []).append(i)
+
+    try:
+        skipped = len(rows) - sum(map(len, pending.values()))
+        if store is not None:
+            print(f"Skipping {skipped} events already in the job store")
+            store.mark_pending([(key, f"{key}{extension}") for key in pending])
+        if instrumentation is not None:
+            instrumentation.add_total(len(pending), skipped)
+
+        def record(key, status, path, error):
+            for i in pending[key]:
+                results[i] = (path, status)
+            if store is not None:
+                store.record(key, status, path, error)
+
+        if async_options is not None:
+            run_async_extraction(
+                [(key, rows[indices[0]]) for key, indices in pending.items()],
+                partial(prepare_event_download, **extract_kwargs), output_dir, record,
+                url_workers=max_workers, instrumentation=instrumentation, **async_options)
+        else:
+            def extract(key, row):
+                if instrumentation is None:
+                    return worker(row, output_dir, **extract_kwargs)
+                with instrumentation.event(key) as trace:
+                    status, path, error = worker(row, output_dir, **extract_kwargs)
+                    trace.status, trace.error = status, error
+                return status, path, error
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(extract, key, rows[indices[0]]): key
+                    for key, indices in pending.items()
+                }
+                for f in as_completed(futures):
+                    record(futures[f], *f.result())
+    finally:
+        if isinstance(job_store, str):
+            store.close()
+
+    return results
+
+def _process_planned_batch(fire_df, output_dir, max_workers, job_store, worker, extract_kwargs,
+                           async_options, instrumentation=None,
+                           retry_no_imagery_days=DEFAULT_RETRY_NO_IMAGERY_DAYS, extension='.png'):
+    """
+    Extracts one image per planned job and maps the results back onto detections.
+    """
+    jobs, detections = plan_extraction_jobs(fire_df, buffer=extract_kwargs['buffer'])
+    print(f"Planned {len(jobs)} extraction jobs for {len(detections)} detections")
+
+    job_results = dict(zip(jobs['job_id'],
+                           _run_events(jobs, output_dir, max_workers, job_store, worker,
+                                       extract_kwargs, async_options, instrumentation,
+                                       retry_no_imagery_days, extension)))
+    job_paths = {job_id: path for job_id, (path, _) in job_results.items()}
+
+    write_detection_image_map(
+        detections, job_paths, os.path.join(output_dir, 'detection_image_map.csv'))
+    return [job_results[job_id] for job_id in detections['job_id']]
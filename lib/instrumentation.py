@@ -0,0 +1,409 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Upper bounds (seconds) of the stage duration histogram buckets.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = 'wildfire_extraction'
+
+_thread_local = threading.local()
+
+class EventTrace:
+    """
+    Timings, byte count, retries and outcome of a single event extraction.
+
+    Stage names used by the library: 'size_check' (collection size `getInfo`),
+    'download_url' (`getThumbURL` / `getDownloadURL`), 'download' and 'save'.
+
+    Args:
+        key (str): Event key, see `lib.job_store.event_key`.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.bytes = 0
+        self.retries = 0
+        self.status = None
+        self.reason = None
+        self.error = None
+        self.seconds = None
+        self.instrumentation = None
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'status': self.status,
+            'reason': self.reason,
+            'error': self.error,
+            'seconds': round(self.seconds, 6) if self.seconds is not None else None,
+            'stages': {name: round(value, 6) for name, value in self.stages.items()},
+            'bytes': self.bytes,
+            'retries': self.retries,
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+
+def current_trace():
+    """Return the trace bound to the calling thread, or None outside an instrumented event."""
+    return getattr(_thread_local, 'trace', None)
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Time a block as stage `name` of the current event. Does nothing without a bound trace.
+
+    Args:
+        name (str): Stage name, e.g. 'download'.
+    """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, time.perf_counter() - start)
+
+def add_bytes(n):
+    """Add `n` transferred bytes to the current event, if any."""
+    trace = current_trace()
+    if trace is not None:
+        trace.bytes += n
+
+def add_retries(n=1):
+    """Add `n` retried requests to the current event, if any."""
+    trace = current_trace()
+    if trace is not None:
+        trace.retries += n
+
+def set_reason(reason):
+    """Set the failure reason of the current event, e.g. 'http_429', if any."""
+    trace = current_trace()
+    if trace is not None:
+        trace.reason = reason
+
+def log(message, warning=False, trace=None):
+    """
+    Print a per-event message without breaking the progress line.
+
+    Inside an instrumented event the message goes to `Instrumentation.log`, which drops
+    informational messages while a progress line is shown and writes warnings above it.
+    Outside one it is printed as before.
+
+    Args:
+        message (str): Message to print.
+        warning (bool, optional): Whether the message reports a failure. Defaults to False.
+        trace (EventTrace, optional): Event the message belongs to. Defaults to the current trace.
+    """
+    trace = trace if trace is not None else current_trace()
+    instrumentation = getattr(trace, 'instrumentation', None)
+    if instrumentation is None:
+        print(message)
+    else:
+        instrumentation.log(message, warning)
+
+def failure_reason(error):
+    """Map an error message of the extraction functions to a short, low-cardinality reason."""
+    if error is None:
+        return None
+    if error.startswith('HTTP '):
+        return 'http_' + error.split()[1]
+    if error in ('download failed', 'save failed'):
+        return error.split()[0]
+    return 'error'
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds, as exposed by Prometheus."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+class ExtractionMetrics:
+    """
+    Aggregate counters and stage histograms over all finished events.
+
+    Attributes:
+        statuses (Counter): Events per status ('done', 'no_imagery', 'failed').
+        reasons (Counter): Failed events per reason.
+        stages (dict): Stage name (and 'total') to `Histogram` of durations.
+        bytes (int): Bytes downloaded.
+        retries (int): Retried requests.
+        skipped (int): Events skipped because the job store already had them.
+    """
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.reasons = Counter()
+        self.stages = {}
+        self.bytes = 0
+        self.retries = 0
+        self.skipped = 0
+
+    @property
+    def finished(self):
+        return sum(self.statuses.values())
+
+    def observe(self, trace):
+        self.statuses[trace.status] += 1
+        if trace.reason is not None:
+            self.reasons[trace.reason] += 1
+        for name, seconds in list(trace.stages.items()) + [('total', trace.seconds)]:
+            self.stages.setdefault(name, Histogram()).observe(seconds)
+        self.bytes += trace.bytes
+        self.retries += trace.retries
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: Text suitable for the node_exporter textfile collector.
+        """
+        lines = [f"# HELP {prefix}_events_total Finished event extractions by status.",
+                 f"# TYPE {prefix}_events_total counter"]
+        lines += [f'{prefix}_events_total{{status="{status}"}} {count}'
+                  for status, count in sorted(self.statuses.items())]
+        lines += [f"# HELP {prefix}_failures_total Failed event extractions by reason.",
+                  f"# TYPE {prefix}_failures_total counter"]
+        lines += [f'{prefix}_failures_total{{reason="{reason}"}} {count}'
+                  for reason, count in sorted(self.reasons.items())]
+        for name, value, help_text in (('skipped_total', self.skipped, 'Events already in the job store.'),
+                                       ('bytes_total', self.bytes, 'Bytes downloaded.'),
+                                       ('retries_total', self.retries, 'Retried requests.')):
+            lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} counter",
+                      f"{prefix}_{name} {value}"]
+        lines += [f"# HELP {prefix}_stage_seconds Duration of each extraction stage.",
+                  f"# TYPE {prefix}_stage_seconds histogram"]
+        for name, histogram in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram.sum:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+class JsonlSink:
+    """
+    Sink appending one JSON line per finished event to a log file.
+
+    Args:
+        path (str): Path of the JSONL file.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a')
+
+    def emit(self, trace):
+        self._file.write(json.dumps(trace.to_dict()) + '\n')
+
+    def flush(self, metrics):
+        self._file.flush()
+
+    def close(self, metrics):
+        self._file.close()
+
+class PrometheusTextSink:
+    """
+    Sink rewriting a Prometheus text-format file with the aggregate metrics.
+
+    The file is replaced atomically, so it can be scraped by the node_exporter textfile
+    collector while a batch is running.
+
+    Args:
+        path (str): Path of the '.prom' file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, trace):
+        pass
+
+    def flush(self, metrics):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(metrics.to_prometheus())
+        os.replace(tmp_path, self.path)
+
+    def close(self, metrics):
+        self.flush(metrics)
+
+class ProgressView:
+    """
+    Single-line live progress: finished events, throughput, ETA and outcome counts.
+
+    Args:
+        stream (file, optional): Output stream. Defaults to `sys.stderr`.
+        interval (float, optional): Minimum seconds between redraws. Defaults to 0.5.
+    """
+
+    def __init__(self, stream=None, interval=0.5):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self._last = 0.0
+
+    def render(self, metrics, total, elapsed):
+        done = metrics.finished
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if total and rate > 0:
+            eta = time.strftime('%H:%M:%S', time.gmtime(max(0, total - done) / rate))
+        else:
+            eta = '--:--:--'
+        counts = ' '.join(f"{status}={count}" for status, count in sorted(metrics.statuses.items()))
+        return f"[{done}/{total or '?'}] {rate:.1f} events/s ETA {eta} {counts}"
+
+    def update(self, metrics, total, elapsed, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        self.stream.write('\r' + self.render(metrics, total, elapsed))
+        self.stream.flush()
+
+    def write(self, message, metrics, total, elapsed):
+        """Write `message` on its own line and redraw the progress line below it."""
+        self.stream.write('\r\x1b[K' + message + '\n')
+        self.update(metrics, total, elapsed, force=True)
+
+    def close(self, metrics, total, elapsed):
+        self.update(metrics, total, elapsed, force=True)
+        self.stream.write('\n')
+        self.stream.flush()
+
+class Instrumentation:
+    """
+    Collects per-event traces of a batch extraction and fans them out to sinks.
+
+    Pass an instance to `process_event_batch(..., instrumentation=...)`. Each event is
+    traced from the worker that extracts it; the library records stage timings, bytes and
+    retries into the trace bound to that thread (see `stage`). Aggregates are available in
+    `metrics` during and after the run.
+
+    Args:
+        sinks (list, optional): Objects with `emit(trace)`, `flush(metrics)` and
+                                `close(metrics)`, e.g. `JsonlSink` and `PrometheusTextSink`.
+        progress (bool | ProgressView, optional): Show a live progress line. Defaults to True.
+        flush_interval (float, optional): Seconds between sink flushes. Defaults to 10.
+    """
+
+    def __init__(self, sinks=(), progress=True, flush_interval=10.0):
+        self.sinks = list(sinks)
+        self.progress = ProgressView() if progress is True else progress or None
+        self.flush_interval = flush_interval
+        self.metrics = ExtractionMetrics()
+        self.total = 0
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._last_flush = self._started
+
+    def add_total(self, n, skipped=0):
+        """Announce `n` events to extract and `skipped` events already done."""
+        with self._lock:
+            self.total += n
+            self.metrics.skipped += skipped
+
+    def start(self, key):
+        """Begin the trace of event `key`."""
+        trace = EventTrace(key)
+        trace.instrumentation = self
+        return trace
+
+    def log(self, message, warning=False):
+        """
+        Print a per-event message, see `log`.
+
+        Without a progress line every message is printed to stdout. With one, informational
+        messages (e.g. 'Saved: ...') are dropped, since the progress line counts the outcomes,
+        and warnings are written above the progress line on its stream.
+        """
+        if self.progress is None:
+            print(message)
+        elif warning:
+            with self._lock:
+                self.progress.write(message, self.metrics, self.total,
+                                    time.perf_counter() - self._started)
+
+    @contextlib.contextmanager
+    def bind(self, trace):
+        """Make `trace` the current trace of the calling thread for the duration of the block."""
+        previous = current_trace()
+        _thread_local.trace = trace
+        try:
+            yield trace
+        finally:
+            _thread_local.trace = previous
+
+    def finish(self, trace, status, error=None):
+        """Record the outcome of an event and pass its trace to the metrics and sinks."""
+        trace.seconds = time.perf_counter() - trace.started
+        trace.status = status
+        trace.error = error
+        if error is not None and trace.reason is None:
+            trace.reason = failure_reason(error)
+
+        with self._lock:
+            self.metrics.observe(trace)
+            for sink in self.sinks:
+                sink.emit(trace)
+            now = time.perf_counter()
+            if now - self._last_flush >= self.flush_interval:
+                self._last_flush = now
+                for sink in self.sinks:
+                    sink.flush(self.metrics)
+            if self.progress is not None:
+                self.progress.update(self.metrics, self.total, now - self._started)
+
+    @contextlib.contextmanager
+    def event(self, key):
+        """
+        Trace one event extracted in the calling thread.
+
+        The block must set the outcome with `trace.status` (and `trace.error`); an exception
+        records the event as 'failed'.
+
+        Yields:
+            EventTrace: The trace of the event.
+        """
+        trace = self.start(key)
+        try:
+            with self.bind(trace):
+                yield trace
+        except Exception as e:
+            self.finish(trace, 'failed', str(e))
+            raise
+        self.finish(trace, trace.status, trace.error)
+
+    def close(self):
+        """Flush and close the sinks and end the progress line."""
+        with self._lock:
+            for sink in self.sinks:
+                sink.close(self.metrics)
+            if self.progress is not None:
+                self.progress.close(self.metrics, self.total, time.perf_counter() - self._started)
@@ -0,0 +1,202 @@
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_NO_IMAGERY = 'no_imagery'
+
+# Days after the end of its search window until an event's scene is assumed to be in
+# Earth Engine; an empty result checked earlier may only mean it was not ingested yet.
+DEFAULT_RETRY_NO_IMAGERY_DAYS = 5
+
+def event_key(row):
+    """
+    Builds the identity of a fire event from its coordinates and acquisition date.
+
+    The key matches the stem of the filename written by `process_single_event`, so
+    the same event always maps to the same ledger entry and output file.
+
+    Args:
+        row (pd.Series | dict): Fire event data with 'latitude', 'longitude' and 'acq_date'.
+
+    Returns:
+        str: Event key in the form '<latitude>_<longitude>_<YYYY-MM-DD>'.
+    """
+    acq_date = pd.to_datetime(row['acq_date']).date()
+    return f"{row['latitude']}_{row['longitude']}_{acq_date}"
+
+class ExtractionJobStore:
+    """
+    SQLite ledger recording the extraction state of every fire event.
+
+    Each event is stored once, keyed by `event_key`, together with its output
+    filename, status, number of attempts, the time of the last attempt and the last
+    error message. The ledger lets `process_event_batch` resume an interrupted run
+    without querying or downloading completed or known-empty events again.
+
+    Worker threads return their results and the caller records them; the store can
+    nevertheless be used from another thread, e.g. the event loop thread of the async
+    extraction engine.
+
+    Args:
+        db_path (str): Path to the SQLite database file. Created if missing.
+    """
+
+    def __init__(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                event_key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                path TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                checked_at REAL
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(events)')}
+        if 'checked_at' not in columns:
+            # Ledgers written before the column existed fall back to updated_at.
+            self.conn.execute('ALTER TABLE events ADD COLUMN checked_at REAL')
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """
+        Looks up the ledger entries of several events.
+
+        Args:
+            keys (list): Event keys to look up.
+
+        Returns:
+            dict: Mapping of event key to a (status, path) tuple for every known event.
+        """
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT event_key, status, path FROM events WHERE event_key IN ({placeholders})',
+                    chunk)
+                for key, status, path in rows:
+                    found[key] = (status, path)
+        return found
+
+    def checked_at(self, keys):
+        """
+        Looks up when several events were last attempted.
+
+        Args:
+            keys (list): Event keys to look up.
+
+        Returns:
+            dict: Mapping of event key to the time of its last recorded attempt, in seconds
+                  since the epoch, for every attempted event.
+        """
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT event_key, COALESCE(checked_at, updated_at) FROM events '
+                    f'WHERE event_key IN ({placeholders}) AND attempts > 0', chunk)
+                found.update(rows)
+        return found
+
+    def mark_pending(self, entries):
+        """
+        Registers events as pending, keeping the state of events already in the ledger
+        except for their status.
+
+        Args:
+            entries (list): (event_key, filename) tuples.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.executemany("""
+                INSERT INTO events (event_key, filename, status, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(event_key) DO UPDATE SET status = excluded.status,
+                                                     updated_at = excluded.updated_at
+            """, [(key, filename, STATUS_PENDING, now) for key, filename in entries])
+            self.conn.commit()
+
+    def record(self, key, status, path=None, error=None):
+        """
+        Stores the outcome of one extraction attempt.
+
+        Args:
+            key (str): Event key.
+            status (str): One of the STATUS_* values.
+            path (str, optional): Path of the saved image for completed events.
+            error (str, optional): Error message for failed events.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("""
+                UPDATE events SET status = ?, path = ?, error = ?, attempts = attempts + 1,
+                                  updated_at = ?, checked_at = ?
+                WHERE event_key = ?
+            """, (status, path, error, now, now, key))
+            self.conn.commit()
+
+    def summary(self):
+        """
+        Counts ledger entries per status.
+
+        Returns:
+            dict: Mapping of status to number of events.
+        """
+        with self._lock:
+            return dict(self.conn.execute('SELECT status, COUNT(*) FROM events GROUP BY status'))
+
+    def close(self):
+        """Closes the underlying database connection."""
+        with self._lock:
+            self.conn.close()
+
+def expire_no_imagery(store, known, window_ends,
+                      retry_no_imagery_days=DEFAULT_RETRY_NO_IMAGERY_DAYS):
+    """
+    Drops the 'no_imagery' ledger entries whose scene may have been ingested since.
+
+    Sentinel-2 scenes reach Earth Engine some time after acquisition, so a query for a
+    recent event can come back empty only because its scene is not there yet. A
+    'no_imagery' entry is final once it was checked at least `retry_no_imagery_days` after
+    the end of the event's search window; earlier checks are dropped from `known`, so the
+    event is extracted again.
+
+    Args:
+        store (ExtractionJobStore): Ledger the entries were read from.
+        known (dict): Entries returned by `store.get_many`.
+        window_ends (dict): Event key to the end date of its search window ('YYYY-MM-DD').
+        retry_no_imagery_days (float, optional): Ingestion latency horizon in days. None
+                                                 makes every 'no_imagery' entry final.
+                                                 Defaults to 5.
+
+    Returns:
+        dict: `known` without the entries to retry.
+    """
+    empty = [key for key, (status, _) in known.items() if status == STATUS_NO_IMAGERY]
+    if not empty or retry_no_imagery_days is None:
+        return known
+    checked = store.checked_at(empty)
+    horizon = pd.Timedelta(days=retry_no_imagery_days)
+    retry = {key for key in empty
+             if key not in checked
+             or pd.Timestamp(checked[key], unit='s') < pd.Timestamp(window_ends[key]) + horizon}
+    return {key: value for key, value in known.items() if key not in retry}
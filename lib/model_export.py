@@ -0,0 +1,291 @@
+import os
+import tempfile
+import cv2
+import numpy as np
+from lib.image_preprocessor import IMAGE_EXTENSIONS, IMAGENET_MEAN, IMAGENET_STD
+from lib.predictor import predict_batch
+
+QUANTIZATION_MODES = (None, 'dynamic', 'static')
+
+def torch_preprocess(size=224, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+    """
+    Build a `preprocess_image` function approximating the notebook's validation transforms.
+
+    The notebook resizes PIL images with torchvision's antialiased bilinear `Resize`; here
+    OpenCV's `INTER_AREA` averages over the source pixels in the same way, as in
+    `lib.dataset`. Inputs differ from the notebook's by a few intensity levels at most.
+
+    Args:
+        size (int, optional): Output width and height. Defaults to 224.
+        mean (tuple, optional): Per-channel mean. Defaults to the ImageNet mean.
+        std (tuple, optional): Per-channel standard deviation. Defaults to the ImageNet std.
+
+    Returns:
+        callable: Maps an image path to a (3, size, size) float32 array.
+    """
+    mean = np.asarray(mean, dtype=np.float32)
+    std = np.asarray(std, dtype=np.float32)
+
+    def preprocess_image(path):
+        image = cv2.imread(path)
+        if image is None:
+            raise ValueError("unreadable image")
+        image = cv2.cvtColor(cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA),
+                             cv2.COLOR_BGR2RGB)
+        return ((image.astype(np.float32) / 255.0 - mean) / std).transpose(2, 0, 1)
+    return preprocess_image
+
+def labelled_images(root, categories=("no_fire", "fire")):
+    """
+    List the images of a class-folder split with their labels.
+
+    Args:
+        root (str): Folder with one subfolder per class, e.g. 'data/processed/validation'.
+        categories (tuple, optional): Subfolder names in label order. Defaults to
+                                      ('no_fire', 'fire'), i.e. Fire = 1.
+
+    Returns:
+        tuple:
+            - list: Image paths.
+            - numpy.ndarray: Integer labels.
+    """
+    paths, labels = [], []
+    for label, category in enumerate(categories):
+        folder = os.path.join(root, category)
+        for filename in sorted(os.listdir(folder)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(folder, filename))
+                labels.append(label)
+    return paths, np.asarray(labels, dtype=np.int64)
+
+def _probabilities(output):
+    """Softmax over class logits; single-column outputs are returned unchanged."""
+    output = np.asarray(output, dtype=np.float32)
+    if output.ndim == 2 and output.shape[1] > 1:
+        output = np.exp(output - output.max(axis=1, keepdims=True))
+        output /= output.sum(axis=1, keepdims=True)
+    return output
+
+def torch_predict_fn(model, num_threads=None):
+    """
+    Wrap an eager PyTorch model as a CPU `predict_fn` for `predict_batch`.
+
+    Args:
+        model (torch.nn.Module): Classifier returning class logits.
+        num_threads (int, optional): Intra-op threads. Defaults to PyTorch's setting.
+
+    Returns:
+        callable: Maps a (N, 3, H, W) float32 batch to (N, classes) probabilities.
+    """
+    import torch
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    model = model.cpu().eval()
+
+    def predict_fn(batch):
+        with torch.inference_mode():
+            return _probabilities(model(torch.from_numpy(np.ascontiguousarray(batch))).numpy())
+    return predict_fn
+
+def calibration_batches(image_paths, preprocess_image, batch_size=16, limit=256):
+    """
+    Yield preprocessed float32 batches for static quantization calibration.
+
+    Args:
+        image_paths (list): Images representative of production data.
+        preprocess_image (callable): Same preprocessing as at inference time.
+        batch_size (int, optional): Images per batch. Defaults to 16.
+        limit (int, optional): Maximum number of images used. Defaults to 256.
+
+    Yields:
+        numpy.ndarray: (N, 3, H, W) batch.
+    """
+    paths = list(image_paths)[:limit]
+    for start in range(0, len(paths), batch_size):
+        yield np.stack([preprocess_image(path) for path in paths[start:start + batch_size]])
+
+def _quantize_torch(model, quantization, example, calibration):
+    import torch
+    import torch.nn as nn
+
+    if quantization == 'dynamic':
+        # Only Linear layers have dynamic int8 kernels; convolutions stay fp32.
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    prepared = prepare_fx(model, get_default_qconfig_mapping(torch.backends.quantized.engine),
+                          (example,))
+    with torch.inference_mode():
+        for batch in calibration:
+            prepared(torch.from_numpy(batch))
+    return convert_fx(prepared)
+
+def _quantize_onnx(fp32_path, output_path, quantization, calibration):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    if quantization == 'dynamic':
+        quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+        return
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(calibration)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {'input': batch}
+
+    quantize_static(fp32_path, output_path, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    per_channel=True)
+
+def export_model(model, output_path, quantization=None, calibration_dir='data/processed/validation',
+                 preprocess_image=None, input_size=224, calibration_images=256):
+    """
+    Export a trained PyTorch classifier to an optimized CPU artifact.
+
+    Workflow:
+        1. **Quantization (optional)**:
+           - 'dynamic': int8 weights, activations quantized on the fly. No data needed, but
+             for TorchScript only the Linear (classifier) layers are quantized, and ONNX
+             runtime's dynamic int8 convolutions are usually slower than fp32 on CNNs.
+           - 'static': int8 weights and activations, with activation ranges calibrated on
+             the images under `calibration_dir`.
+
+        2. **Export**:
+           - '.pt' paths produce a frozen TorchScript module (FX graph mode quantization).
+           - '.onnx' paths produce an ONNX graph for onnxruntime, quantized with
+             `onnxruntime.quantization`.
+
+    Args:
+        model (torch.nn.Module): Trained model, e.g. from `make_mobilenetv2_model` with its
+                                 best checkpoint loaded.
+        output_path (str): '.pt' (TorchScript) or '.onnx' file to write.
+        quantization (str, optional): None, 'dynamic' or 'static'. Defaults to None.
+        calibration_dir (str, optional): Class-folder split used for static calibration.
+                                         Defaults to 'data/processed/validation'.
+        preprocess_image (callable, optional): Inference preprocessing, used for calibration.
+                                               Defaults to `torch_preprocess(input_size)`.
+        input_size (int, optional): Input width and height. Defaults to 224.
+        calibration_images (int, optional): Maximum calibration images. Defaults to 256.
+
+    Returns:
+        str: `output_path`.
+    """
+    import torch
+
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in ('.pt', '.onnx'):
+        raise ValueError("output_path must end with '.pt' (TorchScript) or '.onnx'")
+
+    model = model.cpu().eval()
+    preprocess_image = preprocess_image or torch_preprocess(input_size)
+    example = torch.zeros(1, 3, input_size, input_size)
+    calibration = None
+    if quantization == 'static':
+        paths, _ = labelled_images(calibration_dir)
+        # Mix both classes into the calibration subset.
+        paths = [paths[i] for i in np.random.default_rng(0).permutation(len(paths))]
+        calibration = calibration_batches(paths, preprocess_image, limit=calibration_images)
+
+    if extension == '.pt':
+        if quantization is not None:
+            model = _quantize_torch(model, quantization, example, calibration)
+        with torch.inference_mode():
+            scripted = torch.jit.freeze(torch.jit.trace(model, example))
+        torch.jit.save(scripted, output_path)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32_path = output_path if quantization is None else os.path.join(tmp, 'model.onnx')
+            torch.onnx.export(model, (example,), fp32_path, input_names=['input'],
+                              output_names=['output'], dynamic_axes={'input': {0: 'batch'}},
+                              dynamo=False)
+            if quantization is not None:
+                _quantize_onnx(fp32_path, output_path, quantization, calibration)
+
+    print(f"Exported {quantization or 'fp32'} model to: {output_path}")
+    return output_path
+
+def load_exported_model(path, num_threads=None):
+    """
+    Load an artifact written by `export_model` as a `predict_fn` for `predict_batch`.
+
+    Example:
+        predict_batch(None, paths, torch_preprocess(), predict_fn=load_exported_model('model.pt'))
+
+    Args:
+        path (str): '.pt' TorchScript or '.onnx' file.
+        num_threads (int, optional): Intra-op threads. Defaults to the runtime's setting.
+
+    Returns:
+        callable: Maps a (N, 3, H, W) float32 batch to (N, classes) probabilities.
+    """
+    if path.lower().endswith('.onnx'):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+
+        def predict_fn(batch):
+            return _probabilities(session.run(None, {input_name: np.ascontiguousarray(batch,
+                                                                                      dtype=np.float32)})[0])
+        return predict_fn
+
+    import torch
+
+    return torch_predict_fn(torch.jit.load(path, map_location='cpu'), num_threads)
+
+def compare_models(reference_fn, candidate_fn, image_dir='data/processed/validation',
+                   preprocess_image=None, batch_size=32, threshold=0.5):
+    """
+    Compare an exported model against the fp32 reference on a labelled split.
+
+    Args:
+        reference_fn (callable): Reference `predict_fn`, e.g. `torch_predict_fn(model)`.
+        candidate_fn (callable): Candidate `predict_fn`, e.g. `load_exported_model(path)`.
+        image_dir (str, optional): Class-folder split. Defaults to 'data/processed/validation'.
+        preprocess_image (callable, optional): Defaults to `torch_preprocess()`.
+        batch_size (int, optional): Images per model call. Defaults to 32.
+        threshold (float, optional): Fire probability threshold. Defaults to 0.5.
+
+    Returns:
+        dict: 'reference_accuracy', 'candidate_accuracy', 'accuracy_change', 'agreement'
+              (share of identical predictions), 'reference_images_per_sec',
+              'candidate_images_per_sec' and 'speedup'.
+    """
+    preprocess_image = preprocess_image or torch_preprocess()
+    paths, labels = labelled_images(image_dir)
+    truth = dict(zip(paths, labels))
+
+    runs = {}
+    for name, predict_fn in (('reference', reference_fn), ('candidate', candidate_fn)):
+        predict_fn(np.stack([preprocess_image(paths[0])]))  # warm-up
+        runs[name] = predict_batch(None, paths, preprocess_image, batch_size=batch_size,
+                                   predict_fn=predict_fn, threshold=threshold)
+
+    predicted = {name: (df['probability'].to_numpy() > threshold).astype(np.int64)
+                 for name, df in runs.items()}
+    expected = np.array([truth[path] for path in runs['reference']['path']])
+    report = {
+        'reference_accuracy': float((predicted['reference'] == expected).mean()),
+        'candidate_accuracy': float((predicted['candidate'] == expected).mean()),
+        'agreement': float((predicted['reference'] == predicted['candidate']).mean()),
+        'reference_images_per_sec': runs['reference'].attrs['images_per_sec'],
+        'candidate_images_per_sec': runs['candidate'].attrs['images_per_sec'],
+    }
+    report['accuracy_change'] = report['candidate_accuracy'] - report['reference_accuracy']
+    report['speedup'] = report['candidate_images_per_sec'] / report['reference_images_per_sec']
+    print(f"Accuracy {report['reference_accuracy']:.4f} -> {report['candidate_accuracy']:.4f} "
+          f"({report['accuracy_change']:+.4f}), agreement {report['agreement']:.4f}, "
+          f"speedup {report['speedup']:.2f}x")
+    return report
@@ -0,0 +1,372 @@
+import json
+import os
+import time
+import cv2
+import pandas as pd
+from lib.event_planner import plan_extraction_jobs
+from lib.firms_store import read_firms_csv
+from lib.image_preprocessor import apply_clahe_rgb, split_into_patches
+from lib.image_processor import event_date_window, process_event_batch
+from lib.job_store import (ExtractionJobStore, STATUS_DONE, STATUS_FAILED, STATUS_NO_IMAGERY,
+                           DEFAULT_RETRY_NO_IMAGERY_DAYS, event_key, expire_no_imagery)
+
+WATERMARK_FORMAT = '%Y-%m-%dT%H:%M'
+
+PREDICTION_COLUMNS = ['event_key', 'sensor', 'acq_datetime', 'latitude', 'longitude',
+                      'confidence_level', 'frp', 'path', 'probability', 'predicted_class',
+                      'confidence']
+
+def load_feed_state(path):
+    """
+    Load the state of a change feed.
+
+    Args:
+        path (str): Path of the JSON state file.
+
+    Returns:
+        dict: 'watermarks' (sensor to the last ingested acquisition time, 'YYYY-MM-DDTHH:MM')
+              and 'archives' (archive CSV path to its size, mtime, and per-sensor coverage).
+              Empty entries if the file does not exist yet.
+    """
+    if not os.path.exists(path):
+        return {'watermarks': {}, 'archives': {}}
+    with open(path) as f:
+        state = json.load(f)
+    state.setdefault('watermarks', {})
+    state.setdefault('archives', {})
+    return state
+
+def save_feed_state(path, state):
+    """
+    Atomically write the state of a change feed.
+
+    Args:
+        path (str): Path of the JSON state file.
+        state (dict): State returned by `load_feed_state` and updated by `ingest_once`.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _firms_csvs(raw_dir):
+    return sorted(os.path.join(root, name)
+                  for root, _, names in os.walk(raw_dir)
+                  for name in names if name.endswith('.csv'))
+
+def archive_coverage(paths, state):
+    """
+    Latest acquisition time covered by the archive files of each sensor.
+
+    Archive CSVs are immutable once published, so the coverage of every file is cached in
+    `state['archives']` and a file is only read again when its size or mtime changes.
+
+    Args:
+        paths (list): Archive CSV paths.
+        state (dict): Feed state, updated in place.
+
+    Returns:
+        dict: Sensor to a `pd.Timestamp`.
+    """
+    cached = state['archives']
+    for path in paths:
+        stat = os.stat(path)
+        entry = cached.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            df = read_firms_csv(path)
+            coverage = df.groupby('sensor', observed=True)['acq_datetime'].max()
+            cached[path] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                            'coverage': {sensor: ts.strftime(WATERMARK_FORMAT)
+                                         for sensor, ts in coverage.items()}}
+    for path in set(cached) - set(paths):
+        del cached[path]
+
+    coverage = {}
+    for entry in cached.values():
+        for sensor, value in entry['coverage'].items():
+            coverage[sensor] = max(coverage.get(sensor, pd.Timestamp.min), pd.Timestamp(value))
+    return coverage
+
+def new_detections(raw_dir, state, store, lookback_minutes=180, deduplicate=False, buffer=0.02,
+                   retry_no_imagery_days=DEFAULT_RETRY_NO_IMAGERY_DAYS):
+    """
+    Diff the NRT detections under a folder against what was already ingested.
+
+    Workflow:
+        1. **Cut-off**:
+           - For every sensor, rows at or before the later of its watermark and the end of
+             its archive coverage are history: the archive supersedes NRT data and was
+             processed by the batch pipeline.
+           - The cut-off is moved back by `lookback_minutes`, because NRT granules can be
+             published out of order.
+
+        2. **Ledger Diff**:
+           - Rows whose ledger entry is already done or known to have no imagery are
+             dropped, so the lookback never extracts or scores an event twice.
+           - A 'no_imagery' entry is only final once it was checked `retry_no_imagery_days`
+             after the end of its search window (see `expire_no_imagery`): fresh detections
+             are usually queried before Sentinel-2 has ingested their scene. Until then the
+             detection is selected again every cycle, even behind the cut-off.
+           - With `deduplicate=True` the ledger holds one entry per planned (tile, date)
+             job, so each row is looked up by the key of its job (see
+             `plan_extraction_jobs`); a detection counts as handled once its scene is.
+
+    Args:
+        raw_dir (str): Folder searched recursively for FIRMS CSV files, e.g. 'data/raw'.
+        state (dict): Feed state, see `load_feed_state`.
+        store (ExtractionJobStore): Ledger shared with the extraction runs.
+        lookback_minutes (int, optional): Overlap with the previous cycle. Defaults to 180.
+        deduplicate (bool, optional): Match the ledger of `process_event_batch(deduplicate=True)`.
+                                      Defaults to False.
+        buffer (float, optional): Extraction buffer, which sets the job tiles. Defaults to 0.02.
+        retry_no_imagery_days (float, optional): Ingestion latency horizon of 'no_imagery'
+                                                 entries. None makes them final. Defaults to 5.
+
+    Returns:
+        pd.DataFrame: New detections in the `normalize_firms` schema plus 'event_key' and
+                      'ledger_key', sorted by acquisition time.
+    """
+    paths = _firms_csvs(raw_dir)
+    nrt_paths = [path for path in paths if '_nrt_' in os.path.basename(path)]
+    coverage = archive_coverage([path for path in paths if '_archive_' in os.path.basename(path)],
+                                state)
+    if not nrt_paths:
+        return pd.DataFrame(columns=['event_key', 'ledger_key'])
+
+    df = pd.concat([read_firms_csv(path) for path in nrt_paths], ignore_index=True)
+    df['sensor'] = df['sensor'].astype(str)
+
+    lookback = pd.Timedelta(minutes=lookback_minutes)
+    cutoff = {}
+    for sensor in df['sensor'].unique():
+        watermark = state['watermarks'].get(sensor)
+        candidates = [coverage.get(sensor, pd.Timestamp.min)]
+        if watermark is not None:
+            candidates.append(pd.Timestamp(watermark) - lookback)
+        cutoff[sensor] = max(candidates)
+    after_cutoff = df['acq_datetime'] > df['sensor'].map(cutoff)
+    selected = after_cutoff.copy()
+    if retry_no_imagery_days is not None:
+        # Older rows may still have a 'no_imagery' entry to retry: their window ends a day
+        # after the acquisition; one more day is margin.
+        oldest = pd.Timestamp(time.time(), unit='s') - pd.Timedelta(days=retry_no_imagery_days + 2)
+        selected |= df['acq_datetime'] >= oldest
+    after_cutoff = after_cutoff[selected].reset_index(drop=True)
+    df = df[selected].reset_index(drop=True)
+
+    records = df[['latitude', 'longitude', 'acq_date']].to_dict('records')
+    df['event_key'] = [event_key(row) for row in records]
+    if deduplicate and len(df):
+        jobs, detections = plan_extraction_jobs(df, buffer=buffer)
+        job_ids = detections.set_index('detection_index')['job_id'].reindex(df.index)
+        job_keys = {job_id: event_key(row) for job_id, row in
+                    zip(jobs['job_id'], jobs[['latitude', 'longitude', 'acq_date']].to_dict('records'))}
+        df['ledger_key'] = job_ids.map(job_keys)
+        window_ends = job_ids.map(dict(zip(jobs['job_id'], jobs['end_date'])))
+    else:
+        df['ledger_key'] = df['event_key']
+        window_ends = pd.Series([event_date_window(row)[1] for row in records], index=df.index,
+                                dtype=object)
+
+    stored = store.get_many(set(df['ledger_key']))
+    known = expire_no_imagery(store, stored, dict(zip(df['ledger_key'], window_ends)),
+                              retry_no_imagery_days)
+    retried = set(stored) - set(known)
+    handled = {key for key, (status, _) in known.items()
+               if status in (STATUS_DONE, STATUS_NO_IMAGERY)}
+    # Behind the cut-off, only detections with a retried 'no_imagery' entry come back.
+    keep = ~df['ledger_key'].isin(handled) & (after_cutoff | df['ledger_key'].isin(retried))
+    return df[keep].sort_values('acq_datetime', ignore_index=True)
+
+def advance_watermarks(state, events, statuses):
+    """
+    Move each sensor's watermark past the detections handled in this cycle.
+
+    A watermark never passes a failed detection: it stops one minute before the earliest
+    failure of the sensor, so the failure is retried next cycle while the job store skips
+    the completed detections in between.
+
+    Args:
+        state (dict): Feed state, updated in place.
+        events (pd.DataFrame): Detections of the cycle, from `new_detections`.
+        statuses (list): Extraction status of every detection, in the same order.
+    """
+    events = events.assign(status=list(statuses))
+    for sensor, group in events.groupby('sensor'):
+        failed = group.loc[group['status'] == STATUS_FAILED, 'acq_datetime']
+        if len(failed):
+            watermark = failed.min() - pd.Timedelta(minutes=1)
+        else:
+            watermark = group['acq_datetime'].max()
+        previous = state['watermarks'].get(sensor)
+        if previous is None or watermark > pd.Timestamp(previous):
+            state['watermarks'][sensor] = watermark.strftime(WATERMARK_FORMAT)
+
+def _patch_images(image_paths, patch_dir, patch_size, clip_limit, tile_grid):
+    """
+    Apply CLAHE to images and save their patches as '<stem>_patch_<i>.png', like
+    `preprocess_and_patch`. Returns the number of patches written.
+    """
+    os.makedirs(patch_dir, exist_ok=True)
+    total = 0
+    for img_path in image_paths:
+        image = cv2.imread(img_path)
+        if image is None:
+            print(f"Skipping unreadable image: {img_path}")
+            continue
+        stem = os.path.splitext(os.path.basename(img_path))[0]
+        patches = split_into_patches(apply_clahe_rgb(image, clip_limit, tile_grid), patch_size)
+        for i, patch in enumerate(patches, 1):
+            cv2.imwrite(os.path.join(patch_dir, f"{stem}_patch_{i}.png"), patch)
+        total += len(patches)
+    return total
+
+def ingest_once(raw_dir, output_dir, state_path=None, job_store=None, patch_dir=None,
+                patch_size=256, clip_limit=2.0, tile_grid=(8, 8), model=None,
+                preprocess_image=None, predict_fn=None, threshold=0.5, lookback_minutes=180,
+                **extract_options):
+    """
+    Run one cycle of the near-real-time pipeline over the FIRMS NRT files.
+
+    Workflow:
+        1. **Change Detection**:
+           - `new_detections` selects the NRT rows newer than each sensor's watermark and
+             archive coverage and not yet in the job store, plus recent rows whose empty
+             result is retried (see `retry_no_imagery_days` of `process_event_batch`).
+
+        2. **Extraction**:
+           - Only those rows are passed to `process_event_batch`, with the feed's job store.
+           - With `deduplicate=True`, each cycle's rows are merged into the
+             'detection_image_map.csv' of earlier cycles instead of replacing it.
+
+        3. **Preprocessing (optional)**:
+           - With `patch_dir`, the new images are enhanced with CLAHE and split into
+             patches, as `preprocess_and_patch` does for labelled folders.
+
+        4. **Prediction (optional)**:
+           - With a `model` or `predict_fn`, the new images are scored with `predict_batch`
+             and the results, joined with their FIRMS attributes, are appended to
+             'predictions.csv' in `output_dir`.
+
+        5. **State**:
+           - The watermarks are advanced with `advance_watermarks` and saved atomically,
+             after everything else succeeded.
+
+    Args:
+        raw_dir (str): Folder with the FIRMS CSV files, e.g. 'data/raw'.
+        output_dir (str): Directory of the extracted images and 'predictions.csv'.
+        state_path (str, optional): JSON state file. Defaults to 'feed_state.json' in
+                                    `output_dir`.
+        job_store (str | ExtractionJobStore, optional): Ledger, or path to its SQLite file.
+                                                        Defaults to 'jobs.sqlite' in
+                                                        `output_dir`.
+        patch_dir (str, optional): Directory of the patches of new images. Defaults to None.
+        patch_size (int, optional): Size of each patch. Defaults to 256.
+        clip_limit (float, optional): CLAHE clip limit. Defaults to 2.0.
+        tile_grid (tuple, optional): CLAHE grid size. Defaults to (8, 8).
+        model (optional): Model passed to `predict_batch`. Defaults to None.
+        preprocess_image (callable, optional): Preprocessing passed to `predict_batch`.
+        predict_fn (callable, optional): Batch inference function passed to `predict_batch`,
+                                         e.g. `load_exported_model(path)`.
+        threshold (float, optional): Fire probability threshold. Defaults to 0.5.
+        lookback_minutes (int, optional): See `new_detections`. Defaults to 180.
+        **extract_options: Keyword arguments of `process_event_batch`, e.g. 'max_workers',
+                           'deduplicate', 'collection_cache', 'retry_no_imagery_days' or
+                           'instrumentation'.
+
+    Returns:
+        dict: 'new' (detections queued), 'done', 'no_imagery', 'failed', 'patches' and
+              'predicted' counts of the cycle.
+    """
+    state_path = state_path or os.path.join(output_dir, 'feed_state.json')
+    store = (ExtractionJobStore(job_store or os.path.join(output_dir, 'jobs.sqlite'))
+             if job_store is None or isinstance(job_store, str) else job_store)
+    state = load_feed_state(state_path)
+    summary = {'new': 0, STATUS_DONE: 0, STATUS_NO_IMAGERY: 0, STATUS_FAILED: 0,
+               'patches': 0, 'predicted': 0}
+
+    try:
+        deduplicate = extract_options.get('deduplicate', False)
+        events = new_detections(raw_dir, state, store, lookback_minutes, deduplicate=deduplicate,
+                                buffer=extract_options.get('buffer', 0.02),
+                                retry_no_imagery_days=extract_options.get(
+                                    'retry_no_imagery_days', DEFAULT_RETRY_NO_IMAGERY_DAYS))
+        summary['new'] = len(events)
+        if len(events):
+            print(f"Ingesting {len(events)} new NRT detections")
+            map_path = os.path.join(output_dir, 'detection_image_map.csv')
+            previous_map = (pd.read_csv(map_path) if deduplicate and os.path.exists(map_path)
+                            else None)
+            results = process_event_batch(events, output_dir, job_store=store,
+                                          return_status=True, **extract_options)
+            if previous_map is not None:
+                # process_event_batch writes only this cycle's detections; keep the history.
+                combined = pd.concat([previous_map, pd.read_csv(map_path)], ignore_index=True)
+                combined.drop_duplicates(['latitude', 'longitude', 'acq_date'], keep='last').to_csv(
+                    map_path, index=False)
+            statuses = [status for _, status in results]
+            for status in statuses:
+                summary[status] += 1
+
+            events = events.assign(path=[path for path, _ in results])
+            done = events[events['path'].notna()]
+            image_paths = list(dict.fromkeys(done['path']))
+
+            if patch_dir is not None and image_paths:
+                summary['patches'] = _patch_images(image_paths, patch_dir, patch_size,
+                                                   clip_limit, tile_grid)
+
+            if (model is not None or predict_fn is not None) and image_paths:
+                from lib.predictor import predict_batch
+
+                scores = predict_batch(model, image_paths, preprocess_image,
+                                       predict_fn=predict_fn, threshold=threshold)
+                predictions = done.merge(scores, on='path')[PREDICTION_COLUMNS]
+                predictions_path = os.path.join(output_dir, 'predictions.csv')
+                predictions.to_csv(predictions_path, mode='a', index=False,
+                                   header=not os.path.exists(predictions_path))
+                summary['predicted'] = len(predictions)
+
+            advance_watermarks(state, events, statuses)
+        else:
+            print("No new NRT detections")
+        save_feed_state(state_path, state)
+    finally:
+        if store is not job_store:
+            store.close()
+
+    return summary
+
+def watch(raw_dir, output_dir, interval=900, max_cycles=None, **ingest_options):
+    """
+    Run `ingest_once` every `interval` seconds, e.g. while new NRT files are synced into
+    `raw_dir`. For cron-style scheduling, call `ingest_once` (or `wildfire-watch --once`)
+    instead; the state file makes consecutive runs continue where the last one stopped.
+
+    Args:
+        raw_dir (str): Folder with the FIRMS CSV files.
+        output_dir (str): Directory of the extracted images and predictions.
+        interval (float, optional): Seconds between the starts of two cycles. Defaults to 900.
+        max_cycles (int, optional): Stop after this many cycles. Defaults to running forever.
+        **ingest_options: Keyword arguments of `ingest_once`.
+
+    Returns:
+        list: Summaries of the completed cycles.
+    """
+    summaries = []
+    while max_cycles is None or len(summaries) < max_cycles:
+        started = time.monotonic()
+        try:
+            summaries.append(ingest_once(raw_dir, output_dir, **ingest_options))
+            print(f"Cycle {len(summaries)}: {summaries[-1]}")
+        except Exception as e:
+            # A failed cycle leaves the state untouched; the next one retries it.
+            summaries.append(None)
+            print(f"Cycle {len(summaries)} failed: {str(e)}")
+        if max_cycles is not None and len(summaries) >= max_cycles:
+            break
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    return summaries
@@ -0,0 +1,140 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+INDEX_FILE = 'index.csv'
+META_FILE = 'meta.json'
+
+class PatchStoreWriter:
+    """
+    Stream image patches into a sharded, packed container.
+
+    Patches are buffered into a fixed-size array and written as `shard_XXXXX.npy` files of
+    at most `shard_size` patches each, so a whole dataset ends up in a handful of files
+    instead of one PNG per patch. An `index.csv` records, for every patch, its shard and
+    offset along with the source file, pixel origin and category.
+
+    Args:
+        output_dir (str): Directory of the store. Created if missing.
+        patch_size (int): Width and height of each patch.
+        channels (int, optional): Number of channels per patch. Defaults to 3.
+        shard_size (int, optional): Maximum number of patches per shard. Defaults to 4096.
+        dtype (str, optional): Patch data type. Defaults to 'uint8'.
+    """
+
+    def __init__(self, output_dir, patch_size, channels=3, shard_size=4096, dtype='uint8'):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.patch_size = patch_size
+        self.channels = channels
+        self.shard_size = shard_size
+        self.dtype = np.dtype(dtype)
+        self._buffer = np.empty((shard_size, patch_size, patch_size, channels), dtype=self.dtype)
+        self._filled = 0
+        self._shard = 0
+        self._index = []
+
+    def add(self, patches, source, category, origins):
+        """
+        Append the patches of one source image.
+
+        Args:
+            patches (numpy.ndarray): Array of shape (N, patch_size, patch_size, channels).
+            source (str): Path of the source image.
+            category (str): Class label of the source image.
+            origins (numpy.ndarray): (N, 2) array of (y, x) patch origins.
+        """
+        for patch, (y, x) in zip(patches, origins):
+            self._buffer[self._filled] = patch
+            self._index.append((self._shard, self._filled, source, int(y), int(x), category))
+            self._filled += 1
+            if self._filled == self.shard_size:
+                self._flush()
+
+    def _flush(self):
+        if self._filled == 0:
+            return
+        path = os.path.join(self.output_dir, f"shard_{self._shard:05d}.npy")
+        np.save(path, self._buffer[:self._filled])
+        self._shard += 1
+        self._filled = 0
+
+    def close(self):
+        """
+        Write the last shard, the index and the store metadata.
+
+        Returns:
+            int: Total number of patches written.
+        """
+        self._flush()
+        index = pd.DataFrame(self._index, columns=['shard', 'offset', 'source', 'y', 'x', 'category'])
+        index.to_csv(os.path.join(self.output_dir, INDEX_FILE), index=False)
+        with open(os.path.join(self.output_dir, META_FILE), 'w') as f:
+            json.dump({
+                'patch_size': self.patch_size,
+                'channels': self.channels,
+                'dtype': self.dtype.name,
+                'shards': self._shard,
+                'patches': len(index),
+            }, f, indent=2)
+        return len(index)
+
+class PatchStore:
+    """
+    Random-access reader for a store written by `PatchStoreWriter`.
+
+    Shards are memory-mapped on first use, so reading a patch is a plain array lookup
+    without decoding any image file.
+
+    Args:
+        store_dir (str): Directory of the store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.index = pd.read_csv(os.path.join(store_dir, INDEX_FILE))
+        self._shard_ids = self.index['shard'].to_numpy()
+        self._offsets = self.index['offset'].to_numpy()
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def _get_shard(self, shard):
+        if shard not in self._shards:
+            path = os.path.join(self.store_dir, f"shard_{shard:05d}.npy")
+            self._shards[shard] = np.load(path, mmap_mode='r')
+        return self._shards[shard]
+
+    def __getitem__(self, i):
+        """
+        Return the i-th patch and its category.
+
+        Args:
+            i (int): Patch position in the index.
+
+        Returns:
+            tuple: (numpy.ndarray patch view, str category).
+        """
+        patch = self._get_shard(int(self._shard_ids[i]))[self._offsets[i]]
+        return patch, self.index.at[i, 'category']
+
+    def get_batch(self, indices):
+        """
+        Gather several patches into one array.
+
+        Args:
+            indices (array-like): Patch positions in the index.
+
+        Returns:
+            numpy.ndarray: Array of shape (len(indices), patch_size, patch_size, channels).
+        """
+        indices = np.asarray(indices)
+        size, channels = self.meta['patch_size'], self.meta['channels']
+        batch = np.empty((len(indices), size, size, channels), dtype=self.meta['dtype'])
+        for j, i in enumerate(indices):
+            batch[j] = self._get_shard(int(self._shard_ids[i]))[self._offsets[i]]
+        return batch
@@ -1,21 +1,155 @@
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
 
-def predict_fire(model, test_images, test_folder, preprocess_image):
+def fire_probabilities(output, n):
+    """
+    Convert raw model output to one fire probability per image.
+
+    A single output column is read as a sigmoid probability; with several columns the
+    last one (class 1, 'Fire') is used. Rows that do not sum to 1 are class logits, e.g.
+    of a PyTorch model, and are passed through a softmax first.
+
+    Args:
+        output (array-like): Model output for a batch of `n` images.
+        n (int): Number of images in the batch.
+
+    Returns:
+        numpy.ndarray: Float32 array of `n` fire probabilities.
+    """
+    output = np.asarray(output, dtype=np.float32).reshape(n, -1)
+    if output.shape[1] > 1 and not np.allclose(output.sum(axis=1), 1, atol=1e-3):
+        output = np.exp(output - output.max(axis=1, keepdims=True))
+        output /= output.sum(axis=1, keepdims=True)
+    return output[:, -1]
+
+def predict_batch(model, image_paths, preprocess_image, batch_size=32, num_workers=4,
+                  prefetch=2, predict_fn=None, threshold=0.5, skip_unreadable=True):
+    """
+    Predicts fire presence for many images with batched, prefetched inference.
+
+    Workflow:
+        1. **Decoding**:
+           - `preprocess_image` runs on a pool of `num_workers` threads, keeping up to
+             `prefetch` batches decoded ahead of the model.
+
+        2. **Batching**:
+           - Decoded images are stacked into fixed-size batches of `batch_size` and passed to
+             the model in a single call each, instead of one call per image.
+
+        3. **Collecting Results**:
+           - Returns one row per image, in input order, and reports throughput. Images that
+             `preprocess_image` fails on are skipped, or the error is raised with
+             `skip_unreadable=False`.
+
+    Args:
+        model: Trained model. Its `predict` method is used unless `predict_fn` is given.
+        image_paths (list): Paths of the images to score.
+        preprocess_image (callable): Maps an image path to an array of shape (H, W, C) or
+                                     (1, H, W, C), as used by `predict_fire`.
+        batch_size (int, optional): Number of images per model call. Defaults to 32.
+        num_workers (int, optional): Threads decoding and preprocessing images. Defaults to 4.
+        prefetch (int, optional): Number of batches prepared ahead. Defaults to 2.
+        predict_fn (callable, optional): Maps a batch array to model outputs, e.g. a wrapper
+                                         around a PyTorch module. Defaults to `model.predict`.
+        threshold (float, optional): Probability above which an image is labelled 'Fire'.
+                                     Defaults to 0.5.
+        skip_unreadable (bool, optional): Skip images whose preprocessing raises, with a
+                                          message, instead of re-raising the error.
+                                          Defaults to True.
+
+    Returns:
+        pd.DataFrame: Columns 'path', 'probability', 'predicted_class' and 'confidence'.
+                      The throughput is stored in `df.attrs['images_per_sec']`.
+
+    Raises:
+        Exception: The preprocessing error of the first unreadable image, if
+                   `skip_unreadable` is False.
+    """
+    predict_fn = predict_fn or model.predict
+
+    def load(path):
+        try:
+            array = np.asarray(preprocess_image(path))
+        except Exception as e:
+            if not skip_unreadable:
+                raise
+            print(f"Skipping unreadable image: {path} ({e})")
+            return None
+        if array.ndim == 4 and array.shape[0] == 1:
+            array = array[0]
+        return array
+
+    paths, probabilities = [], []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        queued = deque()
+        remaining = iter(image_paths)
+
+        def fill():
+            for path in remaining:
+                queued.append((path, executor.submit(load, path)))
+                if len(queued) >= (prefetch + 1) * batch_size:
+                    break
+
+        fill()
+        while queued:
+            batch_paths, batch_arrays = [], []
+            while queued and len(batch_paths) < batch_size:
+                path, future = queued.popleft()
+                array = future.result()
+                if array is not None:
+                    batch_paths.append(path)
+                    batch_arrays.append(array)
+            fill()
+            if not batch_arrays:
+                continue
+
+            output = predict_fn(np.stack(batch_arrays))
+            paths.extend(batch_paths)
+            probabilities.append(fire_probabilities(output, len(batch_arrays)))
+    elapsed = time.perf_counter() - start
+
+    probability = np.concatenate(probabilities) if probabilities else np.empty(0, dtype=np.float32)
+    is_fire = probability > threshold
+    results = pd.DataFrame({
+        'path': paths,
+        'probability': probability,
+        'predicted_class': np.where(is_fire, 'Fire', 'No Fire'),
+        'confidence': np.where(is_fire, probability, 1 - probability),
+    })
+    results.attrs['images_per_sec'] = len(results) / elapsed if elapsed > 0 else float('nan')
+    print(f"Scored {len(results)} images in {elapsed:.2f}s "
+          f"({results.attrs['images_per_sec']:.1f} images/sec)")
+    return results
+
+def predict_fire(model, test_images, test_folder, preprocess_image, batch_size=32):
     """
     Predicts fire presence in a list of test images using a trained model.
 
+    Images are scored in batches with `predict_batch`; one line is printed per image.
+    An image that `preprocess_image` fails on raises its error, as with per-image scoring.
+
     Args:
     - model: Trained machine learning model.
     - test_images: List of image filenames.
     - test_folder: Path to the folder containing test images.
     - preprocess_image: Function to preprocess an image before prediction.
+    - batch_size: Number of images per model call.
+
+    Returns:
+    - pd.DataFrame with the per-image predictions (see `predict_batch`).
     """
-    for img_name in test_images:
-        img_path = os.path.join(test_folder, img_name)
-        img_array = preprocess_image(img_path)
-        prediction = model.predict(img_array)[0][0]
-        predicted_class = 'Fire' if prediction > 0.5 else 'No Fire'
-        confidence = prediction if prediction > 0.5 else 1 - prediction
+    image_paths = [os.path.join(test_folder, img_name) for img_name in test_images]
+    results = predict_batch(model, image_paths, preprocess_image, batch_size=batch_size,
+                            skip_unreadable=False)
 
-        print(f"Image: {img_name}, Predicted: {predicted_class}, Confidence: {confidence:.2f}")
+    names = dict(zip(image_paths, test_images))
+    for row in results.itertuples(index=False):
+        img_name = names[row.path]
+        print(f"Image: {img_name}, Predicted: {row.predicted_class}, Confidence: {row.confidence:.2f}")
 
+    return results
@@ -0,0 +1,186 @@
+import cv2
+import numpy as np
+import pandas as pd
+from lib.image_preprocessor import apply_clahe_tiled, patch_origins
+from lib.predictor import fire_probabilities
+
+def geometry_bounds(geometry):
+    """
+    Get the (west, south, east, north) bounds of a scene.
+
+    Args:
+        geometry: The `ee.Geometry` rectangle returned by `get_satellite_collection`, or a
+                  (west, south, east, north) sequence in degrees. Rectangles built on the
+                  client are read without a server round trip.
+
+    Returns:
+        tuple: (west, south, east, north) in degrees.
+    """
+    if hasattr(geometry, 'toGeoJSON'):
+        coords = np.asarray(geometry.toGeoJSON()['coordinates'][0], dtype=float)
+        return (coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max())
+    west, south, east, north = geometry
+    return west, south, east, north
+
+def pixel_to_lonlat(x, y, shape, bounds):
+    """
+    Convert pixel coordinates of a north-up scene to longitude/latitude.
+
+    Args:
+        x (float | numpy.ndarray): Column coordinate(s) in pixels.
+        y (float | numpy.ndarray): Row coordinate(s) in pixels.
+        shape (tuple): (height, width) of the scene.
+        bounds (tuple): (west, south, east, north) of the scene in degrees.
+
+    Returns:
+        tuple: (longitude, latitude).
+    """
+    h, w = shape[:2]
+    west, south, east, north = bounds
+    return west + x / w * (east - west), north - y / h * (north - south)
+
+def _window_stds(image, origins, patch_size):
+    """Pixel standard deviation over all channels of the windows at `origins`."""
+    # Per-channel box means of the image and of its square; with the anchor in the top-left
+    # corner, the value at (y, x) is the mean of the window with origin (y, x).
+    size, anchor = (patch_size, patch_size), (0, 0)
+    mean = cv2.boxFilter(image, cv2.CV_64F, size, anchor=anchor)
+    mean_sq = cv2.sqrBoxFilter(image, cv2.CV_64F, size, anchor=anchor)
+    ys, xs = origins[:, 0], origins[:, 1]
+    variance = mean_sq[ys, xs].mean(axis=-1) - mean[ys, xs].mean(axis=-1) ** 2
+    return np.sqrt(np.maximum(variance, 0))
+
+def scan_scene(image, predict_fn, geometry=None, patch_size=256, stride=128,
+               preprocess_patches=None, batch_size=64, threshold=0.5, min_std=2.0,
+               clip_limit=2.0, tile_grid=(8, 8)):
+    """
+    Localize fire in a full scene by scoring overlapping windows and merging them into a heatmap.
+
+    Workflow:
+        1. **Windowing**:
+           - Lays overlapping windows over the scene at the `patch_origins` offsets
+             (edge='shift', so the borders are covered too).
+           - Uniform windows (pixel standard deviation of the raw scene below `min_std`, e.g.
+             no-data fill or open water) are skipped. The deviations of all windows come from
+             two box filters over the scene; if every window is uniform the scene is skipped
+             before it is enhanced.
+
+        2. **Enhancement**:
+           - Applies CLAHE to the whole scene once, block by block with `apply_clahe_tiled`.
+             Windows are zero-copy views of the enhanced scene; only the windows of the
+             current batch are copied for the model.
+
+        3. **Scoring**:
+           - Scores the remaining windows in batches of `batch_size` with `predict_fn`.
+
+        4. **Merging**:
+           - Averages the window probabilities per pixel into a heatmap and thresholds it
+             into connected hotspots, georeferenced with the scene `geometry`.
+
+    Args:
+        image (numpy.ndarray): Scene in BGR format, shape (H, W, 3).
+        predict_fn (callable): Maps a batch of windows to model outputs, e.g. `model.predict`.
+        geometry (optional): The `ee.Geometry` returned by `get_satellite_collection` or
+                             (west, south, east, north) bounds. Without it, hotspots only
+                             have pixel coordinates.
+        patch_size (int, optional): Window size in pixels. Defaults to 256.
+        stride (int, optional): Step between windows. Defaults to 128.
+        preprocess_patches (callable, optional): Maps a (N, p, p, 3) uint8 window array to model
+                                                 input. Defaults to float32 conversion.
+        batch_size (int, optional): Windows per model call. Defaults to 64.
+        threshold (float, optional): Heatmap probability marking a hotspot. Defaults to 0.5.
+        min_std (float, optional): Minimum pixel standard deviation of a scored window,
+                                   before enhancement. Defaults to 2.0.
+        clip_limit (float, optional): CLAHE clip limit. Defaults to 2.0.
+        tile_grid (tuple, optional): CLAHE tile grid. Defaults to (8, 8).
+
+    Returns:
+        tuple:
+            - numpy.ndarray or None: (H, W) float32 fire probability heatmap, or None if the
+              scene was skipped. Pixels covered by no scored window are 0.
+            - pd.DataFrame: One row per hotspot with its pixel box, 'max_probability',
+              'mean_probability' and, with a geometry, 'west', 'south', 'east', 'north',
+              'longitude' and 'latitude' of its centroid.
+    """
+    preprocess_patches = preprocess_patches or (lambda batch: batch.astype(np.float32))
+    h, w = image.shape[:2]
+
+    ys = patch_origins(h, patch_size, stride, edge='shift')
+    xs = patch_origins(w, patch_size, stride, edge='shift')
+    origins = np.stack(np.meshgrid(ys, xs, indexing='ij'), axis=-1).reshape(-1, 2)
+    if len(origins) == 0:
+        return None, pd.DataFrame()
+
+    # Scenes smaller than a window are zero-padded, as in `split_into_patches`.
+    pad_h, pad_w = max(0, patch_size - h), max(0, patch_size - w)
+    padding = ((0, pad_h), (0, pad_w), (0, 0))
+
+    stds = _window_stds(np.pad(image, padding) if pad_h or pad_w else image, origins,
+                        patch_size)
+    keep = np.flatnonzero(stds >= min_std)
+    if len(keep) == 0:
+        print("Skipping scene: all windows are uniform")
+        return None, pd.DataFrame()
+
+    enhanced = apply_clahe_tiled(image, clip_limit, tile_grid)
+    if pad_h or pad_w:
+        enhanced = np.pad(enhanced, padding)
+    # (H - p + 1, W - p + 1, 3, p, p) view: windows[y, x] is the window at origin (y, x).
+    windows = np.lib.stride_tricks.sliding_window_view(enhanced, (patch_size, patch_size),
+                                                       axis=(0, 1))
+
+    scores = np.empty(len(keep), dtype=np.float32)
+    for start in range(0, len(keep), batch_size):
+        idx = keep[start:start + batch_size]
+        batch = np.ascontiguousarray(
+            windows[origins[idx, 0], origins[idx, 1]].transpose(0, 2, 3, 1))
+        scores[start:start + len(idx)] = fire_probabilities(
+            predict_fn(preprocess_patches(batch)), len(idx))
+
+    total = np.zeros((h, w), dtype=np.float32)
+    count = np.zeros((h, w), dtype=np.uint16)
+    for (y, x), score in zip(origins[keep], scores):
+        total[y:y + patch_size, x:x + patch_size] += score
+        count[y:y + patch_size, x:x + patch_size] += 1
+    heatmap = np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+    return heatmap, find_hotspots(heatmap, threshold, geometry)
+
+def find_hotspots(heatmap, threshold=0.5, geometry=None):
+    """
+    Extract connected regions of a heatmap above a threshold.
+
+    Args:
+        heatmap (numpy.ndarray): (H, W) probability heatmap.
+        threshold (float, optional): Minimum probability of hotspot pixels. Defaults to 0.5.
+        geometry (optional): Scene geometry or bounds, see `geometry_bounds`.
+
+    Returns:
+        pd.DataFrame: One row per hotspot, see `scan_scene`.
+    """
+    mask = (heatmap > threshold).astype(np.uint8)
+    n, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    rows = []
+    for label in range(1, n):
+        x, y, bw, bh, area = stats[label]
+        values = heatmap[labels == label]
+        rows.append({
+            'x_min': x, 'y_min': y, 'x_max': x + bw, 'y_max': y + bh, 'area_px': area,
+            'max_probability': float(values.max()),
+            'mean_probability': float(values.mean()),
+            'cx': centroids[label][0], 'cy': centroids[label][1],
+        })
+    hotspots = pd.DataFrame(rows, columns=['x_min', 'y_min', 'x_max', 'y_max', 'area_px',
+                                           'max_probability', 'mean_probability', 'cx', 'cy'])
+
+    if geometry is not None:
+        bounds = geometry_bounds(geometry)
+        shape = heatmap.shape
+        hotspots['west'], hotspots['north'] = pixel_to_lonlat(
+            hotspots['x_min'], hotspots['y_min'], shape, bounds)
+        hotspots['east'], hotspots['south'] = pixel_to_lonlat(
+            hotspots['x_max'], hotspots['y_max'], shape, bounds)
+        hotspots['longitude'], hotspots['latitude'] = pixel_to_lonlat(
+            hotspots['cx'], hotspots['cy'], shape, bounds)
+    return hotspots
@@ -58,3 +58,37 @@ def fine_tune_model(model, base_model, train_generator, val_generator, epochs=10
         callbacks=[early_stopping, lr_scheduler]
     )
     return history
+
+def train_head_on_features(head, train_features, train_labels, val_features, val_labels,
+                           epochs=20, batch_size=64):
+    """
+    Train a Keras classification head on features cached from the frozen base model.
+
+    Features come from `lib.feature_cache.cache_features` with the frozen base model's
+    `predict_on_batch`, so each epoch only runs the head. Uses the same early stopping and
+    learning rate schedule as `train_model`.
+
+    Args:
+        head: Compiled Keras model whose input matches the cached feature shape.
+        train_features (numpy.ndarray): Training features.
+        train_labels (numpy.ndarray): Training labels.
+        val_features (numpy.ndarray): Validation features.
+        val_labels (numpy.ndarray): Validation labels.
+        epochs (int): Number of training epochs.
+        batch_size (int): Batch size.
+
+    Returns:
+        History object from model.fit.
+    """
+    early_stopping = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True)
+    lr_scheduler = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=2, min_lr=1e-6)
+
+    history = head.fit(
+        train_features,
+        train_labels,
+        validation_data=(val_features, val_labels),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=[early_stopping, lr_scheduler]
+    )
+    return history
@@ -1,9 +1,16 @@
 import os
+import threading
 import requests
-import matplotlib.pyplot as plt
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lib.instrumentation import stage, add_bytes, add_retries, set_reason, log
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_thread_local = threading.local()
 
 # Dataset Processing Utility Functions
-def generate_download_url(image, rectangle):
+def generate_download_url(image, rectangle, bands=('B4', 'B3', 'B2')):
     """
     Generates a thumbnail download URL for a satellite image.
 
@@ -16,6 +23,8 @@ def generate_download_url(image, rectangle):
                `getThumbURL` method to produce a download URL.
         rectangle: A geographic region of interest, defined as a polygon or
                    bounding box, specifying the area to include in the thumbnail.
+        bands (tuple, optional): The three bands rendered as red, green and blue.
+                                 Defaults to ('B4', 'B3', 'B2').
 
     Returns:
         str: A URL to download the generated thumbnail image (expires after ~2 hours).
@@ -25,21 +34,74 @@ def generate_download_url(image, rectangle):
         'max': 0.5,
         'dimensions': 512,
         'format': 'png',
-        'bands': ['B4', 'B3', 'B2'],
+        'bands': list(bands),
         'region': rectangle
     })
 
-def download_image(url):
+def generate_array_download_url(image, rectangle, bands, scale=None, dimensions=None):
+    """
+    Generates a download URL for the raw pixel values of a multi-band image.
+
+    Unlike `generate_download_url`, no visualization is applied: the selected bands are
+    returned at full precision as a NumPy `.npy` structured array, one field per band.
+
+    Args:
+        image: An `ee.Image`, e.g. from `get_multiband_composite`.
+        rectangle: A geographic region of interest to export.
+        bands (list): Band names to include.
+        scale (float, optional): Pixel size in meters. Ignored if `dimensions` is given.
+        dimensions (int | str, optional): Output size, e.g. 512 or '512x512'.
+
+    Returns:
+        str: A URL to download the `.npy` array.
+    """
+    params = {
+        'format': 'NPY',
+        'bands': list(bands),
+        'region': rectangle,
+    }
+    if dimensions is not None:
+        params['dimensions'] = dimensions
+    elif scale is not None:
+        params['scale'] = scale
+    return image.getDownloadURL(params)
+
+def get_http_session():
+    """
+    Returns the keep-alive HTTP session of the calling thread.
+
+    Each worker thread reuses one `requests.Session`, so consecutive downloads share
+    pooled TCP/TLS connections instead of opening a new one per thumbnail. The session
+    retries 429 and 5xx responses with exponential backoff, honouring `Retry-After`.
+
+    Returns:
+        requests.Session: The session of the current thread.
+    """
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        # raise_on_status=False returns the last response once retries run out, so
+        # `raise_for_status` reports its status instead of a generic RetryError.
+        retry = Retry(total=4, backoff_factor=0.5, status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=['GET'], respect_retry_after_header=True,
+                      raise_on_status=False)
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(max_retries=retry))
+        session.mount('http://', HTTPAdapter(max_retries=retry))
+        _thread_local.session = session
+    return session
+
+def download_image(url, timeout=60):
     """
     Downloads an image from a given URL.
 
     Sends an HTTP GET request to the specified URL to download
     image data. If the request is successful, the image content is returned.
     In cases of network or HTTP errors, an error message is logged and None
-    is returned.
+    is returned. Requests go through the pooled session of `get_http_session`.
     
     Args:
         url (str): The URL of the image to be downloaded.
+        timeout (float, optional): Connect and read timeout in seconds. Defaults to 60.
     
     Returns:
         bytes | None: The binary content of the image if the download is successful, or 
@@ -49,11 +111,20 @@ def download_image(url):
         RequestException: If there is a network-related or HTTP protocol error.
     """
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        return response.content
+        with stage('download'):
+            response = get_http_session().get(url, timeout=timeout)
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None:
+                add_retries(len(retries.history))
+            response.raise_for_status()
+            add_bytes(len(response.content))
+            return response.content
     except requests.RequestException as e:
-        print(f"Failed to download image: {e}")
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            set_reason(f"http_{e.response.status_code}")
+        else:
+            set_reason('network')
+        log(f"Failed to download image: {e}", warning=True)
         return None
 
 def save_image(image_content, output_dir, filename):
@@ -71,24 +142,29 @@ def save_image(image_content, output_dir, filename):
         output_dir (str): The path to the directory where the image file should be saved. 
         filename (str): The desired name of the file (including extension) for the saved image.
 
+    Returns:
+        str | None: The path of the saved file, or None if nothing was written.
+
     Raises:
         OSError:
             If there is a failure in writing the file or creating directories,
             an OSError exception is raised and logged.
     """
     if image_content is None:
-        print(f"Skipping save: No content for {filename}")
-        return
+        log(f"Skipping save: No content for {filename}", warning=True)
+        return None
 
     os.makedirs(output_dir, exist_ok=True)
     file_path = os.path.join(output_dir, filename)
 
     try:
-        with open(file_path, 'wb') as f:
+        with stage('save'), open(file_path, 'wb') as f:
             f.write(image_content)
-        print(f"Saved: {file_path}")
+        log(f"Saved: {file_path}")
+        return file_path
     except OSError as e:
-        print(f"Failed to save {filename}: {e}")
+        log(f"Failed to save {filename}: {e}", warning=True)
+        return None
 
 # Model Training Utility Functions
 
@@ -99,6 +175,8 @@ def plot_training_history(history):
     Args:
         history: History object returned by model.fit.
     """
+    import matplotlib.pyplot as plt
+
     plt.plot(history.history['accuracy'], label='Training Accuracy')
     plt.plot(history.history['val_accuracy'], label='Validation Accuracy')
     plt.legend()
@@ -113,6 +191,8 @@ def plot_fine_tuning_history(history):
     Args:
         history: History object from fine-tuning.
     """
+    import matplotlib.pyplot as plt
+
     plt.plot(history.history['accuracy'], label='Training Accuracy (Fine-tune)')
     plt.plot(history.history['val_accuracy'], label='Validation Accuracy (Fine-tune)')
     plt.legend()
@@ -0,0 +1,29 @@
+from setuptools import setup
+
+EXTRAS = {
+    'extract': ['earthengine-api', 'requests', 'aiohttp', 'google-cloud-storage'],
+    'firms': ['pyarrow'],
+    'watch': ['earthengine-api', 'requests', 'aiohttp', 'opencv-python'],
+    'preprocess': ['opencv-python'],
+    'predict': ['opencv-python', 'torch', 'onnxruntime'],
+    'train': ['tensorflow', 'torch', 'matplotlib'],
+}
+EXTRAS['all'] = sorted({package for packages in EXTRAS.values() for package in packages})
+
+setup(
+    name='lib',
+    version='0.1.0',
+    packages=['lib'],
+    install_requires=[
+        'numpy',
+        'pandas'
+    ],
+    extras_require=EXTRAS,
+    entry_points={
+        'console_scripts': [
+            'wildfire-extract=lib.cli:extract_main',
+            'wildfire-preprocess=lib.cli:preprocess_main',
+            'wildfire-predict=lib.cli:predict_main',
+            'wildfire-watch=lib.cli:watch_main',
+        ]
+    })
@@ -0,0 +1,121 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+import lib.async_extraction as async_extraction
+from lib.async_extraction import AdaptiveConcurrencyLimiter, extract_events_async
+from lib.job_store import STATUS_DONE, STATUS_FAILED, STATUS_PENDING
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\0' * 64
+
+class RecordingLimiter(AdaptiveConcurrencyLimiter):
+    """Limiter keeping the limit after every finished request."""
+
+    history = []
+
+    async def release(self, ok):
+        await super().release(ok)
+        RecordingLimiter.history.append(self.limit)
+
+def stub_app(requests):
+    """
+    Routes, each recording its request times in `requests[path]`:
+        /ok/{n}       200
+        /flaky/{n}    503 on the first request, then 200
+        /throttled    429 with 'Retry-After: 0.3' on the first request, then 200
+        /missing      404
+        /stall        never answers within the client timeout
+    """
+    async def handler(request):
+        path = request.path
+        requests[path].append(time.monotonic())
+        attempt = len(requests[path])
+        if path.startswith('/flaky/') and attempt == 1:
+            return web.Response(status=503)
+        if path == '/throttled' and attempt == 1:
+            return web.Response(status=429, headers={'Retry-After': '0.3'})
+        if path == '/missing':
+            return web.Response(status=404)
+        if path == '/stall':
+            await asyncio.sleep(2)
+        return web.Response(body=PNG, content_type='image/png')
+
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handler)
+    return app
+
+def run_extraction(tmp_path, monkeypatch, paths):
+    monkeypatch.setattr(async_extraction, 'AdaptiveConcurrencyLimiter', RecordingLimiter)
+    RecordingLimiter.history = []
+    requests = defaultdict(list)
+    results = {}
+
+    async def main():
+        runner = web.AppRunner(stub_app(requests))
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        def prepare(path):
+            if path == 'raise':
+                raise RuntimeError("earth engine down")
+            return STATUS_PENDING, f"http://127.0.0.1:{port}{path}", None
+
+        def on_result(key, status, path, error):
+            results[key] = (status, path, error)
+
+        try:
+            limiter = await asyncio.wait_for(extract_events_async(
+                [(f"event_{i}", path) for i, path in enumerate(paths)], prepare,
+                str(tmp_path), on_result, url_workers=4, max_concurrency=8,
+                initial_concurrency=4, timeout=0.5, retries=2, backoff=0.01), timeout=30)
+        finally:
+            await runner.cleanup()
+        return limiter
+
+    limiter = asyncio.run(main())
+    return limiter, requests, results
+
+def test_retries_timeouts_and_statuses(tmp_path, monkeypatch):
+    paths = ['/throttled', '/flaky/0', '/missing', '/stall', 'raise', '/ok/0']
+    _, requests, results = run_extraction(tmp_path, monkeypatch, paths)
+
+    statuses = {paths[int(key.split('_')[1])]: result for key, result in results.items()}
+    assert set(statuses) == set(paths)
+
+    # 429 is retried after the server's Retry-After delay.
+    assert statuses['/throttled'][0] == STATUS_DONE
+    first, second = requests['/throttled']
+    assert second - first >= 0.3
+
+    # 503 is retried with backoff.
+    assert statuses['/flaky/0'][0] == STATUS_DONE
+    assert len(requests['/flaky/0']) == 2
+    assert (tmp_path / 'event_1.png').read_bytes() == PNG
+
+    # Other client errors fail at once.
+    assert statuses['/missing'] == (STATUS_FAILED, None, 'HTTP 404')
+    assert len(requests['/missing']) == 1
+
+    # A stalled response times out on every attempt.
+    assert statuses['/stall'][0] == STATUS_FAILED
+    assert statuses['/stall'][2] == 'TimeoutError'
+    assert len(requests['/stall']) == 3
+
+    # A failing URL stage is reported per event and does not block the consumers.
+    assert statuses['raise'] == (STATUS_FAILED, None, 'earth engine down')
+    assert statuses['/ok/0'][0] == STATUS_DONE
+
+def test_limiter_shrinks_on_errors_and_grows_back(tmp_path, monkeypatch):
+    paths = [f"/flaky/{i}" for i in range(8)] + [f"/ok/{i}" for i in range(60)]
+    limiter, _, results = run_extraction(tmp_path, monkeypatch, paths)
+
+    assert all(status == STATUS_DONE for status, _, _ in results.values())
+    history = RecordingLimiter.history
+    lowest = min(history)
+    assert lowest < 4
+    assert max(history[history.index(lowest):]) > lowest
+    assert limiter.limit == history[-1]
@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import lib.collection_cache as collection_cache
+from lib.collection_cache import CollectionCache
+
+DAY = 24 * 3600
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(pd.Timestamp('2024-08-10 12:00').timestamp())
+    monkeypatch.setattr(collection_cache.time, 'time', clock)
+    return clock
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    cache = CollectionCache(str(tmp_path / 'cache.sqlite'), ttl=30 * DAY, negative_ttl=3600)
+    cache.set('old-empty', 0, end_date='2024-07-01')
+    cache.set('recent-empty', 0, end_date='2024-08-11')
+    cache.set('recent-full', 3, end_date='2024-08-11')
+    cache.set('undated-empty', 0)
+
+    clock.now += 2 * 3600
+    # An empty result for a window that has just ended may only mean the scene is not
+    # ingested yet, so it expires after negative_ttl; everything else is kept.
+    assert cache.get('recent-empty') is None
+    assert cache.get('old-empty') == 0
+    assert cache.get('recent-full') == 3
+    assert cache.get('undated-empty') == 0
+
+    clock.now += 30 * DAY
+    assert cache.get('old-empty') is None
+    assert cache.get('recent-full') is None
+    cache.close()
+
+def test_provisional_negatives_can_be_disabled(tmp_path, clock):
+    cache = CollectionCache(str(tmp_path / 'cache.sqlite'), negative_ttl=0)
+    cache.set('recent-empty', 0, end_date='2024-08-09')
+    cache.set('settled-empty', 0, end_date='2024-08-01')
+    assert cache.get('recent-empty') is None
+    assert cache.get('settled-empty') == 0
+    cache.close()
+
+def test_evict_drops_expired_and_least_recently_used_entries(tmp_path, clock):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = CollectionCache(path, ttl=10 * DAY, max_entries=2, negative_ttl=3600)
+    cache.set('a', 1)
+    clock.now += 60
+    cache.set('b', 2)
+    cache.set('recent-empty', 0, end_date='2024-08-10')
+    clock.now += 60
+    cache.set('c', 3)
+    clock.now += 60
+    assert cache.get('a') == 1
+
+    clock.now += 2 * 3600
+    # 'recent-empty' expired; of the rest, 'b' is the least recently used.
+    assert cache.evict() == 2
+    assert [cache.get(key) for key in ('a', 'b', 'c')] == [1, None, 3]
+
+    clock.now += 10 * DAY
+    assert CollectionCache(path, ttl=10 * DAY).get('c') is None
+    cache.close()
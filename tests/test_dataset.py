@@ -0,0 +1,54 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from lib.dataset import build_image_cache
+
+def write_image(path, value, mtime_ns=None):
+    cv2.imwrite(str(path), np.full((32, 32, 3), value, dtype=np.uint8))
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_image_cache_is_rebuilt_when_a_file_changes(tmp_path):
+    paths = [tmp_path / 'a.png', tmp_path / 'b.png']
+    write_image(paths[0], 10)
+    write_image(paths[1], 20)
+    cache_dir = str(tmp_path / 'cache')
+
+    cache_path = build_image_cache([str(p) for p in paths], cache_dir, size=(8, 8), num_workers=1)
+    assert np.load(cache_path)[1].max() == 20
+    built = os.stat(cache_path).st_mtime_ns
+
+    # Unchanged files reuse the cache.
+    build_image_cache([str(p) for p in paths], cache_dir, size=(8, 8), num_workers=1)
+    assert os.stat(cache_path).st_mtime_ns == built
+
+    # Same path, same byte size, new pixels and modification time.
+    size = os.path.getsize(paths[1])
+    write_image(paths[1], 30, mtime_ns=os.stat(paths[1]).st_mtime_ns + 1_000_000_000)
+    assert os.path.getsize(paths[1]) == size
+    cache_path = build_image_cache([str(p) for p in paths], cache_dir, size=(8, 8), num_workers=1)
+    assert np.load(cache_path)[1].max() == 30
+
+def test_interrupted_rebuild_is_not_reused(tmp_path, monkeypatch):
+    paths = [tmp_path / 'a.png', tmp_path / 'b.png']
+    write_image(paths[0], 10)
+    write_image(paths[1], 20)
+    cache_dir = str(tmp_path / 'cache')
+    build_image_cache([str(p) for p in paths], cache_dir, size=(8, 8), num_workers=1)
+
+    # A rebuild for another size fails halfway; the old cache is left untouched...
+    def fail(*args, **kwargs):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(cv2, 'resize', fail)
+        with pytest.raises(KeyboardInterrupt):
+            build_image_cache([str(p) for p in paths], cache_dir, size=(4, 4), num_workers=1)
+    assert np.load(os.path.join(cache_dir, 'images.npy')).shape == (2, 8, 8, 3)
+
+    # ...but no longer matches its old parameters, so it is rebuilt rather than trusted.
+    cache_path = build_image_cache([str(p) for p in paths], cache_dir, size=(8, 8), num_workers=1)
+    images = np.load(cache_path)
+    assert images.shape == (2, 8, 8, 3) and images[1].max() == 20
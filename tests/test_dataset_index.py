@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from lib.dataset_index import hamming_distance, near_duplicate_groups
+
+def reference_groups(hashes, max_distance):
+    """Connected components of the all-pairs distance graph, named after their first index."""
+    close = hamming_distance(hashes[:, None], hashes[None, :]) <= max_distance
+    groups = np.full(len(hashes), -1)
+    for seed in range(len(hashes)):
+        if groups[seed] >= 0:
+            continue
+        groups[seed], stack = seed, [seed]
+        while stack:
+            for other in np.flatnonzero(close[stack.pop()]):
+                if groups[other] < 0:
+                    groups[other] = seed
+                    stack.append(other)
+    return groups
+
+@pytest.mark.parametrize('max_distance, block', [(2, 50), (6, 50), (6, 1 << 22)])
+def test_near_duplicate_groups_match_all_pairs(max_distance, block):
+    rng = np.random.default_rng(max_distance)
+    centers = rng.integers(0, 2 ** 63, 30, dtype=np.uint64)
+    noise = np.zeros(1500, dtype=np.uint64)
+    for _ in range(3):
+        noise ^= np.uint64(1) << rng.integers(0, 64, len(noise)).astype(np.uint64)
+    hashes = np.concatenate([centers[rng.integers(0, len(centers), len(noise))] ^ noise,
+                             rng.integers(0, 2 ** 63, 300, dtype=np.uint64)])
+
+    groups = near_duplicate_groups(hashes, max_distance=max_distance, block=block)
+    np.testing.assert_array_equal(groups, reference_groups(hashes, max_distance))
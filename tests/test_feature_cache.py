@@ -0,0 +1,42 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader, SubsetRandomSampler, TensorDataset
+
+from lib.feature_cache import cache_features, load_features
+
+def make_dataset(n=10):
+    inputs = torch.arange(n, dtype=torch.float32).reshape(n, 1)
+    return TensorDataset(inputs, torch.arange(n) % 2)
+
+def identity(inputs):
+    return np.asarray(inputs)
+
+@pytest.mark.parametrize('loader_kwargs', [{'drop_last': True},
+                                           {'sampler': SubsetRandomSampler(range(6))}])
+def test_features_match_the_samples_drawn(tmp_path, loader_kwargs):
+    batches = DataLoader(make_dataset(), batch_size=4, **loader_kwargs)
+    cache_dir = cache_features(identity, batches, str(tmp_path), key='k', dtype=np.float32)
+
+    features, labels = load_features(cache_dir)
+    assert len(features) == len(labels) == json.loads((tmp_path / 'meta.json').read_text())['num_samples']
+    np.testing.assert_array_equal(features[:, 0] % 2, labels)
+
+def test_interrupted_extraction_is_not_reused(tmp_path):
+    cache_features(identity, DataLoader(make_dataset(), batch_size=4), str(tmp_path), key='k')
+
+    def fail(inputs):
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        cache_features(fail, DataLoader(make_dataset(), batch_size=4), str(tmp_path), key='k2')
+    assert not os.path.exists(tmp_path / 'meta.json')
+
+    calls = []
+    def record(inputs):
+        calls.append(len(inputs))
+        return identity(inputs)
+    cache_features(record, DataLoader(make_dataset(), batch_size=4), str(tmp_path), key='k')
+    assert calls == [4, 4, 2]
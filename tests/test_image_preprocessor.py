@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+
+import lib.image_preprocessor as image_preprocessor
+from lib.patch_store import PatchStore
+
+def write_folder(root, count=3, size=96):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        category = ('fire', 'no_fire')[i % 2]
+        (root / category).mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(root / category / f"{i}.png"),
+                    rng.integers(0, 255, (size, size, 3), dtype=np.uint8))
+    (root / 'fire' / 'broken.png').write_bytes(b'not an image')
+
+def test_preprocess_to_store_matches_with_and_without_a_pool(tmp_path, monkeypatch):
+    write_folder(tmp_path / 'input')
+    input_dir = str(tmp_path / 'input')
+    # A single usable CPU runs in this process whatever max_workers asks for.
+    monkeypatch.setattr(image_preprocessor, '_usable_cpus', lambda: 1)
+    serial = image_preprocessor.preprocess_to_store(input_dir, str(tmp_path / 'serial'),
+                                                    patch_size=32, max_workers=4)
+
+    monkeypatch.setattr(image_preprocessor, '_usable_cpus', lambda: 2)
+    total = image_preprocessor.preprocess_to_store(input_dir, str(tmp_path / 'pool'),
+                                                   patch_size=32, max_workers=4)
+    expected, actual = PatchStore(str(tmp_path / 'serial')), PatchStore(str(tmp_path / 'pool'))
+    assert total == serial == len(expected) == 27
+    assert list(actual.index['category']) == list(expected.index['category'])
+    np.testing.assert_array_equal(actual.get_batch(range(total)), expected.get_batch(range(total)))
+
+def test_clahe_batch_matches_with_and_without_threads(monkeypatch):
+    images = np.random.default_rng(0).integers(0, 255, (5, 64, 64, 3), dtype=np.uint8)
+    expected = np.stack([image_preprocessor.apply_clahe_rgb(image) for image in images])
+
+    for cpus in (1, 4):
+        monkeypatch.setattr(image_preprocessor, '_usable_cpus', lambda: cpus)
+        np.testing.assert_array_equal(image_preprocessor.apply_clahe_batch(images, num_workers=8),
+                                      expected)
@@ -0,0 +1,66 @@
+import pandas as pd
+
+import lib.image_processor as image_processor
+from lib.event_planner import plan_extraction_jobs
+from lib.job_store import ExtractionJobStore, STATUS_FAILED, STATUS_NO_IMAGERY, event_key
+
+def record_windows(monkeypatch):
+    windows = []
+
+    def get_satellite_collection(longitude, latitude, start_date, end_date, **kwargs):
+        windows.append((start_date, end_date))
+        return None, None
+
+    monkeypatch.setattr(image_processor, 'get_satellite_collection', get_satellite_collection)
+    return windows
+
+def test_event_window_defaults_to_one_day_around_acq_date(monkeypatch):
+    windows = record_windows(monkeypatch)
+    row = pd.Series({'latitude': 40.4, 'longitude': 49.8, 'acq_date': '2024-08-10'})
+
+    assert image_processor.prepare_event_download(row)[0] == STATUS_NO_IMAGERY
+    assert windows == [('2024-08-09', '2024-08-11')]
+
+def test_planned_jobs_search_their_own_window(monkeypatch, tmp_path):
+    windows = record_windows(monkeypatch)
+    fire_df = pd.DataFrame({'latitude': [40.4, 40.41], 'longitude': [49.8, 49.81],
+                            'acq_date': ['2024-08-10', '2024-08-10']})
+    jobs, _ = plan_extraction_jobs(fire_df, window_days=3)
+
+    for _, job in jobs.iterrows():
+        image_processor.extract_event(job, str(tmp_path))
+    assert windows == [('2024-08-07', '2024-08-13')] * len(jobs)
+
+def test_recent_no_imagery_events_are_retried(monkeypatch, tmp_path):
+    windows = record_windows(monkeypatch)
+    today = pd.Timestamp.now('UTC').strftime('%Y-%m-%d')
+    fire_df = pd.DataFrame({'latitude': [40.4, 40.5], 'longitude': [49.8, 49.9],
+                            'acq_date': [today, '2020-08-10']})
+    store = ExtractionJobStore(str(tmp_path / 'jobs.sqlite'))
+    keys = [event_key(row) for _, row in fire_df.iterrows()]
+    store.mark_pending([(key, f"{key}.png") for key in keys])
+    for key in keys:
+        store.record(key, STATUS_NO_IMAGERY)
+
+    # Only today's event may still get its scene; the 2020 one was checked long after.
+    results = image_processor.process_event_batch(fire_df, str(tmp_path), max_workers=1,
+                                                  job_store=store, return_status=True)
+    assert results == [(None, STATUS_NO_IMAGERY)] * 2
+    assert len(windows) == 1 and windows[0][0] < today < windows[0][1]
+
+    image_processor.process_event_batch(fire_df, str(tmp_path), max_workers=1, job_store=store,
+                                        retry_no_imagery_days=None)
+    assert len(windows) == 1
+    store.close()
+
+def test_array_extraction_registers_npy_filenames(monkeypatch, tmp_path):
+    monkeypatch.setattr(image_processor, 'extract_event_array',
+                        lambda row, output_dir, **kwargs: (STATUS_FAILED, None, 'offline'))
+    fire_df = pd.DataFrame({'latitude': [40.4], 'longitude': [49.8], 'acq_date': ['2024-08-10']})
+    store = ExtractionJobStore(str(tmp_path / 'jobs.sqlite'))
+
+    image_processor.process_event_batch(fire_df, str(tmp_path), max_workers=1, job_store=store,
+                                        array_options={'bands': ['B4']})
+    filenames = [row[0] for row in store.conn.execute('SELECT filename FROM events')]
+    assert filenames == [f"{event_key(fire_df.iloc[0])}.npy"]
+    store.close()
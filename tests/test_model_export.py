@@ -0,0 +1,23 @@
+import cv2
+import numpy as np
+import pytest
+
+from lib.model_export import torch_preprocess
+
+def test_torch_preprocess_approximates_the_notebook_transforms(tmp_path):
+    transforms = pytest.importorskip('torchvision.transforms')
+    from PIL import Image
+
+    noise = np.random.default_rng(0).integers(0, 255, (512, 512, 3), dtype=np.uint8)
+    path = str(tmp_path / 'scene.png')
+    cv2.imwrite(path, cv2.GaussianBlur(noise, (0, 0), 2))
+    expected = transforms.Compose([
+        transforms.Resize((224, 224)), transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    ])(Image.open(path).convert('RGB')).numpy()
+
+    actual = torch_preprocess()(path)
+    assert actual.shape == expected.shape
+    std = np.array([0.229, 0.224, 0.225]).reshape(3, 1, 1)
+    levels = np.abs(actual - expected) * std * 255
+    assert levels.max() < 3.5
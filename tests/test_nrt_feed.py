@@ -0,0 +1,121 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from lib.event_planner import plan_extraction_jobs
+from lib.job_store import (ExtractionJobStore, STATUS_DONE, STATUS_FAILED, STATUS_NO_IMAGERY,
+                           event_key)
+from lib.nrt_feed import advance_watermarks, load_feed_state, new_detections
+
+NOW = pd.Timestamp.now('UTC').tz_localize(None).floor('min')
+
+def write_nrt(raw_dir, detections, name='MODIS_C6_1_Global_nrt_7d.csv'):
+    """Write (latitude, longitude, acq_datetime) MODIS detections as a FIRMS NRT file."""
+    rows = [{'latitude': lat, 'longitude': lon, 'brightness': 330.0, 'scan': 1.0, 'track': 1.0,
+             'acq_date': when.strftime('%Y-%m-%d'), 'acq_time': int(when.strftime('%H%M')),
+             'satellite': 'Terra', 'instrument': 'MODIS', 'confidence': 90, 'version': '6.1NRT',
+             'bright_t31': 300.0, 'frp': 12.5, 'daynight': 'D'}
+            for lat, lon, when in detections]
+    raw_dir.mkdir(exist_ok=True)
+    pd.DataFrame(rows).to_csv(raw_dir / name, index=False)
+
+def record(store, key, status, checked_at=None):
+    store.mark_pending([(key, f"{key}.png")])
+    store.record(key, status)
+    if checked_at is not None:
+        store.conn.execute('UPDATE events SET checked_at = ? WHERE event_key = ?',
+                           (checked_at.timestamp(), key))
+        store.conn.commit()
+
+def key(lat, lon, when):
+    return event_key({'latitude': lat, 'longitude': lon, 'acq_date': when})
+
+@pytest.fixture
+def store(tmp_path):
+    store = ExtractionJobStore(str(tmp_path / 'jobs.sqlite'))
+    yield store
+    store.close()
+
+def test_watermark_and_lookback_select_new_rows(tmp_path, store):
+    old, overlap, new = NOW - pd.Timedelta(hours=6), NOW - pd.Timedelta(hours=2), NOW
+    write_nrt(tmp_path / 'raw', [(40.1, 49.1, old), (40.2, 49.2, overlap), (40.3, 49.3, new)])
+    state = load_feed_state(str(tmp_path / 'state.json'))
+    state['watermarks']['modis'] = (NOW - pd.Timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M')
+
+    # The lookback reaches back before the watermark; older rows are history.
+    events = new_detections(str(tmp_path / 'raw'), state, store, lookback_minutes=180,
+                            retry_no_imagery_days=None)
+    assert list(events['latitude']) == [40.2, 40.3]
+
+    # Rows of the overlap that are already done are not extracted twice.
+    record(store, key(40.2, 49.2, overlap), STATUS_DONE)
+    events = new_detections(str(tmp_path / 'raw'), state, store, lookback_minutes=180,
+                            retry_no_imagery_days=None)
+    assert list(events['latitude']) == [40.3]
+    assert list(events['event_key']) == [key(40.3, 49.3, new)]
+
+def test_no_imagery_is_retried_within_the_ingestion_horizon(tmp_path, store):
+    fresh, settled = NOW - pd.Timedelta(hours=2), NOW - pd.Timedelta(days=2)
+    write_nrt(tmp_path / 'raw', [(40.1, 49.1, fresh), (40.2, 49.2, settled)])
+    state = load_feed_state(str(tmp_path / 'state.json'))
+    # Both rows are behind the watermark, as after the cycle that found them empty.
+    state['watermarks']['modis'] = NOW.strftime('%Y-%m-%dT%H:%M')
+    record(store, key(40.1, 49.1, fresh), STATUS_NO_IMAGERY)
+    record(store, key(40.2, 49.2, settled), STATUS_NO_IMAGERY)
+
+    # The fresh detection's window ends tomorrow: its scene may still be ingested.
+    events = new_detections(str(tmp_path / 'raw'), state, store, lookback_minutes=0,
+                            retry_no_imagery_days=1)
+    assert list(events['latitude']) == [40.1]
+
+    # The older one was checked more than a day after its window ended, which is final,
+    # unless that check happened before the horizon.
+    record(store, key(40.2, 49.2, settled), STATUS_NO_IMAGERY,
+           checked_at=NOW - pd.Timedelta(days=1, hours=12))
+    events = new_detections(str(tmp_path / 'raw'), state, store, lookback_minutes=0,
+                            retry_no_imagery_days=1)
+    assert list(events['latitude']) == [40.2, 40.1]
+
+    # Without a horizon every empty result is final.
+    assert new_detections(str(tmp_path / 'raw'), state, store, lookback_minutes=0,
+                          retry_no_imagery_days=None).empty
+
+def test_ledgers_without_check_times_are_upgraded(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE events (event_key TEXT PRIMARY KEY, filename TEXT NOT NULL,
+                    status TEXT NOT NULL, path TEXT, error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)""")
+    conn.execute("INSERT INTO events VALUES ('a', 'a.png', 'no_imagery', NULL, NULL, 1, 123.0)")
+    conn.commit()
+    conn.close()
+
+    store = ExtractionJobStore(path)
+    assert store.checked_at(['a']) == {'a': 123.0}
+    store.close()
+
+def test_deduplicated_feed_diffs_against_job_keys(tmp_path, store):
+    # Two detections in the same tile share one scene job.
+    write_nrt(tmp_path / 'raw', [(40.1, 49.1, NOW), (40.1001, 49.1001, NOW)])
+    state = load_feed_state(str(tmp_path / 'state.json'))
+
+    events = new_detections(str(tmp_path / 'raw'), state, store, deduplicate=True)
+    assert events['ledger_key'].nunique() == 1
+    jobs, _ = plan_extraction_jobs(events)
+    assert events['ledger_key'].iloc[0] == event_key(jobs.iloc[0])
+
+    record(store, events['ledger_key'].iloc[0], STATUS_DONE)
+    assert new_detections(str(tmp_path / 'raw'), state, store, deduplicate=True).empty
+
+def test_watermark_stops_before_failures():
+    state = {'watermarks': {'modis': '2024-08-10T00:00'}}
+    events = pd.DataFrame({'sensor': ['modis'] * 3,
+                           'acq_datetime': pd.to_datetime(['2024-08-10 10:00', '2024-08-10 11:00',
+                                                           '2024-08-10 12:00'])})
+
+    advance_watermarks(state, events, [STATUS_DONE, STATUS_FAILED, STATUS_DONE])
+    assert state['watermarks']['modis'] == '2024-08-10T10:59'
+
+    advance_watermarks(state, events, [STATUS_DONE, STATUS_NO_IMAGERY, STATUS_DONE])
+    assert state['watermarks']['modis'] == '2024-08-10T12:00'
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from lib.predictor import fire_probabilities, predict_batch, predict_fire
+
+class MeanModel:
+    @staticmethod
+    def predict(batch):
+        return batch.mean(axis=(1, 2, 3))
+
+def preprocess_image(path):
+    if path.endswith('broken.png'):
+        raise ValueError("unreadable image")
+    return np.full((1, 4, 4, 3), 0.9 if 'fire' in path else 0.1, dtype=np.float32)
+
+def test_predict_batch_skips_unreadable_images(capsys):
+    results = predict_batch(MeanModel(), ['a/fire.png', 'a/broken.png', 'a/clear.png'],
+                            preprocess_image, batch_size=2, num_workers=2)
+
+    assert list(results['path']) == ['a/fire.png', 'a/clear.png']
+    assert list(results['predicted_class']) == ['Fire', 'No Fire']
+    assert "Skipping unreadable image: a/broken.png" in capsys.readouterr().out
+
+def test_predict_fire_raises_on_unreadable_images():
+    with pytest.raises(ValueError, match="unreadable image"):
+        predict_fire(MeanModel(), ['fire.png', 'broken.png'], 'a', preprocess_image)
+
+def test_fire_probabilities_reads_probabilities_and_logits():
+    np.testing.assert_allclose(fire_probabilities([[0.8], [0.1]], 2), [0.8, 0.1])
+    np.testing.assert_allclose(fire_probabilities([[0.3, 0.7], [0.9, 0.1]], 2), [0.7, 0.1])
+    # Two-class logits: the fire logit alone would pass a 0.5 threshold for both images.
+    np.testing.assert_allclose(fire_probabilities([[2.0, 0.6], [0.0, 2.0]], 2),
+                               [1 / (1 + np.exp(1.4)), 1 / (1 + np.exp(-2.0))], rtol=1e-6)
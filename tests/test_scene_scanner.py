@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from lib.image_preprocessor import apply_clahe_tiled, split_into_patches
+from lib.scene_scanner import scan_scene
+
+@pytest.mark.parametrize('shape, patch_size, stride', [
+    ((300, 420, 3), 128, 64),     # shifted edge windows
+    ((256, 384, 3), 128, 128),    # windows on the regular grid
+    ((100, 150, 3), 128, 64),     # scene smaller than a window
+])
+def test_scan_scene_scores_every_window_in_batches(shape, patch_size, stride):
+    image = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    batches = []
+
+    def predict_fn(batch):
+        batches.append(batch)
+        return batch.mean(axis=(1, 2, 3)) / 255
+
+    heatmap, _ = scan_scene(image, predict_fn, patch_size=patch_size, stride=stride,
+                            batch_size=3)
+
+    expected = split_into_patches(apply_clahe_tiled(image), patch_size, stride=stride,
+                                  edge='shift')
+    assert all(len(batch) <= 3 for batch in batches)
+    np.testing.assert_array_equal(np.concatenate(batches), expected.astype(np.float32))
+    assert heatmap.shape == shape[:2]
+
+def test_uniform_windows_are_skipped_before_enhancement(monkeypatch):
+    import lib.scene_scanner as scene_scanner
+    enhanced = []
+    monkeypatch.setattr(scene_scanner, 'apply_clahe_tiled',
+                        lambda image, *args: enhanced.append(image) or image)
+    def predict_fn(batch):
+        return np.ones(len(batch))
+
+    # No-data fill: nothing to score, so the scene is not enhanced either.
+    heatmap, hotspots = scan_scene(np.zeros((300, 420, 3), np.uint8), predict_fn,
+                                   patch_size=128, stride=64)
+    assert heatmap is None and hotspots.empty and not enhanced
+
+    # Only windows reaching into the textured right part are scored.
+    image = np.zeros((128, 384, 3), np.uint8)
+    image[:, 256:] = np.random.default_rng(0).integers(0, 255, (128, 128, 3))
+    heatmap, _ = scan_scene(image, predict_fn, patch_size=128, stride=64)
+    assert len(enhanced) == 1
+    assert heatmap[:, :192].max() == 0 and heatmap[:, 192:].min() == 1
@@ -0,0 +1,66 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from lib.instrumentation import Instrumentation, ProgressView
+from lib.utils import download_image, get_http_session, save_image
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/status/{code} always answers `code`; everything else answers 200 with a body."""
+
+    def do_GET(self):
+        code = int(self.path.split('/')[-1]) if self.path.startswith('/status/') else 200
+        self.send_response(code)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    # Retry without sleeping, so exhausted retries are fast.
+    for adapter in get_http_session().adapters.values():
+        adapter.max_retries.backoff_factor = 0
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+@pytest.mark.parametrize('code', [429, 503, 404])
+def test_download_failure_reason_keeps_http_status(server, code):
+    instrumentation = Instrumentation(progress=False)
+    with instrumentation.event('event') as trace:
+        assert download_image(f"{server}/status/{code}", timeout=5) is None
+        trace.status = 'failed'
+    assert trace.reason == f"http_{code}"
+    assert trace.retries == (4 if code != 404 else 0)
+
+def test_messages_do_not_break_the_progress_line(server, tmp_path, capsys):
+    stream = io.StringIO()
+    instrumentation = Instrumentation(progress=ProgressView(stream, interval=0))
+    instrumentation.add_total(2)
+    with instrumentation.event('ok') as trace:
+        save_image(download_image(f"{server}/image"), str(tmp_path), 'ok.png')
+        trace.status = 'done'
+    with instrumentation.event('missing') as trace:
+        download_image(f"{server}/status/404")
+        trace.status = 'failed'
+    instrumentation.close()
+
+    assert capsys.readouterr().out == ''
+    lines = stream.getvalue().split('\n')
+    assert 'Saved:' not in stream.getvalue()
+    assert any(line.endswith('Failed to download image: 404 Client Error: Not Found '
+                              f"for url: {server}/status/404") for line in lines)
+    assert lines[-2].split('\r')[-1].startswith('[2/2]')
+
+def test_messages_print_without_progress(server, tmp_path, capsys):
+    with Instrumentation(progress=False).event('ok') as trace:
+        save_image(download_image(f"{server}/image"), str(tmp_path), 'ok.png')
+        trace.status = 'done'
+    assert capsys.readouterr().out == f"Saved: {tmp_path / 'ok.png'}\n"
@@ -1,4 +1,7 @@
+import argparse
+import json
 import os
+import numpy as np
 import pandas as pd
 import csv
 import shutil
@@ -8,27 +11,109 @@ def combine_csv_files(input_folder, output_folder, output_filename="combined.csv
     """Combines all CSV files in a folder into one."""
     output_file = os.path.join(output_folder, output_filename)
     os.makedirs(output_folder, exist_ok=True)
-    combined_df = pd.DataFrame()
 
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".csv"):
-            file_path = os.path.join(input_folder, filename)
-            df = pd.read_csv(file_path)
-            combined_df = pd.concat([combined_df, df], ignore_index=True)
+    frames = [pd.read_csv(os.path.join(input_folder, filename))
+              for filename in sorted(os.listdir(input_folder)) if filename.endswith(".csv")]
+    combined_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     combined_df.to_csv(output_file, index=False)
     print(f"Combined file saved at: {output_file}")
     return output_file
 
 
-def merge_photo_urls(csv_file1, csv_file2, output_file, placeholder_photo_url):
-    """Merges wildfire coordinate CSV with photo URLs."""
+def nearest_coordinate_join(left_lon, left_lat, right_lon, right_lat, tolerance=1e-4,
+                            left_dates=None, right_dates=None, date_tolerance_days=None):
+    """Finds, for every left point, the nearest right point within a distance tolerance.
+
+    Right points are bucketed into a grid of `tolerance`-sized cells; each left point is
+    only compared with the points of its own and the 8 neighbouring cells, all in
+    vectorized NumPy. Distances are Euclidean in degrees. With `date_tolerance_days`,
+    candidates whose dates differ by more than that many days are ignored.
+
+    Returns an array holding the index of the matched right point, or -1, per left point.
+    """
+    left_lon, left_lat = np.asarray(left_lon, float), np.asarray(left_lat, float)
+    right_lon, right_lat = np.asarray(right_lon, float), np.asarray(right_lat, float)
+    use_dates = date_tolerance_days is not None
+    if use_dates:
+        left_days = pd.to_datetime(left_dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+        right_days = pd.to_datetime(right_dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+    offset, width = 1 << 26, 1 << 27
+
+    def cells(lon, lat):
+        return (np.floor(lon / tolerance).astype(np.int64),
+                np.floor(lat / tolerance).astype(np.int64))
+
+    rx, ry = cells(right_lon, right_lat)
+    order = np.argsort((rx + offset) * width + (ry + offset), kind='stable')
+    sorted_keys = ((rx + offset) * width + (ry + offset))[order]
+    lx, ly = cells(left_lon, left_lat)
+
+    best_index = np.full(len(left_lon), -1, dtype=np.int64)
+    best_distance = np.full(len(left_lon), np.inf)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = (lx + dx + offset) * width + (ly + dy + offset)
+            lo = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - lo
+            if counts.sum() == 0:
+                continue
+            li = np.repeat(np.arange(len(keys)), counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            rj = order[starts + np.arange(len(li))]
+
+            distance = np.hypot(left_lon[li] - right_lon[rj], left_lat[li] - right_lat[rj])
+            valid = distance <= tolerance
+            if use_dates:
+                valid &= np.abs(left_days[li] - right_days[rj]) <= date_tolerance_days
+            li, rj, distance = li[valid], rj[valid], distance[valid]
+
+            better = distance < best_distance[li]
+            li, rj, distance = li[better], rj[better], distance[better]
+            # Keep the closest candidate per left point within this neighbour cell.
+            ranked = np.lexsort((distance, li))
+            _, first = np.unique(li[ranked], return_index=True)
+            winners = ranked[first]
+            best_index[li[winners]] = rj[winners]
+            best_distance[li[winners]] = distance[winners]
+
+    return best_index
+
+
+def photo_date(photo_url):
+    """Parses the acquisition date out of a '<lat>_<lon>_<YYYY-MM-DD>.png' photo name, if present."""
+    stem = os.path.splitext(os.path.basename(str(photo_url)))[0]
+    return pd.to_datetime(stem.split('_')[-1], format='%Y-%m-%d', errors='coerce')
+
+
+def merge_photo_urls(csv_file1, csv_file2, output_file, placeholder_photo_url,
+                     tolerance=1e-4, date_tolerance_days=None):
+    """Merges wildfire coordinate CSV with photo URLs.
+
+    Each detection gets the URL of the nearest photo within `tolerance` degrees (and,
+    optionally, `date_tolerance_days` of the date in the photo name), so rounding
+    differences between filenames and FIRMS coordinates no longer drop matches.
+    """
     df1 = pd.read_csv(csv_file1)
     df2 = pd.read_csv(csv_file2)
     df1.rename(columns={'LONGITUDE': 'longitude', 'LATITUDE': 'latitude'}, inplace=True)
-    merged_df = pd.merge(df2, df1[['longitude', 'latitude', 'PHOTO_URL']], how='left', on=['latitude', 'longitude'])
-    merged_df['PHOTO_URL'] = merged_df['PHOTO_URL'].fillna(placeholder_photo_url)
+
+    dates = {}
+    if date_tolerance_days is not None:
+        dates = {'left_dates': df2['acq_date'], 'right_dates': df1['PHOTO_URL'].map(photo_date),
+                 'date_tolerance_days': date_tolerance_days}
+    match = nearest_coordinate_join(df2['longitude'], df2['latitude'],
+                                    df1['longitude'], df1['latitude'], tolerance, **dates)
+
+    merged_df = df2.copy()
+    photo_urls = df1['PHOTO_URL'].to_numpy()
+    merged_df['PHOTO_URL'] = np.where(match >= 0, photo_urls[np.maximum(match, 0)],
+                                      placeholder_photo_url)
     merged_df.to_csv(output_file, index=False)
+
+    matched = int((match >= 0).sum())
+    print(f"Matched {matched} of {len(merged_df)} rows to photos ({len(merged_df) - matched} unmatched)")
     print(f"Merged CSV saved at: {output_file}")
     return output_file
 
@@ -42,56 +127,185 @@ def remove_invalid_photos(input_file, output_file, placeholder_photo_url):
     return output_file
 
 
-def extract_coordinates_from_photos(folder_path, output_csv, invalid_folder):
-    """Extracts coordinates from image filenames and saves them in a CSV."""
-    os.makedirs(invalid_folder, exist_ok=True)
+def scan_photo_folder(folder_path, invalid_folder=None):
+    """Builds the photo coordinate table from image filenames in a single directory scan.
+
+    Files whose names do not parse as '<lat>_<lon>_<suffix>.png' are moved to
+    `invalid_folder` when it is given, and skipped otherwise.
+    """
     data = []
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith(".png"):
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            file_name = entry.name
+            if not file_name.endswith(".png"):
+                continue
             try:
                 base_name = os.path.splitext(file_name)[0]
                 latitude, longitude, _ = base_name.split('_')
                 data.append([float(longitude), float(latitude), os.path.join(folder_path, file_name)])
             except ValueError:
+                if invalid_folder is None:
+                    print(f"Invalid file name: {file_name}. Skipping")
+                    continue
                 print(f"Invalid file name: {file_name}. Moving to {invalid_folder}")
-                shutil.move(os.path.join(folder_path, file_name), os.path.join(invalid_folder, file_name))
+                os.makedirs(invalid_folder, exist_ok=True)
+                shutil.move(entry.path, os.path.join(invalid_folder, file_name))
+    return pd.DataFrame(data, columns=["LONGITUDE", "LATITUDE", "PHOTO_URL"])
+
+
+def extract_coordinates_from_photos(folder_path, output_csv, invalid_folder):
+    """Extracts coordinates from image filenames and saves them in a CSV."""
+    os.makedirs(invalid_folder, exist_ok=True)
+    data = scan_photo_folder(folder_path, invalid_folder)
 
     with open(output_csv, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(["LONGITUDE", "LATITUDE", "PHOTO_URL"])
-        writer.writerows(data)
+        writer.writerows(data.itertuples(index=False))
 
     print(f"CSV file created: {output_csv}")
     return output_csv
 
 
-def main():
-    # Define paths
-    input_folder = "CSV_FilesFolders/All4CSVofGit"
-    output_folder = "CSV_FilesFolders/J1_VIIRS_COMBINED_CSVs"
-    placeholder_photo_url = "CSV_FilesFolders/PlaceholderNotFound.png"
-
-    # Step 1: Combine CSV files
-    combined_csv = combine_csv_files(input_folder, output_folder)
-
-    # Step 2: Merge with Photo URLs
-    csv_with_photos = merge_photo_urls(
-        "CSV_FilesFolders/CoordinateCSVFolder/photo coordinates copy.csv",
-        combined_csv,
-        os.path.join(output_folder, "updated_file2.csv"),
-        placeholder_photo_url
-    )
+def shard_name(row_key, shard_by):
+    """Builds a shard file stem such as 'year=2021_region=39N46E' from a group key."""
+    row_key = row_key if isinstance(row_key, tuple) else (row_key,)
+    return '_'.join(f"{column}={value}" for column, value in zip(shard_by, row_key))
+
+
+def append_csv(df, path):
+    """Appends rows to a CSV file, writing the header only when the file is new."""
+    df.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+
+def write_geojson(csv_path, geojson_path):
+    """Converts a shard CSV with latitude/longitude columns into a GeoJSON FeatureCollection."""
+    df = pd.read_csv(csv_path)
+    properties = df.drop(columns=['latitude', 'longitude'])
+    features = [
+        {'type': 'Feature',
+         'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+         'properties': props}
+        for lon, lat, props in zip(df['longitude'], df['latitude'],
+                                   json.loads(properties.to_json(orient='records')))
+    ]
+    with open(geojson_path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+
+
+def build_website_dataset(input_folder, photo_folder, output_file, placeholder_photo_url,
+                          tolerance=1e-4, chunksize=50000, shard_dir=None,
+                          shard_by=('year', 'region'), geojson=False, debug_dir=None,
+                          invalid_folder=None):
+    """Streams the raw FIRMS CSVs through combine -> photo join -> filter in one pass.
 
-    # Step 3: Remove Invalid Photo URLs
-    cleaned_csv = remove_invalid_photos(csv_with_photos,
-                                        "CSV_FilesFolders/J1_VIIRS_COMBINED_CSVs/updated_file3.csv",
-                                        placeholder_photo_url)
+    Every CSV is read in chunks of `chunksize` rows, each chunk is joined to the photo
+    table with `nearest_coordinate_join`, and only matched rows are appended to
+    `output_file`, so memory stays bounded by the chunk size. With `shard_dir`, matched
+    rows are also split into per-year / per-region (1 degree tile) CSV shards, and
+    optionally GeoJSON tiles, that the website can fetch lazily. The intermediate files
+    of the step-by-step pipeline (combined.csv, updated_file2.csv, coordinates.csv) are
+    only written into `debug_dir` when it is given.
+    """
+    photos = scan_photo_folder(photo_folder, invalid_folder)
+    photo_urls = photos['PHOTO_URL'].to_numpy()
+
+    outputs = [output_file]
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        photos.to_csv(os.path.join(debug_dir, "coordinates.csv"), index=False)
+        combined_csv = os.path.join(debug_dir, "combined.csv")
+        merged_csv = os.path.join(debug_dir, "updated_file2.csv")
+        outputs += [combined_csv, merged_csv]
+    if shard_dir:
+        os.makedirs(shard_dir, exist_ok=True)
+        for name in os.listdir(shard_dir):
+            if name.endswith((".csv", ".geojson")):
+                outputs.append(os.path.join(shard_dir, name))
+    for path in outputs:
+        if os.path.exists(path):
+            os.remove(path)
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+
+    # MODIS and VIIRS files have different columns; align every chunk to their union.
+    csv_paths = [os.path.join(input_folder, filename)
+                 for filename in sorted(os.listdir(input_folder)) if filename.endswith(".csv")]
+    columns = []
+    for path in csv_paths:
+        columns += [column for column in pd.read_csv(path, nrows=0).columns if column not in columns]
+
+    total = matched = 0
+    shards = set()
+    for path in csv_paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            chunk = chunk.reindex(columns=columns)
+            match = nearest_coordinate_join(chunk['longitude'], chunk['latitude'],
+                                            photos['LONGITUDE'], photos['LATITUDE'], tolerance)
+            chunk['PHOTO_URL'] = np.where(match >= 0, photo_urls[np.maximum(match, 0)],
+                                          placeholder_photo_url)
+            if debug_dir:
+                append_csv(chunk.drop(columns=['PHOTO_URL']), combined_csv)
+                append_csv(chunk, merged_csv)
+
+            kept = chunk[match >= 0]
+            total += len(chunk)
+            matched += len(kept)
+            if kept.empty:
+                continue
+            append_csv(kept, output_file)
+
+            if shard_dir:
+                keys = pd.DataFrame({
+                    'year': pd.to_datetime(kept['acq_date']).dt.year,
+                    'region': (np.floor(kept['latitude']).astype(int).astype(str) + 'N'
+                               + np.floor(kept['longitude']).astype(int).astype(str) + 'E'),
+                }, index=kept.index)
+                for key, group in kept.groupby([keys[column] for column in shard_by]):
+                    name = shard_name(key, shard_by)
+                    append_csv(group, os.path.join(shard_dir, f"{name}.csv"))
+                    shards.add(name)
+
+    if shard_dir and geojson:
+        for name in shards:
+            write_geojson(os.path.join(shard_dir, f"{name}.csv"),
+                          os.path.join(shard_dir, f"{name}.geojson"))
+
+    print(f"Matched {matched} of {total} rows to photos ({total - matched} unmatched)")
+    print(f"Website dataset saved at: {output_file}"
+          + (f" ({len(shards)} shards in {shard_dir})" if shard_dir else ""))
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the website CSV dataset from raw FIRMS files.")
+    parser.add_argument("--input-folder", default="CSV_FilesFolders/All4CSVofGit")
+    parser.add_argument("--photo-folder", default="CSV_FilesFolders/PhotoFile4Wildfire")
+    parser.add_argument("--output-file", default="CSV_FilesFolders/J1_VIIRS_COMBINED_CSVs/updated_file3.csv")
+    parser.add_argument("--placeholder", default="CSV_FilesFolders/PlaceholderNotFound.png")
+    parser.add_argument("--invalid-folder", default="CSV_FilesFolders/InvalidPhotoName")
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="maximum photo/detection distance in degrees")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--shard-dir", help="also write per-year/per-region shards here")
+    parser.add_argument("--shard-by", nargs="+", default=["year", "region"],
+                        choices=["year", "region"])
+    parser.add_argument("--geojson", action="store_true", help="write GeoJSON tiles for shards")
+    parser.add_argument("--debug", action="store_true",
+                        help="keep the intermediate CSV files next to the output")
+    args = parser.parse_args()
 
-    # Step 4: Extract Coordinates from Photos
-    extract_coordinates_from_photos(
-        "CSV_FilesFolders/PhotoFile4Wildfire",
-        os.path.join(output_folder, "coordinates.csv"),
-        "CSV_FilesFolders/InvalidPhotoName"
+    build_website_dataset(
+        args.input_folder,
+        args.photo_folder,
+        args.output_file,
+        args.placeholder,
+        tolerance=args.tolerance,
+        chunksize=args.chunksize,
+        shard_dir=args.shard_dir,
+        shard_by=tuple(args.shard_by),
+        geojson=args.geojson,
+        debug_dir=os.path.dirname(args.output_file) if args.debug else None,
+        invalid_folder=args.invalid_folder,
     )
 
 